@@ -0,0 +1,309 @@
+#! python3
+# coding=utf-8
+
+# bench-fuzz.py
+# copyright 2019 Brian Fitzgerald
+
+# Look for command lines whose parse time grows faster than their length.
+# Realistic command lines are short, so they don't show how a parser copes with
+# thousands of bundled short options, --opt=value words, abbreviated options,
+# values that look like negative numbers or runs of '--'. search makes command
+# lines of such shapes out of each command's options in the spec, as a few
+# words repeated (or a few characters repeated within one word) k times, and
+# times every generated parser on them for k doubling. The slope of log time
+# against log k is the growth exponent: about 1 for a parse that is linear in
+# its input, 2 for a quadratic one. A shape whose exponent is over the
+# threshold is minimized, by dropping words or characters from what is
+# repeated for as long as the exponent stays over, and saved as a regression
+# case. check times the saved cases again and fails if any grows faster than
+# when it was saved.
+#
+#    $ bench-fuzz.py search
+#    $ bench-fuzz.py search --backend getopt --command commit --threshold 1.3
+#    $ bench-fuzz.py check
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from benchmark import backendGenerators, defaultspec, generateParser, here, loadModule
+from genlib import compileArgument, readspecs
+
+# Every generated parser: the backends, and the filter and incremental parser
+fuzzTargets = backendGenerators + [
+    ("policy", "gen-policy.py", "argpolicy.py"),
+    ("incremental", "gen-incremental.py", "argincremental.py"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Find and keep command lines that generated parsers parse in super-linear time")
+    parser.add_argument("--spec", default=defaultspec, help="spec file to generate parsers from")
+    parser.add_argument("--cases", default=os.path.join(here, "fuzz-cases.json"), help="file the regression cases are kept in")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    sub = commands.add_parser("search", help="time every shape on every parser, and save the ones that grow too fast")
+    sub.add_argument("--backend", action="append", choices=[name for name, generator, output in fuzzTargets],
+                     help="parser to search (repeatable, default all)")
+    sub.add_argument("--command", dest="commands", action="append",
+                     help="command to make shapes from (repeatable, default the three with the most options)")
+    sub.add_argument("--threshold", type=float, default=1.5, help="growth exponent over which a shape is kept")
+    sub.add_argument("--start", type=int, default=128, help="smallest number of repeats")
+    sub.add_argument("--steps", type=int, default=6, help="number of sizes, each twice the one before")
+    sub.add_argument("--repeat", type=int, default=3, help="parses per size, the fastest counting")
+    sub.add_argument("--budget", type=float, default=0.5, help="seconds a parse may take before larger sizes are skipped")
+    sub.set_defaults(run=search)
+
+    sub = commands.add_parser("check", help="time the saved cases again")
+    sub.add_argument("--margin", type=float, default=0.25, help="growth exponent over the saved one that counts as a regression")
+    sub.add_argument("--repeat", type=int, default=3, help="parses per size, the fastest counting")
+    sub.set_defaults(run=check)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        sys.exit(args.run(args, workdir))
+
+# -----------------------------------------------------------------------------------------------
+
+# Generate a parser and return a function that parses argv with it the way a
+# program would: with the parser built once, or for the incremental parser, as
+# a command line of text
+def loadTarget(workdir, specfile, backend):
+    for name, generator, output in fuzzTargets:
+        if name == backend:
+            module = loadModule(generateParser(workdir, specfile, generator=generator, output=output))
+            if name == "policy":
+                return module.scan
+            if name == "incremental":
+                return lambda argv: module.parse(" ".join(argv))
+            built = module.create_parser()
+            return lambda argv: module.parse_args(argv, built)
+    raise Exception("no parser called %s" % backend)
+
+# The command line of a case at size k: the head, then the unit repeated k
+# times, either as words or, in "concat" mode, as characters added to the
+# last word of the head
+def caseArgv(case, k):
+    head = case["head"]
+    if case["mode"] == "concat":
+        return [case["command"]] + head[:-1] + [head[-1] + "".join(case["unit"]) * k]
+    return [case["command"]] + head + case["unit"] * k
+
+# Fastest of several parses of argv, in seconds. Errors and help are part of
+# what is timed; what they write is thrown away.
+def timeParse(parse, argv, repeat):
+    sink = io.StringIO()
+    best = None
+    with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink):
+        for i in range(repeat):
+            start = time.perf_counter()
+            try:
+                parse(argv)
+            except SystemExit:
+                pass
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+            sink.seek(0)
+            sink.truncate()
+    return best
+
+# Time a case at each size until a parse takes longer than the budget, and
+# return ([(k, seconds)], growth exponent). The exponent is the least-squares
+# slope of log seconds against log k over the three largest sizes, where
+# fixed costs like printing usage matter least; None if fewer were timed.
+def growth(parse, case, sizes, repeat, budget=None):
+    points = []
+    for k in sizes:
+        points.append((k, timeParse(parse, caseArgv(case, k), repeat)))
+        if budget is not None and points[-1][1] > budget:
+            break
+    if len(points) < 3:
+        return points, None
+    xs = [math.log(k) for k, seconds in points[-3:]]
+    ys = [math.log(max(seconds, 1e-9)) for k, seconds in points[-3:]]
+    mx = sum(xs) / len(xs)
+    my = sum(ys) / len(ys)
+    slope = sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sum((x - mx) ** 2 for x in xs)
+    return points, slope
+
+# -----------------------------------------------------------------------------------------------
+
+# The shapes of command line to try for a command, as (family, mode, head,
+# unit), made from its options with the same exclusions as the generators
+def shapes(spec):
+    (cmdid, cmdname, usage, opts) = spec
+    flags = []
+    valued = []
+    for opt in opts:
+        if opt[0] != "option":
+            continue
+        (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
+        if numopt or shortname == "h" and len(longname) == 0:
+            continue
+        if shortname == "h":
+            shortname = ""
+        if argtype == "bool":
+            flags.append((shortname, longname))
+        else:
+            check = compileArgument(argument) if argtype == "string" else None
+            valued.append((shortname, longname, argtype, check))
+
+    found = []
+    letters = [short for short, long in flags if short]
+    if letters:
+        found.append(("bundles", "repeat", [], ["-" + "".join(letters)]))
+        found.append(("bundle", "concat", ["-"], letters))
+    longs = [long for short, long, argtype, check in valued] + [long for short, long in flags] + ["help"]
+    flaglongs = [long for short, long in flags if long][:4]
+    if flaglongs:
+        found.append(("flags", "repeat", [], ["--" + long for long in flaglongs]))
+        found.append(("prefixes", "repeat", [], ["--" + uniquePrefix(long, longs) for long in flaglongs]))
+    equals = []
+    for short, long, argtype, check in valued:
+        if argtype == "int":
+            if long:
+                equals.append("--%s=1" % long)
+            found.append(("negative", "repeat", [], ["-" + short if short else "--" + long, "-1"]))
+        elif check is None or check[0] == "choices":
+            if long:
+                equals.append("--%s=%s" % (long, check[1][0] if check else "value"))
+        elif long:
+            found.append(("value", "concat", ["--%s=" % long], ["a"]))
+    if equals:
+        found.append(("equals", "repeat", [], equals[:4]))
+    found.append(("numbers", "repeat", [], ["-1"]))
+    found.append(("dashes", "repeat", [], ["--"]))
+    found.append(("unknown", "concat", ["--"], ["x"]))
+
+    # One of each family is enough
+    families = set()
+    shapes = []
+    for shape in found:
+        if shape[0] not in families:
+            families.add(shape[0])
+            shapes.append(shape)
+    return shapes
+
+# The shortest abbreviation of a long option that no other one starts with
+def uniquePrefix(long, longs):
+    for end in range(1, len(long)):
+        if not any(other != long and other.startswith(long[:end]) for other in longs):
+            return long[:end]
+    return long
+
+# Drop words or characters from a case's unit, one at a time, while the growth
+# exponent stays over the threshold. Returns the smallest case, with its
+# sizes, times and exponent as last measured.
+def minimize(parse, case, points, exponent, sizes, repeat, budget, threshold):
+    i = 0
+    while i < len(case["unit"]) and len(case["unit"]) > 1:
+        smaller = dict(case, unit=case["unit"][:i] + case["unit"][i + 1:])
+        found, slope = growth(parse, smaller, sizes, repeat, budget)
+        if slope is not None and slope > threshold:
+            case, points, exponent = smaller, found, slope
+        else:
+            i += 1
+    return dict(case, sizes=[k for k, seconds in points], seconds=[seconds for k, seconds in points],
+                exponent=exponent, python=platform.python_version())
+
+# A parser keeps one case per family of shape
+def caseKey(case):
+    return (case["backend"], case["family"])
+
+def caseName(case, width=52):
+    text = " ".join(caseArgv(case, 2))
+    room = width - len(case["backend"]) - len(case["family"]) - 4
+    if len(text) > room:
+        text = text[:room - 3] + "..."
+    return "%s %s (%s)" % (case["backend"], text, case["family"])
+
+def readCases(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, "rt", encoding='utf-8') as f:
+        return json.load(f)["cases"]
+
+def writeCases(path, cases):
+    with open(path, "wt", encoding='utf-8') as f:
+        json.dump({"cases": sorted(cases, key=caseKey)}, f, indent=1)
+        f.write("\n")
+
+# -----------------------------------------------------------------------------------------------
+
+def search(args, workdir):
+    specs = readspecs(args.spec)
+    if args.commands:
+        specs = [spec for spec in specs if spec[0] in args.commands]
+    else:
+        specs = sorted(specs, key=lambda spec: -sum(1 for opt in spec[3] if opt[0] == "option"))[:3]
+    sizes = [args.start << step for step in range(args.steps)]
+
+    # The fastest growing shape of each family, over the threshold
+    worst = {}
+    parsers = {}
+    print("%-12s %-12s %-10s %9s %16s" % ("backend", "command", "family", "exponent", "largest"))
+    for name, generator, output in fuzzTargets:
+        if args.backend and name not in args.backend:
+            continue
+        parse = parsers[name] = loadTarget(workdir, args.spec, name)
+        for spec in specs:
+            for family, mode, head, unit in shapes(spec):
+                case = {"backend": name, "family": family, "command": spec[0], "mode": mode, "head": head, "unit": unit}
+                points, exponent = growth(parse, case, sizes, args.repeat, args.budget)
+                flag = ""
+                if exponent is not None and exponent > args.threshold:
+                    flag = "over"
+                    if caseKey(case) not in worst or exponent > worst[caseKey(case)][2]:
+                        worst[caseKey(case)] = (case, points, exponent)
+                print("%-12s %-12s %-10s %9s %7d %5.0f ms %s" % (
+                    name, spec[0], family, "-" if exponent is None else "%.2f" % exponent,
+                    points[-1][0], points[-1][1] * 1e3, flag))
+
+    print()
+    kept = []
+    for case, points, exponent in worst.values():
+        case = minimize(parsers[case["backend"]], case, points, exponent, sizes, args.repeat, args.budget, args.threshold)
+        kept.append(case)
+        print("kept %-52s %.2f" % (caseName(case), case["exponent"]))
+
+    # A case found again replaces the one saved before
+    cases = {caseKey(case): case for case in readCases(args.cases)}
+    cases.update((caseKey(case), case) for case in kept)
+    writeCases(args.cases, list(cases.values()))
+    print("%d super-linear cases found, %d saved in %s" % (len(kept), len(cases), args.cases))
+    return 0
+
+# Time every saved case at the sizes it was saved with. Returns 1 if any now
+# grows faster than it did by more than the margin.
+def check(args, workdir):
+    cases = readCases(args.cases)
+    parsers = {}
+    regressed = 0
+    print("%-52s %9s %9s %10s %10s" % ("case", "saved", "now", "saved ms", "now ms"))
+    for case in cases:
+        if case["backend"] not in parsers:
+            parsers[case["backend"]] = loadTarget(workdir, args.spec, case["backend"])
+        points, exponent = growth(parsers[case["backend"]], case, case["sizes"], args.repeat)
+        flag = ""
+        if exponent is not None and exponent > case["exponent"] + args.margin:
+            flag = "regressed"
+            regressed += 1
+        print("%-52s %9.2f %9s %10.1f %10.1f %s" % (
+            caseName(case), case["exponent"], "-" if exponent is None else "%.2f" % exponent,
+            case["seconds"][-1] * 1e3, points[-1][1] * 1e3, flag))
+    print("%d of %d cases regressed" % (regressed, len(cases)))
+    return 1 if regressed else 0
+
+# -----------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#! python3
+# coding=utf-8
+
+# bench-runner.py
+# copyright 2019 Brian Fitzgerald
+
+# Out-of-process benchmarks: every generated parser is started as a process,
+# for a matrix of interpreters, backends and command lines, the way a user
+# starts it. The runner pins itself, and so the processes it starts, to the
+# isolated CPUs (or the last CPU it may use), runs the cases round-robin in a
+# shuffled order each round so that drift in the machine is spread over all of
+# them, and drops each case's leading runs while they are still slower than its
+# steady state. Wall time is reported as mean, median and p99 with 95%
+# confidence intervals, along with user and system time and maximum RSS.
+#
+#    $ bench-runner.py
+#    $ bench-runner.py --all-pythons --backend argparse --backend getopt --runs 50
+#    $ bench-runner.py --argv "" --argv "commit -a -m message" --json results.json
+
+import argparse
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from benchmark import backendGenerators, bootstrap, defaultspec, fileHash, generateParser, mean, percentile, processEnv
+
+# Command lines run when no --argv is given
+defaultArgv = ["", "add --dry-run -v", "grep -i -n -e pattern"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Time generated parsers as processes, over interpreters, backends and command lines")
+    parser.add_argument("--spec", default=defaultspec, help="spec file to generate parsers from")
+    parser.add_argument("--backend", action="append", choices=[name for name, generator, output in backendGenerators],
+                        help="backend to run (repeatable, default all)")
+    parser.add_argument("--python", action="append", help="interpreter to run the parsers with (repeatable, default this one)")
+    parser.add_argument("--all-pythons", dest="allpythons", action="store_true",
+                        help="run with every python3.N found on PATH or installed by pyenv")
+    parser.add_argument("--argv", action="append", help="command line to parse, as shell words (repeatable)")
+    parser.add_argument("--runs", type=int, default=30, help="measured runs per case")
+    parser.add_argument("--warmup", type=int, default=5, help="most leading runs per case that may be dropped as warmup")
+    parser.add_argument("--cpus", help="CPUs to pin to, like 2,3 or 2-3 (default the isolated CPUs)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the run order and the bootstrap")
+    parser.add_argument("--json", help="also write every run to this file")
+    args = parser.parse_args()
+
+    cpus = pinCpus(args.cpus)
+    pythons = findPythons(args.python or [], args.allpythons)
+    backends = [entry for entry in backendGenerators if not args.backend or entry[0] in args.backend]
+    argvs = [shlex.split(argv) for argv in (args.argv or defaultArgv)]
+    print("pinned to CPU %s; %s" % (formatCpus(cpus), ", ".join(version for path, version in pythons)), file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        modules = {}
+        for name, generator, output in backends:
+            generateParser(workdir, args.spec, generator=generator, output=output)
+            modules[name] = os.path.splitext(output)[0]
+        cases = [{"python": path, "version": version, "backend": name, "argv": argv}
+                 for path, version in pythons for name, generator, output in backends for argv in argvs]
+        timeCases(cases, workdir, modules, args.runs + args.warmup, random.Random(args.seed))
+
+    rnd = random.Random(args.seed)
+    for case in cases:
+        case["warmup"] = warmupRuns([run[0] for run in case["runs"]], args.warmup)
+        case["runs"] = case["runs"][case["warmup"]:]
+    report(cases, rnd)
+
+    if args.json:
+        with open(args.json, "wt", encoding='utf-8') as f:
+            json.dump({"spec": os.path.abspath(args.spec), "spechash": fileHash(args.spec), "cpus": sorted(cpus),
+                       "cases": cases}, f, indent=1)
+
+# -----------------------------------------------------------------------------------------------
+
+# Pin this process to the given CPUs, or the isolated ones, or failing that
+# the last CPU it may use, and return the set. Processes started from here
+# inherit it.
+def pinCpus(spec):
+    if not hasattr(os, "sched_setaffinity"):
+        print("no sched_setaffinity here, runs are not pinned", file=sys.stderr)
+        return set()
+    if spec is None:
+        try:
+            with open("/sys/devices/system/cpu/isolated", "rt") as f:
+                spec = f.read().strip()
+        except OSError:
+            spec = ""
+    cpus = parseCpus(spec) & os.sched_getaffinity(0)
+    if not cpus:
+        cpus = {max(os.sched_getaffinity(0))}
+    os.sched_setaffinity(0, cpus)
+    return cpus
+
+# Parse a kernel CPU list like "1,4-7"
+def parseCpus(spec):
+    cpus = set()
+    for part in spec.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+def formatCpus(cpus):
+    return ",".join(str(cpu) for cpu in sorted(cpus)) or "-"
+
+# The interpreters to run, as (path, version). Each candidate is asked for its
+# own sys.executable, so that shims and links to the same interpreter count
+# once. Besides PATH, pyenv's installed versions are searched; candidates
+# that don't run (like an inactive pyenv shim) are left out.
+def findPythons(paths, everything):
+    candidates = [(path, True) for path in paths or [sys.executable]]
+    if everything:
+        pyenv = os.path.join(os.environ.get("PYENV_ROOT", os.path.expanduser("~/.pyenv")), "versions")
+        directories = os.environ.get("PATH", "").split(os.pathsep)
+        if os.path.isdir(pyenv):
+            directories += [os.path.join(pyenv, version, "bin") for version in sorted(os.listdir(pyenv))]
+        for directory in directories:
+            for minor in range(5, 30):
+                candidate = os.path.join(directory, "python3.%d" % minor)
+                if os.access(candidate, os.X_OK):
+                    candidates.append((candidate, False))
+    pythons = {}
+    for candidate, given in candidates:
+        result = subprocess.run([candidate, "-c", "import sys, platform; print(sys.executable); print(platform.python_version())"],
+                                stdout=subprocess.PIPE, stderr=None if given else subprocess.DEVNULL, universal_newlines=True)
+        if result.returncode != 0:
+            if given:
+                raise Exception("%s doesn't run" % candidate)
+            continue
+        out = result.stdout.split("\n")
+        pythons.setdefault(os.path.realpath(out[0]), out[1])
+    return sorted(pythons.items(), key=lambda item: [int(x) for x in item[1].split(".")[:2]])
+
+# Run every case the given number of times, one run of each per round in a
+# fresh random order, appending (wall, user, sys, max RSS) to case["runs"]
+def timeCases(cases, workdir, modules, rounds, rnd):
+    env = processEnv()
+    for case in cases:
+        script = processScript.format(module=modules[case["backend"]])
+        case["cmd"] = [case["python"], "-c", script] + case["argv"]
+        case["runs"] = []
+    for i in range(rounds):
+        print("round %d of %d" % (i + 1, rounds), end="\r", file=sys.stderr)
+        for case in rnd.sample(cases, len(cases)):
+            case["runs"].append(timeProcess(case["cmd"], workdir, env))
+    print(file=sys.stderr)
+    for case in cases:
+        del case["cmd"]
+
+# Run a generated parser, imported so that it loads from its .pyc, and write
+# its peak RSS to stderr on the way out. The rusage of a child counts the
+# memory of the process it was forked from, so the child's own high-water
+# mark is taken from /proc where there is one.
+processScript = """
+try:
+    import {module}
+    {module}.main()
+finally:
+    import sys
+    try:
+        with open('/proc/self/status') as f:
+            sys.stderr.write(''.join(line for line in f if line.startswith('VmHWM:')))
+    except OSError:
+        pass
+"""
+
+# Start one process and wait for it with wait4, for its resource usage.
+# Returns (wall seconds, user seconds, system seconds, max RSS in KB).
+def timeProcess(cmd, workdir, env):
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    pid, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    err = process.stderr.read().decode("utf-8", "replace")
+    process.stderr.close()
+    if process.returncode != 0:
+        raise Exception("%s exited with %d\n%s" % (" ".join(cmd), process.returncode, err))
+    maxrss = usage.ru_maxrss
+    for line in err.splitlines():
+        if line.startswith("VmHWM:"):
+            maxrss = int(line.split()[1])
+    return (wall, usage.ru_utime, usage.ru_stime, maxrss)
+
+# -----------------------------------------------------------------------------------------------
+
+# The number of leading runs to drop as warmup: runs are dropped from the front
+# while they are slower than the steady state, the second half of the series,
+# by more than three median absolute deviations (and at least 2%).
+def warmupRuns(times, limit):
+    tail = sorted(times[len(times) // 2:])
+    median = percentile(tail, 50)
+    mad = percentile(sorted(abs(t - median) for t in tail), 50)
+    bound = median + max(3 * mad, 0.02 * median)
+    dropped = 0
+    while dropped < min(limit, len(times) - 2) and times[dropped] > bound:
+        dropped += 1
+    return dropped
+
+# Summary statistics of a case's wall times, in seconds:
+# {name: (value, low, high)} for mean, median and p99
+def summarize(times, rnd):
+    times = sorted(times)
+    stats = {}
+    for name, statistic in (("mean", mean), ("median", lambda v: percentile(v, 50)), ("p99", lambda v: percentile(v, 99))):
+        stats[name] = (statistic(times),) + bootstrap(times, statistic, rnd)
+    return stats
+
+def report(cases, rnd):
+    print("%-8s %-9s %-24s %5s %20s %20s %20s %8s %8s %9s" % (
+        "python", "backend", "argv", "runs", "mean ms", "median ms", "p99 ms", "user ms", "sys ms", "max RSS"))
+    for case in cases:
+        runs = case["runs"]
+        stats = summarize([run[0] for run in runs], rnd)
+        argv = " ".join(case["argv"]) or "(none)"
+        if len(argv) > 24:
+            argv = argv[:21] + "..."
+        line = "%-8s %-9s %-24s %2d+%-2d" % (case["version"], case["backend"], argv, len(runs), case["warmup"])
+        for name in ("mean", "median", "p99"):
+            line += " %6.2f [%5.2f,%6.2f]" % tuple(value * 1e3 for value in stats[name])
+        line += " %8.2f %8.2f %6.1f MB" % (mean([run[1] for run in runs]) * 1e3, mean([run[2] for run in runs]) * 1e3,
+                                           max(run[3] for run in runs) / 1024.0)
+        print(line)
+
+# -----------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()
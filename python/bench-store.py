@@ -0,0 +1,286 @@
+#! python3
+# coding=utf-8
+
+# bench-store.py
+# copyright 2019 Brian Fitzgerald
+
+# Keep bench-runner.py results in a SQLite file, so that generator changes can
+# be checked against earlier runs. Every recorded run belongs to a case, keyed
+# by commit, backend, spec hash, interpreter, machine fingerprint and argv.
+# compare tests two commits case by case: a Mann-Whitney U test says whether
+# the wall times differ, a bootstrap gives an interval for the ratio of the
+# medians, and significant slowdowns beyond a threshold are flagged as
+# regressions (with exit status 1). export writes the latest results as a
+# Markdown table, or the median of every commit as CSV trend data.
+#
+#    $ bench-runner.py --json results.json && bench-store.py record results.json
+#    $ bench-store.py compare
+#    $ bench-store.py compare --base 1a2b3c4 --head HEAD --threshold 5
+#    $ bench-store.py export --trend > trend.csv
+
+import argparse
+import csv
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from benchmark import bootstrap, here, percentile
+
+schema = """
+create table if not exists sessions (
+    id integer primary key,
+    recorded real,
+    commitid text,
+    spechash text,
+    machine text,
+    description text,
+    cpus text
+);
+create table if not exists cases (
+    id integer primary key,
+    session integer references sessions(id),
+    backend text,
+    interpreter text,
+    version text,
+    argv text,
+    warmup integer
+);
+create table if not exists runs (
+    caseid integer references cases(id),
+    wall real,
+    user real,
+    sys real,
+    maxrss integer
+);
+create index if not exists cases_session on cases(session);
+create index if not exists runs_case on runs(caseid);
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description="Record, compare and export bench-runner.py results")
+    parser.add_argument("--db", default="bench-results.db", help="SQLite file to keep results in")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    sub = commands.add_parser("record", help="store the runs of a bench-runner.py --json file")
+    sub.add_argument("results", help="file written by bench-runner.py --json")
+    sub.add_argument("--commit", help="commit to record the runs under (default HEAD, marked +dirty if the tree has changes)")
+    sub.set_defaults(run=record)
+
+    sub = commands.add_parser("compare", help="test every case of one commit against another")
+    sub.add_argument("--base", help="commit to compare against (default the one recorded before --head)")
+    sub.add_argument("--head", help="commit to check (default the latest recorded)")
+    sub.add_argument("--alpha", type=float, default=0.01, help="significance level of the Mann-Whitney test")
+    sub.add_argument("--threshold", type=float, default=2.0, help="smallest slowdown in %% that counts as a regression")
+    sub.add_argument("--seed", type=int, default=0, help="seed for the bootstrap")
+    sub.set_defaults(run=compare)
+
+    sub = commands.add_parser("export", help="write results as a Markdown table, or trend data as CSV")
+    sub.add_argument("--commit", help="commit to export (default the latest recorded)")
+    sub.add_argument("--trend", action="store_true", help="write the median of every case at every commit as CSV")
+    sub.set_defaults(run=export)
+
+    args = parser.parse_args()
+    db = sqlite3.connect(args.db)
+    try:
+        db.executescript(schema)
+        sys.exit(args.run(args, db))
+    finally:
+        db.close()
+
+# -----------------------------------------------------------------------------------------------
+
+# The commit the working tree is at, with +dirty if it has uncommitted changes
+def currentCommit():
+    def git(*args):
+        return subprocess.run(["git"] + list(args), cwd=here, check=True, stdout=subprocess.PIPE,
+                              universal_newlines=True).stdout.strip()
+    commit = git("rev-parse", "--short=12", "HEAD")
+    if git("status", "--porcelain", "--untracked-files=no"):
+        commit += "+dirty"
+    return commit
+
+# A fingerprint of the hardware and OS, and the description it was made from.
+# The host name is left out, so that identical machines share results.
+def machineFingerprint():
+    cpu = platform.processor()
+    memory = ""
+    try:
+        with open("/proc/cpuinfo", "rt") as f:
+            cpu = next((line.split(":", 1)[1].strip() for line in f if line.startswith("model name")), cpu)
+        with open("/proc/meminfo", "rt") as f:
+            memory = next((line.split(":", 1)[1].strip() for line in f if line.startswith("MemTotal")), "")
+    except OSError:
+        pass
+    description = "%s %s, %s, %d CPUs, %s" % (platform.system(), platform.machine(), cpu, os.cpu_count(), memory)
+    return hashlib.sha256(description.encode("utf-8")).hexdigest()[:12], description
+
+# Resolve a commit given on the command line to one that was recorded: either
+# exactly, or by the commit git resolves it to, taken clean or +dirty
+def resolveCommit(db, commit):
+    recorded = [row[0] for row in db.execute("select distinct commitid from sessions")]
+    if commit in recorded:
+        return commit
+    try:
+        full = subprocess.run(["git", "rev-parse", "--short=12", commit], cwd=here, check=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except subprocess.CalledProcessError:
+        full = commit
+    matches = [c for c in recorded if c == full] or [c for c in recorded if c.split("+")[0] == full or c.startswith(commit)]
+    if not matches:
+        raise SystemExit("no results recorded for %s" % commit)
+    return matches[0]
+
+# Recorded commits, oldest first, by when their latest results were recorded
+def recordedCommits(db):
+    return [row[0] for row in db.execute("select commitid from sessions group by commitid order by max(recorded)")]
+
+# {key: wall times} of the latest session of each case at a commit, where a
+# key is (backend, spec hash, interpreter, version, machine, argv)
+def caseTimes(db, commit):
+    times = {}
+    rows = db.execute("""select c.id, c.backend, s.spechash, c.interpreter, c.version, s.machine, c.argv
+                         from cases c join sessions s on c.session = s.id
+                         where s.commitid = ? order by s.recorded""", (commit,))
+    for row in rows.fetchall():
+        times[row[1:]] = [wall for (wall,) in db.execute("select wall from runs where caseid = ?", (row[0],))]
+    return times
+
+def caseName(key):
+    (backend, spechash, interpreter, version, machine, argv) = key
+    return "%s %s %s" % (version, backend, " ".join(json.loads(argv)) or "(none)")
+
+# -----------------------------------------------------------------------------------------------
+
+def record(args, db):
+    with open(args.results, "rt", encoding='utf-8') as f:
+        results = json.load(f)
+    commit = args.commit or currentCommit()
+    machine, description = machineFingerprint()
+    with db:
+        session = db.execute("insert into sessions (recorded, commitid, spechash, machine, description, cpus) values (?, ?, ?, ?, ?, ?)",
+                             (time.time(), commit, results["spechash"], machine, description,
+                              ",".join(str(cpu) for cpu in results["cpus"]))).lastrowid
+        for case in results["cases"]:
+            caseid = db.execute("insert into cases (session, backend, interpreter, version, argv, warmup) values (?, ?, ?, ?, ?, ?)",
+                                (session, case["backend"], case["python"], case["version"], json.dumps(case["argv"]),
+                                 case["warmup"])).lastrowid
+            db.executemany("insert into runs (caseid, wall, user, sys, maxrss) values (?, ?, ?, ?, ?)",
+                           [(caseid,) + tuple(run) for run in case["runs"]])
+    print("recorded %d cases for %s on machine %s" % (len(results["cases"]), commit, machine))
+
+# Compare the cases two commits have in common. Returns 1 if any regressed.
+def compare(args, db):
+    commits = recordedCommits(db)
+    head = resolveCommit(db, args.head) if args.head else commits[-1] if commits else None
+    if head is None:
+        raise SystemExit("no results recorded")
+    if args.base:
+        base = resolveCommit(db, args.base)
+    else:
+        earlier = commits[:commits.index(head)]
+        if not earlier:
+            raise SystemExit("nothing recorded before %s to compare with" % head)
+        base = earlier[-1]
+
+    rnd = random.Random(args.seed)
+    basetimes = caseTimes(db, base)
+    headtimes = caseTimes(db, head)
+    regressions = 0
+    print("%s -> %s" % (base, head))
+    print("%-40s %10s %10s %8s %18s %9s" % ("case", "base ms", "head ms", "change", "95% CI", "p"))
+    for key in sorted(set(basetimes) & set(headtimes)):
+        a, b = sorted(basetimes[key]), sorted(headtimes[key])
+        ratio = percentile(b, 50) / percentile(a, 50)
+        low, high = bootstrapRatio(a, b, rnd)
+        p = mannWhitney(a, b)
+        verdict = ""
+        if p < args.alpha and ratio > 1 + args.threshold / 100.0:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif p < args.alpha and ratio < 1 - args.threshold / 100.0:
+            verdict = "improved"
+        print("%-40s %10.2f %10.2f %+7.1f%% [%+6.1f%%,%+6.1f%%] %9.2g %s" % (
+            caseName(key)[:40], percentile(a, 50) * 1e3, percentile(b, 50) * 1e3, (ratio - 1) * 100,
+            (low - 1) * 100, (high - 1) * 100, p, verdict))
+    unmatched = len(set(basetimes) ^ set(headtimes))
+    if unmatched:
+        print("%d cases were only recorded for one of the commits" % unmatched)
+    return 1 if regressions else 0
+
+# Two-sided p-value of the Mann-Whitney U test, by the normal approximation
+# with a correction for ties and for continuity
+def mannWhitney(a, b):
+    values = sorted([(x, 0) for x in a] + [(x, 1) for x in b])
+    ranks = [0.0] * len(values)
+    ties = 0.0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2.0 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    n1, n2 = len(a), len(b)
+    u = sum(rank for rank, (x, group) in zip(ranks, values) if group == 0) - n1 * (n1 + 1) / 2.0
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12.0 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = max(abs(u - n1 * n2 / 2.0) - 0.5, 0.0) / sigma
+    return math.erfc(z / math.sqrt(2))
+
+# 95% interval of the ratio of medians b / a, resampling both
+def bootstrapRatio(a, b, rnd, resamples=2000):
+    median = lambda values: percentile(values, 50)
+    estimates = []
+    for _ in range(resamples):
+        estimates.append(median(sorted(rnd.choice(b) for _ in b)) / median(sorted(rnd.choice(a) for _ in a)))
+    estimates.sort()
+    return percentile(estimates, 2.5), percentile(estimates, 97.5)
+
+def export(args, db):
+    if args.trend:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["commit", "recorded", "backend", "spec", "python", "machine", "argv", "median ms", "p99 ms", "runs"])
+        rows = db.execute("""select s.commitid, s.recorded, c.id, c.backend, s.spechash, c.version, s.machine, c.argv
+                             from cases c join sessions s on c.session = s.id order by s.recorded, c.id""")
+        for row in rows.fetchall():
+            times = sorted(wall for (wall,) in db.execute("select wall from runs where caseid = ?", (row[2],)))
+            writer.writerow([row[0], time.strftime("%Y-%m-%d %H:%M", time.localtime(row[1]))] + list(row[3:7]) +
+                            [" ".join(json.loads(row[7])), "%.3f" % (percentile(times, 50) * 1e3),
+                             "%.3f" % (percentile(times, 99) * 1e3), len(times)])
+        return 0
+
+    commits = recordedCommits(db)
+    commit = resolveCommit(db, args.commit) if args.commit else commits[-1] if commits else None
+    if commit is None:
+        raise SystemExit("no results recorded")
+    print("Results for %s\n" % commit)
+    print("| python | backend | argv | median ms | 95% CI | p99 ms | runs |")
+    print("|---|---|---|---:|---:|---:|---:|")
+    rnd = random.Random(0)
+    for key, times in sorted(caseTimes(db, commit).items()):
+        (backend, spechash, interpreter, version, machine, argv) = key
+        times = sorted(times)
+        low, high = bootstrap(times, lambda values: percentile(values, 50), rnd)
+        print("| %s | %s | `%s` | %.2f | %.2f-%.2f | %.2f | %d |" % (
+            version, backend, " ".join(json.loads(argv)) or "(none)", percentile(times, 50) * 1e3,
+            low * 1e3, high * 1e3, percentile(times, 99) * 1e3, len(times)))
+    return 0
+
+# -----------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()
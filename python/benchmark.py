@@ -0,0 +1,1103 @@
+#! python3
+# coding=utf-8
+
+# benchmark.py
+# copyright 2019 Brian Fitzgerald
+
+# In-process benchmarks for generated parsers. Each benchmark is a subcommand;
+# the parser under test is generated from a spec into a scratch directory and
+# imported from there, so nothing in the current directory is touched.
+#
+#    $ benchmark.py argsfile --lines 1000000     # streamed @file arguments against fromfile_prefix_chars
+#    $ benchmark.py alloc                        # per-parse memory, Namespace against slotted results
+#    $ benchmark.py validate                     # cost of checking values against spec patterns
+#    $ benchmark.py share                        # build time and memory with shared options
+#    $ benchmark.py daemon                       # invocations through the parse daemon against cold starts
+#    $ benchmark.py batch                        # a command log parsed in batch, with and without memoization
+#    $ benchmark.py threads                      # one CompiledParser shared by 1 to N threads
+#    $ benchmark.py sparse                       # eager against lazy and sparse subparsers
+#    $ benchmark.py errors                       # error-path latency, with and without fast errors
+#    $ benchmark.py backends                     # argparse, optparse and getopt generators
+#    $ benchmark.py packaging                    # cold-start latency of each packaging mode
+#    $ benchmark.py imports --mode frozen        # every module and byte a packaged parser loads
+#    $ benchmark.py profile --hot-share 0.9      # profile-guided builds against eager and lazy ones
+#    $ benchmark.py policy                       # option policy checks against parse_args
+#    $ benchmark.py route                        # finding the command with the router against main()
+#    $ benchmark.py incremental --command grep   # per-keystroke parses, incremental against full
+#    $ benchmark.py gc                           # builds and exits with --gc-tune and --fast-exit
+#    $ benchmark.py coldstart --backend getopt   # starts with the parser evicted from the page cache
+
+import argparse
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import zipfile
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from genlib import hotCommands, packageCommand, packageModes, packagePath, readProfile, readspecs
+
+here = os.path.dirname(os.path.abspath(__file__))
+defaultspec = os.path.join(here, "..", "spec", "git-command-specs.txt")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for generated parsers")
+    parser.add_argument("--spec", default=defaultspec, help="spec file to generate parsers from")
+    benchmarks = parser.add_subparsers(dest="benchmark")
+    benchmarks.required = True
+
+    sub = benchmarks.add_parser("argsfile", help="streamed @file arguments against fromfile_prefix_chars")
+    sub.add_argument("--lines", type=int, default=200000, help="number of paths in the argument file")
+    sub.set_defaults(run=benchArgsfile)
+
+    sub = benchmarks.add_parser("alloc", help="per-parse memory and latency, Namespace against slotted results")
+    sub.add_argument("--parses", type=int, default=20000, help="number of command lines parsed per batch")
+    sub.set_defaults(run=benchAlloc)
+
+    sub = benchmarks.add_parser("validate", help="cost of checking option values against their spec patterns")
+    sub.add_argument("--parses", type=int, default=20000, help="number of parses per case")
+    sub.set_defaults(run=benchValidate)
+
+    sub = benchmarks.add_parser("share", help="build time and memory with options shared across commands")
+    sub.set_defaults(run=benchShare)
+
+    sub = benchmarks.add_parser("daemon", help="per-invocation cost through the parse daemon against cold starts")
+    sub.add_argument("--runs", type=int, default=20, help="number of process starts per case")
+    sub.add_argument("--clients", type=int, default=8, help="number of concurrent in-process clients")
+    sub.set_defaults(run=benchDaemon)
+
+    sub = benchmarks.add_parser("batch", help="batch parsing of a command log, with and without memoization")
+    sub.add_argument("--lines", type=int, default=100000, help="number of command lines in the log")
+    sub.add_argument("--distinct", type=float, default=0.05, help="fraction of lines made unique")
+    sub.add_argument("--jobs", type=int, default=4, help="worker processes for the pooled run")
+    sub.set_defaults(run=benchBatch)
+
+    sub = benchmarks.add_parser("threads", help="parse throughput of one shared CompiledParser at 1 to N threads")
+    sub.add_argument("--threads", type=int, default=8, help="largest number of threads")
+    sub.add_argument("--parses", type=int, default=5000, help="number of parses per thread")
+    sub.set_defaults(run=benchThreads)
+
+    sub = benchmarks.add_parser("sparse", help="build and parse cost per invocation, eager against lazy and sparse")
+    sub.add_argument("--runs", type=int, default=20, help="number of process starts per case")
+    sub.set_defaults(run=benchSparse)
+
+    sub = benchmarks.add_parser("errors", help="error-path latency against success-path latency, with fast errors")
+    sub.add_argument("--parses", type=int, default=2000, help="number of parses per case")
+    sub.set_defaults(run=benchErrors)
+
+    sub = benchmarks.add_parser("backends", help="startup and parse cost of the argparse, optparse and getopt generators")
+    sub.add_argument("--runs", type=int, default=20, help="number of process starts per case")
+    sub.set_defaults(run=benchBackends)
+
+    sub = benchmarks.add_parser("packaging", help="cold-start latency of each way of deploying a parser")
+    sub.add_argument("--backend", default="argparse", choices=[name for name, generator, output in backendGenerators],
+                     help="generator to package")
+    sub.add_argument("--runs", type=int, default=20, help="number of process starts per mode")
+    sub.set_defaults(run=benchPackaging)
+
+    sub = benchmarks.add_parser("imports", help="every module and byte a packaged parser loads at startup")
+    sub.add_argument("--backend", default="argparse", choices=[name for name, generator, output in backendGenerators],
+                     help="generator to package")
+    sub.add_argument("--mode", default="py", choices=packageModes, help="packaging mode to audit")
+    sub.set_defaults(run=benchImports)
+
+    sub = benchmarks.add_parser("profile", help="startup cost over a usage profile, profile-guided against eager and lazy")
+    sub.add_argument("--profile", help="usage profile to build from and replay (default a synthetic one)")
+    sub.add_argument("--hot-share", dest="hotshare", default="0.95", help="--hot-share for the profile-guided build")
+    sub.add_argument("--runs", type=int, default=10, help="number of process starts per command line and build")
+    sub.set_defaults(run=benchProfile)
+
+    sub = benchmarks.add_parser("policy", help="option policy checks with the spec-indexed filter against parse_args")
+    sub.add_argument("--parses", type=int, default=2000, help="number of checks per case")
+    sub.set_defaults(run=benchPolicy)
+
+    sub = benchmarks.add_parser("route", help="finding the command with the generated router against main()")
+    sub.add_argument("--parses", type=int, default=20000, help="number of routes per case")
+    sub.add_argument("--runs", type=int, default=20, help="number of process starts per case")
+    sub.set_defaults(run=benchRoute)
+
+    sub = benchmarks.add_parser("incremental", help="per-keystroke parses of a command line being typed, incremental against full")
+    sub.add_argument("--command", action="append", help="command whose options are typed (repeatable, default grep, commit and pull)")
+    sub.add_argument("--words", type=int, default=60, help="most words per typed command line")
+    sub.set_defaults(run=benchIncremental)
+
+    sub = benchmarks.add_parser("gc", help="garbage collection while building, and interpreter shutdown, with --gc-tune and --fast-exit")
+    sub.add_argument("--runs", type=int, default=20, help="number of process starts per build")
+    sub.set_defaults(run=benchGc)
+
+    sub = benchmarks.add_parser("coldstart", help="process starts with the parser's files evicted from the page cache")
+    sub.add_argument("--backend", action="append", choices=[name for name, generator, output in backendGenerators],
+                     help="generator to package (repeatable, default all)")
+    sub.add_argument("--runs", type=int, default=10, help="number of cold and of warm starts per mode")
+    sub.set_defaults(run=benchColdstart)
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        args.run(args, workdir)
+
+# Typical command lines, cycled through by the parse benchmarks
+sampleArgv = [
+    ["add", "--dry-run", "-v"],
+    ["commit", "-a", "-m", "message"],
+    ["grep", "-i", "-n", "-e", "pattern"],
+    ["fetch", "--all", "--prune"],
+    ["status", "-s", "-b"],
+    ["am", "-3", "--signoff"],
+]
+
+def sampleBatch(count):
+    return [sampleArgv[i % len(sampleArgv)] for i in range(count)]
+
+# A usage profile where five verbs make up nearly all invocations
+sampleProfile = """\
+5200 status
+1400 status -s -b
+4000 diff
+1500 log
+700 log --decorate short
+1500 commit -a -m message
+900 fetch --all --prune
+150 add --patch
+120 push --tags
+90 checkout -b topic
+40 grep -i -n -e pattern
+20 blame -l
+10 remote add -f --tags
+5 am -3 --signoff
+"""
+
+# -----------------------------------------------------------------------------------------------
+
+# Run a generator on a spec in workdir, and return the path of the generated file.
+def generateParser(workdir, specfile, generator="gen-argparse.py", output="argparser.py", options=()):
+    cmd = [sys.executable, os.path.join(here, generator), os.path.abspath(specfile), "-o", output] + list(options)
+    subprocess.run(cmd, cwd=workdir, check=True, stdout=subprocess.DEVNULL)
+    return os.path.join(workdir, output)
+
+# Import a generated parser from its path, under a name unique to that path.
+# It goes in sys.modules so that its functions can be pickled for a pool.
+def loadModule(path):
+    name = "bench_%x" % (hash(path) & 0xffffffff)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Environment for timing Python processes: bytecode writing is allowed, so
+# that after a first run every start imports from .pyc files as it would in use
+def processEnv(**extra):
+    env = dict(os.environ, **extra)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+# Time one call of fn, returning (seconds, result)
+def timeCall(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+# Fastest of several calls of fn, in seconds
+def bestTime(fn, repeat=5):
+    return min(timeCall(fn)[0] for _ in range(repeat))
+
+# Traced memory still held by what fn returns, in bytes, along with the result
+def retainedMemory(fn, *args):
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+# Peak traced memory of one call of fn, in bytes
+def peakMemory(fn, *args):
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+# Percentile of sorted values, interpolating between neighbours
+def percentile(values, q):
+    pos = (len(values) - 1) * q / 100.0
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+def mean(values):
+    return sum(values) / len(values)
+
+# 95% confidence interval of a statistic of values, by the percentile bootstrap
+def bootstrap(values, statistic, rnd, resamples=2000):
+    estimates = sorted(statistic(sorted(rnd.choice(values) for _ in values)) for _ in range(resamples))
+    return percentile(estimates, 2.5), percentile(estimates, 97.5)
+
+# Short content hash of a file, to tell specs apart in stored results
+def fileHash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def report(name, seconds, count, unit, peak=None):
+    line = "%-28s %10.1f ms %14.0f %s/s" % (name, seconds * 1000.0, count / seconds, unit)
+    if peak is not None:
+        line += " %10.2f MB peak" % (peak / (1024.0 * 1024.0))
+    print(line)
+
+# -----------------------------------------------------------------------------------------------
+
+# Hand a large path list to "add" through an @file, once with the generated
+# parser's streaming reader and once with argparse's fromfile_prefix_chars,
+# which reads the whole file into a list before parsing. Both parsers are
+# built before timing, so only reading the file and parsing are measured.
+def benchArgsfile(args, workdir):
+    module = loadModule(generateParser(workdir, args.spec, options=("--args-files",)))
+    built = module.create_parser()
+
+    argsfile = os.path.join(workdir, "paths.txt")
+    with open(argsfile, "wt", encoding='utf-8') as f:
+        print("--dry-run", file=f)
+        for i in range(args.lines):
+            print("src/module%d/subdir%d/file%d.c" % (i // 1000, i // 100, i), file=f)
+    print("%d paths, %.1f MB argument file" % (args.lines, os.path.getsize(argsfile) / (1024.0 * 1024.0)))
+
+    def streamed():
+        parsed = module.parse_args(["add", "@" + argsfile], built)
+        n = 0
+        for _ in parsed.streamed:
+            n += 1
+        return n
+
+    fromfile = argparse.ArgumentParser(fromfile_prefix_chars="@")
+    fromfile.add_argument("-n", "--dry-run", dest="dryRun", action="store_true")
+    fromfile.add_argument("paths", nargs="*")
+    def materialized():
+        return len(fromfile.parse_args(["@" + argsfile]).paths)
+
+    for name, fn in (("streamed @file", streamed), ("fromfile_prefix_chars", materialized)):
+        seconds, count = timeCall(fn)
+        if count != args.lines:
+            raise Exception("%s saw %d paths, expected %d" % (name, count, args.lines))
+        report(name, seconds, count, "lines", peakMemory(fn))
+
+# Parse a batch of command lines with one prebuilt parser, keeping every result,
+# and measure the time per parse and the memory each kept result holds on to.
+# Namespace results carry a default for every option of the command; slotted
+# results only carry the options that were given.
+def benchAlloc(args, workdir):
+    batch = sampleBatch(args.parses)
+    for name, output, options in (("Namespace", "argparser.py", ()),
+                                  ("slots", "argparser_slots.py", ("--slots",))):
+        module = loadModule(generateParser(workdir, args.spec, output=output, options=options))
+        parser = module.create_parser()
+        parse = module.parse_args
+
+        def parseBatch():
+            return [parse(argv, parser) for argv in batch]
+
+        seconds = bestTime(parseBatch)
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        results = parseBatch()
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        stats = after.compare_to(before, "filename")
+        size = sum(stat.size_diff for stat in stats)
+        blocks = sum(stat.count_diff for stat in stats)
+
+        print("%-12s %8.2f us/parse %10.0f parses/s %8.0f bytes/result %6.1f blocks/result" % (
+            name, seconds * 1e6 / len(batch), len(batch) / seconds, size / len(results), blocks / len(results)))
+
+# Time parses of command lines whose options have pattern arguments, with and
+# without validation, and the bare check itself: a frozenset lookup for finite
+# patterns, a precompiled fullmatch for open ones.
+def benchValidate(args, workdir):
+    cases = [
+        ("choices", ["add", "--chmod=+x"], 1),
+        ("regex", ["updateIndex", "--cacheinfo", "100644,abc123,path"], 1),
+        ("choices+regex", ["push", "--signed=yes", "--recurse-submodules=check", "--force-with-lease=main:abc"], 3),
+    ]
+    plain = loadModule(generateParser(workdir, args.spec, output="argparser_plain.py", options=("--no-validate",)))
+    checked = loadModule(generateParser(workdir, args.spec, output="argparser.py"))
+    plainParser = plain.create_parser()
+    checkedParser = checked.create_parser()
+
+    print("%-14s %12s %12s %16s" % ("case", "plain", "validated", "per option"))
+    for name, argv, count in cases:
+        times = []
+        for module, parser in ((plain, plainParser), (checked, checkedParser)):
+            module.parse_args(argv, parser)
+            seconds = bestTime(lambda: [module.parse_args(argv, parser) for _ in range(args.parses)])
+            times.append(seconds * 1e6 / args.parses)
+        print("%-14s %9.2f us %9.2f us %13.3f us" % (name, times[0], times[1], (times[1] - times[0]) / count))
+
+    choices = frozenset({"+x", "-x"})
+    pattern = checked.Pattern(r".+?,.+?,.+?", "<mode>,<object>,<path>")
+    pattern("100644,abc123,path") # compile
+    n = args.parses * 10
+    seconds = bestTime(lambda: [v in choices for v in ("+x",) * n])
+    print("%-14s %9.3f us" % ("frozenset in", seconds * 1e6 / n))
+    seconds = bestTime(lambda: [pattern(v) for v in ("100644,abc123,path",) * n])
+    print("%-14s %9.3f us" % ("fullmatch", seconds * 1e6 / n))
+
+# Build the whole parser with every option defined per command, and with the
+# options several commands define identically built once and shared.
+def benchShare(args, workdir):
+    print("%-10s %10s %10s %10s %10s" % ("", "code", "build", "memory", "actions"))
+    for name, output, options in (("plain", "argparser.py", ()),
+                                  ("shared", "argparser_shared.py", ("--share-options",))):
+        path = generateParser(workdir, args.spec, output=output, options=options)
+        module = loadModule(path)
+        seconds = bestTime(module.create_parser)
+        size, parser = retainedMemory(module.create_parser)
+        actions = set()
+        for subparser in parser._subparsers._group_actions[0].choices.values():
+            actions.update(subparser._actions)
+        print("%-10s %8.0f KB %7.1f ms %7.0f KB %10d" % (
+            name, os.path.getsize(path) / 1024.0, seconds * 1000.0, size / 1024.0, len(actions)))
+
+# Compare a cold start of the generated parser with the same command line sent
+# through the daemon client, and time bare request round trips on an open
+# socket, one client and several at once.
+def benchDaemon(args, workdir):
+    path = generateParser(workdir, args.spec, options=("--daemon",))
+    client = os.path.join(workdir, "argparser_client.py")
+    sockpath = os.path.join(workdir, "argparser.sock")
+    env = dict(os.environ, ARGPARSER_SOCKET=sockpath)
+    argv = ["add", "--dry-run", "-v"]
+
+    daemon = subprocess.Popen([sys.executable, path, "--serve", sockpath, "60"], env=env)
+    try:
+        while not os.path.exists(sockpath):
+            time.sleep(0.01)
+
+        for name, script in (("cold start", path), ("daemon client", client)):
+            def run():
+                subprocess.run([sys.executable, script] + argv, env=env, check=True, stdout=subprocess.DEVNULL)
+            run()
+            seconds = sum(timeCall(run)[0] for _ in range(args.runs)) / args.runs
+            print("%-28s %8.2f ms/invocation" % (name, seconds * 1000.0))
+
+        request = json.dumps({"argv": argv}).encode('utf-8') + b"\n"
+        def roundTrips(count):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(sockpath)
+            reader = sock.makefile("rb")
+            for _ in range(count):
+                sock.sendall(request)
+                json.loads(reader.readline())
+            sock.close()
+
+        count = 2000
+        seconds = bestTime(lambda: roundTrips(count))
+        print("%-28s %8.2f us/request" % ("round trip, 1 client", seconds * 1e6 / count))
+
+        def concurrent():
+            threads = [threading.Thread(target=roundTrips, args=(count,)) for _ in range(args.clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        seconds = bestTime(concurrent, repeat=3)
+        print("%-28s %8.2f us/request" % ("round trip, %d clients" % args.clients, seconds * 1e6 / (count * args.clients)))
+    finally:
+        daemon.terminate()
+        daemon.wait()
+
+# Parse a synthetic command log where most lines repeat one of the sample
+# command lines and a fraction are unique, first with a plain loop that parses
+# every line, then through parse_batch with its cache, then pooled.
+def benchBatch(args, workdir):
+    module = loadModule(generateParser(workdir, args.spec, options=("--batch",)))
+    rng = random.Random(1)
+    log = []
+    for i in range(args.lines):
+        if rng.random() < args.distinct:
+            log.append(["commit", "-m", "message %d" % i])
+        else:
+            log.append(rng.choice(sampleArgv))
+
+    module.batch_init()
+    seconds, _ = timeCall(lambda: [module.batch_parse(argv) for argv in log])
+    print("%-24s %10.0f lines/s" % ("parse every line", len(log) / seconds))
+
+    for name, jobs in (("parse_batch", 1), ("parse_batch, %d jobs" % args.jobs, args.jobs)):
+        stats = {}
+        seconds, _ = timeCall(lambda: list(module.parse_batch(log, jobs=jobs, stats=stats)))
+        print("%-24s %10.0f lines/s %6.1f%% cache hits" % (
+            name, len(log) / seconds, 100.0 * stats["hits"] / len(log)))
+
+# Share one CompiledParser between 1, 2, 4 ... threads, each parsing the sample
+# command lines, and report total throughput, for eager, lazy and sparse
+# parsers alike; every result is checked against the eager parser's. Whether
+# the GIL is on decides how this scales, so that is reported too; run the
+# benchmark under a free-threaded build to compare.
+def benchThreads(args, workdir):
+    modes = [(name, generateParser(workdir, args.spec, output=output, options=options))
+             for name, output, options in (("eager", "argparser.py", ()),
+                                           ("lazy", "argparser_lazy.py", ("--lazy",)),
+                                           ("sparse", "argparser_sparse.py", ("--sparse",)))]
+    batch = sampleBatch(args.parses)
+    expected = None
+
+    isGilEnabled = getattr(sys, "_is_gil_enabled", lambda: True)
+    print("%s, GIL %s" % (sys.version.split()[0], "enabled" if isGilEnabled() else "disabled"))
+
+    for name, path in modes:
+        compiled = loadModule(path).CompiledParser()
+        if expected is None:
+            expected = [vars(compiled.parse(argv)) for argv in sampleArgv]
+        threads = 1
+        while threads <= args.threads:
+            mismatches = []
+            def work():
+                for i, argv in enumerate(batch):
+                    if vars(compiled.parse(argv)) != expected[i % len(expected)]:
+                        mismatches.append(argv)
+
+            def run():
+                workers = [threading.Thread(target=work) for _ in range(threads)]
+                for t in workers:
+                    t.start()
+                for t in workers:
+                    t.join()
+
+            seconds = bestTime(run, repeat=3)
+            if mismatches:
+                raise Exception("%s: %d parses differed from the single-threaded eager result" % (name, len(mismatches)))
+            print("%-7s %3d threads %12.0f parses/s" % (name, threads, threads * len(batch) / seconds))
+            threads *= 2
+
+# What one invocation pays to build the parser and parse its command line:
+# every subparser built up front, only the chosen command's subparser, and
+# only the options argv mentions. Each mode's results are checked against the
+# eager parser's, and whole process starts are timed as well.
+def benchSparse(args, workdir):
+    argvs = sampleArgv + [["grep", "-i", "-n", "-e", "pattern", "--max-depth", "2"], ["annotate", "-l", "-s"]]
+    modes = [(name, generateParser(workdir, args.spec, output=output, options=options))
+             for name, output, options in (("eager", "argparser.py", ()),
+                                           ("lazy", "argparser_lazy.py", ("--lazy",)),
+                                           ("sparse", "argparser_sparse.py", ("--sparse",)))]
+    modules = [(name, loadModule(path)) for name, path in modes]
+
+    def values(parsed):
+        return {name: value for name, value in vars(parsed).items() if name != "streamed"}
+    expected = [values(modules[0][1].parse_args(argv)) for argv in argvs]
+    for name, module in modules[1:]:
+        for argv, result in zip(argvs, expected):
+            if values(module.parse_args(argv)) != result:
+                raise Exception("%s parsed %s differently from eager" % (name, argv))
+
+    print("%-10s %14s %14s %12s" % ("", "build+parse", "saved", "options"))
+    eager = None
+    for name, module in modules:
+        def invocations():
+            for argv in argvs:
+                getattr(module, "sparse_indexes", {}).clear()
+                parser = module.create_parser()
+                module.parse_args(argv, parser)
+        seconds = bestTime(invocations) / len(argvs)
+        eager = seconds if eager is None else eager
+
+        # Options actually added to the subparser of each command line's command
+        added = 0
+        for argv in argvs:
+            parser = module.create_parser()
+            module.parse_args(argv, parser)
+            subparsers = parser._subparsers._group_actions[0]
+            if hasattr(module, "sparse_wanted"):
+                added += len(module.sparse_wanted(argv[0], subparsers.tables[argv[0]], argv[1:]))
+            else:
+                added += len(subparsers.choices[argv[0]]._actions) - 1
+        print("%-10s %11.0f us %11.0f us %12.1f" % (name, seconds * 1e6, (eager - seconds) * 1e6, added / len(argvs)))
+
+    # Imported rather than run as a script, so that it loads from its .pyc
+    argv = ["grep", "-i", "-n", "-e", "pattern"]
+    for name, path in modes:
+        module = os.path.splitext(os.path.basename(path))[0]
+        cmd = [sys.executable, "-c", "import %s; %s.main()" % (module, module)] + argv
+        def run():
+            subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.DEVNULL)
+        run()
+        seconds = sum(timeCall(run)[0] for _ in range(args.runs)) / args.runs
+        print("%-10s %11.2f ms/process" % (name, seconds * 1000.0))
+
+# Latency of parses that fail, next to one that succeeds, with argparse's own
+# error path and with --fast-errors: warm, with one CompiledParser, and cold,
+# as the first parse of a newly built parser (the fastest of five). The
+# message of the fast error is shown.
+def benchErrors(args, workdir):
+    cases = [
+        ("success", ["grep", "-i", "-n", "-e", "pattern"]),
+        ("mistyped option", ["grep", "--ignore-cse", "-n"]),
+        ("unknown option", ["grep", "--no-such-option"]),
+        ("stray argument", ["add", "path"]),
+        ("invalid value", ["add", "--chmod=y"]),
+        ("mistyped command", ["grpe", "-i"]),
+    ]
+    plain = loadModule(generateParser(workdir, args.spec, output="argparser.py"))
+    fast = loadModule(generateParser(workdir, args.spec, output="argparser_fast.py", options=("--fast-errors",)))
+
+    def parse(module, compiled, argv):
+        try:
+            compiled.parse(argv)
+            return ""
+        except module.ParseExit as e:
+            return e.stderr.splitlines()[-1]
+
+    print("%-18s %11s %11s %11s %11s   %s" % ("", "plain", "fast", "plain cold", "fast cold", "fast message"))
+    for name, argv in cases:
+        times = []
+        for module in (plain, fast):
+            compiled = module.CompiledParser()
+            message = parse(module, compiled, argv)
+            seconds = bestTime(lambda: [parse(module, compiled, argv) for _ in range(args.parses)])
+            times.append(seconds * 1e6 / args.parses)
+        for module in (plain, fast):
+            compiled = [module.CompiledParser() for _ in range(5)]
+            times.append(min(timeCall(parse, module, c, argv)[0] for c in compiled) * 1e6)
+        if len(message) > 60:
+            message = "..." + message[-57:]
+        print("%-18s %8.1f us %8.1f us %8.1f us %8.1f us   %s" % ((name,) + tuple(times) + (message,)))
+
+# The generators of the same spec to compare, as (name, generator, output)
+backendGenerators = [
+    ("argparse", "gen-argparse.py", "argparser.py"),
+    ("optparse", "gen-optparse.py", "optparser.py"),
+    ("getopt", "gen-getopt.py", "getoptparser.py"),
+]
+
+# Import a generated parser and build it, in a fresh interpreter
+startupScript = """
+import time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+{module}.create_parser()
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1)
+"""
+
+# The same spec through each generator: the results of the sample command lines
+# are checked against argparse's, then import and build are timed in fresh
+# processes (the fastest run), parsing in this one, and whole process starts.
+def benchBackends(args, workdir):
+    backends = [(name, generateParser(workdir, args.spec, generator=generator, output=output))
+                for name, generator, output in backendGenerators]
+    modules = [(name, loadModule(path)) for name, path in backends]
+
+    def values(parsed):
+        return {name: value for name, value in vars(parsed).items() if name != "streamed"}
+    expected = [values(modules[0][1].parse_args(argv)) for argv in sampleArgv]
+    for name, module in modules[1:]:
+        for argv, result in zip(sampleArgv, expected):
+            if values(module.parse_args(argv)) != result:
+                raise Exception("%s parsed %s differently from argparse" % (name, argv))
+
+    argv = ["grep", "-i", "-n", "-e", "pattern"]
+    print("%-10s %9s %11s %11s %11s %13s" % ("", "code", "import", "build", "parse", "process"))
+    for (name, path), (_, module) in zip(backends, modules):
+        modname = os.path.splitext(os.path.basename(path))[0]
+        cmd = [sys.executable, "-c", startupScript.format(module=modname)]
+        runs = []
+        for i in range(args.runs + 1):
+            out = subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.PIPE).stdout
+            if i > 0: # the first run writes the .pyc
+                runs.append([float(x) for x in out.split()])
+        imported, built = [min(run[i] for run in runs) for i in range(2)]
+
+        parser = module.create_parser()
+        parse = bestTime(lambda: [module.parse_args(argv, parser) for argv in sampleArgv]) / len(sampleArgv)
+
+        # Imported rather than run as a script, so that it loads from its .pyc
+        cmd = [sys.executable, "-c", "import %s; %s.main()" % (modname, modname)] + argv
+        def run():
+            subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.DEVNULL)
+        process = sum(timeCall(run)[0] for _ in range(args.runs)) / args.runs
+
+        print("%-10s %6.0f KB %8.2f ms %8.2f ms %8.1f us %8.2f ms/process" % (
+            name, os.path.getsize(path) / 1024.0, imported * 1e3, built * 1e3, parse * 1e6, process * 1e3))
+
+# Import a generated parser and parse argv with it, in a fresh interpreter,
+# writing the time taken to stderr however the parse ends
+profileScript = """
+import sys, time
+t0 = time.perf_counter()
+try:
+    import {module}
+    {module}.parse_args()
+finally:
+    sys.stderr.write('%r\\n' % (time.perf_counter() - t0))
+"""
+
+# Replay a usage profile against eager, lazy and profile-guided builds of the
+# same spec. Each distinct command line of the profile is started as a
+# process with each build, in rounds, and timed from the parser's import to
+# the end of its parse (the median of the runs). The averages are weighted by
+# the profile's counts, overall and over the hot and cold commands apart.
+def benchProfile(args, workdir):
+    path = args.profile
+    if path is None:
+        path = os.path.join(workdir, "profile.txt")
+        with open(path, "wt", encoding='utf-8') as f:
+            f.write(sampleProfile)
+    specs = readspecs(args.spec)
+    profile = readProfile(path, specs)
+    hot = hotCommands(profile, float(args.hotshare))
+    counts = {}
+    for count, argv in profile:
+        counts[tuple(argv)] = counts.get(tuple(argv), 0) + count
+    builds = [(name, generateParser(workdir, args.spec, output=output, options=options))
+              for name, output, options in (("eager", "argparser.py", ()),
+                                            ("lazy", "argparser_lazy.py", ("--lazy",)),
+                                            ("profile", "argparser_profile.py",
+                                             ("--profile", os.path.abspath(path), "--hot-share", args.hotshare)))]
+
+    # The cold module is imported by name, so the builds are loaded from workdir
+    sys.path.insert(0, workdir)
+    modules = [(name, loadModule(path)) for name, path in builds]
+    def outcome(module, argv):
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                parsed = vars(module.parse_args(list(argv)))
+            return {name: value for name, value in parsed.items() if name != "streamed"}
+        except SystemExit as e:
+            return e.code
+    for argv in counts:
+        expected = outcome(modules[0][1], argv)
+        for name, module in modules[1:]:
+            if outcome(module, argv) != expected:
+                raise Exception("%s parsed %s differently from eager" % (name, " ".join(argv)))
+
+    # One run of every case per round, so that drift in the machine is shared
+    cases = []
+    for name, path in builds:
+        modname = os.path.splitext(os.path.basename(path))[0]
+        for argv in counts:
+            cases.append((name, argv, [sys.executable, "-c", profileScript.format(module=modname)] + list(argv)))
+    runs = {(name, argv): [] for name, argv, cmd in cases}
+    env = processEnv()
+    for i in range(args.runs + 1):
+        for name, argv, cmd in cases:
+            result = subprocess.run(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if i > 0: # the first round writes the .pyc files
+                runs[name, argv].append(float(result.stderr.split()[-1]))
+    times = {case: percentile(sorted(values), 50) for case, values in runs.items()}
+
+    def weighted(name, argvs):
+        total = sum(counts[argv] for argv in argvs)
+        return sum(counts[argv] * times[name, argv] for argv in argvs) / total if total else 0.0
+    hotargv = [argv for argv in counts if argv[0] in hot]
+    coldargv = [argv for argv in counts if argv[0] not in hot]
+    print("%d invocations, %d distinct command lines; hot: %s (%.1f%%)" % (
+        sum(counts.values()), len(counts), ", ".join(hot),
+        100.0 * sum(counts[argv] for argv in hotargv) / sum(counts.values())))
+    print("%-10s %9s %14s %14s %14s" % ("", "code", "weighted", "hot", "cold"))
+    for name, path in builds:
+        code = os.path.getsize(path)
+        print("%-10s %6.0f KB %11.2f ms %11.2f ms %11.2f ms" % (
+            name, code / 1024.0, weighted(name, list(counts)) * 1e3,
+            weighted(name, hotargv) * 1e3, weighted(name, coldargv) * 1e3))
+
+# A proxy's policy, and command lines for it to check, allowed and refused
+policyDeny = {"push.force", "clean.force", "config.global"}
+policyArgv = sampleArgv + [
+    ["push", "--force"],
+    ["clean", "-fdx"],
+    ["config", "--glob", "-l"],
+    ["commit", "-qam", "message"],
+]
+
+# Check command lines against a policy with the filter made by gen-policy.py,
+# and find the same options with parse_args: building the parser for each
+# command line, as a proxy starting for one request does, and with a parser
+# built once. The filter is timed with its command indexes already made, and
+# cold, as the first check in a process (the fastest of five).
+def benchPolicy(args, workdir):
+    parser = loadModule(generateParser(workdir, args.spec, output="argparser.py"))
+    policy = loadModule(generateParser(workdir, args.spec, generator="gen-policy.py", output="argpolicy.py"))
+
+    # The options parse_args sets are the ones the filter finds
+    built = parser.create_parser()
+    for argv in policyArgv:
+        parsed = vars(parser.parse_args(argv, built))
+        given = {name for name, value in parsed.items() if name != "streamed" and value not in (None, False)}
+        command, ids, error = policy.scan(argv)
+        if error is not None or {id.split(".", 1)[1] for id in ids[1:]} != given:
+            raise Exception("the filter found %s in %s, parse_args %s" % (ids, " ".join(argv), sorted(given)))
+
+    print("%-26s %-22s %10s %10s %12s %10s" % ("", "verdict", "check", "cold", "build+parse", "parse"))
+    for argv in policyArgv:
+        verdict = policy.check(argv, policyDeny) or "allowed"
+        check = bestTime(lambda: [policy.check(argv, policyDeny) for _ in range(args.parses)]) / args.parses
+        def cold():
+            policy.indexes.clear()
+            policy.check(argv, policyDeny)
+        first = bestTime(cold)
+        full = bestTime(lambda: parser.parse_args(argv, parser.create_parser()))
+        parse = bestTime(lambda: [parser.parse_args(argv, built) for _ in range(args.parses // 10)]) / (args.parses // 10)
+        print("%-26s %-22s %7.1f us %7.1f us %9.0f us %7.1f us" % (
+            " ".join(argv), verdict, check * 1e6, first * 1e6, full * 1e6, parse * 1e6))
+
+# Command lines for a request router, with git's two-word command names
+routeArgv = [
+    ["status", "-s", "-b"],
+    ["commit", "-a", "-m", "message"],
+    ["cat-file", "-p"],
+    ["remote", "set-url", "--push"],
+    ["reflog", "expire"],
+]
+
+# Find the command of a command line with the router that --router writes,
+# against what main() does to get there, building the parser and parsing. The
+# router is checked on every command, by its id and its git name, and what it
+# leaves of the sample command lines must parse as that command's arguments.
+# Then both are timed in-process and as process starts.
+def benchRoute(args, workdir):
+    path = generateParser(workdir, args.spec, output="argparser.py", options=("--router",))
+    parser = loadModule(path)
+    router = loadModule(os.path.join(workdir, "argparser_route.py"))
+    for (cmdid, cmdname, usage, opts) in readspecs(args.spec):
+        for argv in ([cmdid, "-h"], cmdname.split() + ["-h"]):
+            if router.route(argv)[0] != cmdid or router.route(argv)[2] != ["-h"]:
+                raise Exception("the router sent %s to %s" % (" ".join(argv), router.route(argv)))
+    built = parser.create_parser()
+    for argv in routeArgv:
+        command, words, rest, options = router.route(argv)
+        parser.parse_args([command] + rest, built)
+
+    print("%-26s %-14s %10s %12s %10s" % ("", "command", "route", "build+parse", "parse"))
+    for argv in routeArgv:
+        command, words, rest, options = router.route(argv)
+        route = bestTime(lambda: [router.route(argv) for _ in range(args.parses)]) / args.parses
+        full = bestTime(lambda: parser.parse_args([command] + rest, parser.create_parser()))
+        parse = bestTime(lambda: [parser.parse_args([command] + rest, built) for _ in range(100)]) / 100
+        print("%-26s %-14s %7.2f us %9.0f us %7.1f us" % (" ".join(argv), command, route * 1e6, full * 1e6, parse * 1e6))
+
+    # Imported rather than run as a script, so that they load from their .pyc
+    argv = ["remote", "set-url", "--push"]
+    for name, module, cmdargv in (("router", "argparser_route", argv),
+                                  ("main", "argparser", ["remoteSetUrl", "--push"])):
+        cmd = [sys.executable, "-c", "import %s; %s.main()" % (module, module)] + cmdargv
+        def run():
+            subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.DEVNULL)
+        run()
+        seconds = sum(timeCall(run)[0] for _ in range(args.runs)) / args.runs
+        print("%-10s %11.2f ms/process" % (name, seconds * 1000.0))
+
+# A long command line for a command: each of its options with a long name,
+# given a value its type accepts, up to a number of words. Options checked
+# against a pattern are left out.
+def typedLine(incremental, command, words):
+    line = [command]
+    for short, long, dest, kind, check, metavar in incremental.commands[command]:
+        if not long or kind == "pattern":
+            continue
+        if kind == "bool":
+            option = ["--" + long]
+        elif kind == "choices":
+            option = ["--%s=%s" % (long, check[0])]
+        else:
+            option = ["--" + long, "3" if kind == "int" else "value"]
+        if len(line) + len(option) > words:
+            break
+        line += option
+    return " ".join(line)
+
+# Check a command line on every keystroke: as it is typed one character at a
+# time, and as a character in the middle is typed and deleted again. Each text
+# is parsed by an Editor of the incremental parser, which only parses what
+# follows the words the edit left alone, against parsing all of it with the
+# incremental parser and with parse_args() on a parser built once.
+def benchIncremental(args, workdir):
+    parser = loadModule(generateParser(workdir, args.spec, output="argparser.py"))
+    incremental = loadModule(generateParser(workdir, args.spec, generator="gen-incremental.py", output="argincremental.py"))
+    built = parser.create_parser()
+
+    print("%-8s %-7s %6s %8s %14s %14s %14s" % (
+        "command", "edits", "words", "reused", "incremental", "full", "parse_args"))
+    for command in args.command or ["grep", "commit", "pull"]:
+        line = typedLine(incremental, command, args.words)
+        result = incremental.parse(line)
+        parsed = vars(parser.parse_args(line.split(), built))
+        if not result.complete or any(parsed[dest] != value for dest, value in result.values.items()):
+            raise Exception("the incremental parser read %r as %s, parse_args as %s" % (line, result, parsed))
+        middle = len(line) // 2
+        edits = {
+            "typing": [line[:end] for end in range(1, len(line) + 1)],
+            "middle": [line[:middle] + "x" + line[middle:], line] * 50,
+        }
+        for name, texts in edits.items():
+            editor = incremental.Editor()
+            editor.update(texts[-1])
+            incr = []
+            reused = []
+            for text in texts:
+                start = time.perf_counter()
+                editor.update(text)
+                incr.append(time.perf_counter() - start)
+                reused.append(editor.reused)
+            full = [timeCall(incremental.parse, text)[0] for text in texts]
+            with contextlib.redirect_stderr(io.StringIO()):
+                def parseArgs(text):
+                    try:
+                        parser.parse_args(text.split(), built)
+                    except SystemExit:
+                        pass
+                whole = [timeCall(parseArgs, text)[0] for text in texts]
+            print("%-8s %-7s %6d %8.1f %8.1f us/key %8.1f us/key %8.1f us/key" % (
+                command, name, len(line.split()), mean(reused), mean(incr) * 1e6, mean(full) * 1e6, mean(whole) * 1e6))
+
+# Generate a backend's parser with every packaging mode, returning its path
+def generatePackages(workdir, specfile, backend):
+    for name, generator, output in backendGenerators:
+        if name == backend:
+            options = [option for mode in packageModes for option in ("--package", mode)]
+            return generateParser(workdir, specfile, generator=generator, output=output, options=options)
+
+# Every module a packaged parser loads as it starts and parses argv, in import
+# order, as (name, loaded from, bytes, self us, cumulative us). The times come
+# from -X importtime; where each module was loaded from is worked out here:
+# from the bundle if it holds the module, else wherever this interpreter finds
+# it (the parser's .pyc cache for an imported parser). The entry point comes
+# first, as __main__.
+def importAudit(artifact, mode, argv, workdir):
+    cmd = packageCommand(artifact, mode)
+    cmd = cmd[:1] + ["-X", "importtime"] + cmd[1:] + argv
+    err = subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.DEVNULL,
+                         stderr=subprocess.PIPE, universal_newlines=True).stderr
+    members = {}
+    if artifact.endswith(".pyz"):
+        with zipfile.ZipFile(artifact) as z:
+            members = {info.filename: info.file_size for info in z.infolist()}
+
+    rows = [("__main__", "zip" if members else mode, members.get("__main__.pyc", os.path.getsize(artifact)), 0, 0)]
+    sys.path.insert(0, workdir)
+    try:
+        for line in err.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            selftime, cumulative, name = line[len("import time:"):].split("|")
+            name = name.strip()
+            rows.append((name,) + moduleSource(name, members) + (int(selftime), int(cumulative)))
+    finally:
+        sys.path.remove(workdir)
+    return rows
+
+# (loaded from, bytes) for a module: a bundle member, built in, frozen, an
+# extension, a .pyc from the cache, or source
+def moduleSource(name, members):
+    for arcname in (name.replace(".", "/") + ".pyc", name.replace(".", "/") + "/__init__.pyc"):
+        if arcname in members:
+            return ("zip", members[arcname])
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin in (None, "built-in", "frozen"):
+        return (spec.origin if spec is not None and spec.origin else "namespace", 0)
+    if type(spec.loader).__name__ == "ExtensionFileLoader":
+        return ("extension", os.path.getsize(spec.origin))
+    if spec.cached and os.path.exists(spec.cached):
+        return ("pyc", os.path.getsize(spec.cached))
+    return ("source", os.path.getsize(spec.origin))
+
+# Start a parser packaged each way, timing process starts, with a summary of
+# what each loads at startup
+def benchPackaging(args, workdir):
+    path = generatePackages(workdir, args.spec, args.backend)
+    argv = ["grep", "-i", "-n", "-e", "pattern"]
+    print("%-10s %9s %9s %11s %11s %12s %12s" % ("", "artifact", "modules", "loaded", "imports", "mean", "fastest"))
+    for mode in packageModes:
+        artifact = packagePath(path, mode)
+        rows = importAudit(artifact, mode, argv, workdir)
+        cmd = packageCommand(artifact, mode) + argv
+        def run():
+            subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.DEVNULL)
+        run()
+        times = [timeCall(run)[0] for _ in range(args.runs)]
+        print("%-10s %6.0f KB %9d %8.0f KB %8.2f ms %9.2f ms %9.2f ms" % (
+            mode, os.path.getsize(artifact) / 1024.0, len(rows) - 1, sum(row[2] for row in rows) / 1024.0,
+            sum(row[3] for row in rows) / 1000.0, sum(times) / len(times) * 1000.0, min(times) * 1000.0))
+
+# List what one packaged parser loads at startup
+def benchImports(args, workdir):
+    path = generatePackages(workdir, args.spec, args.backend)
+    rows = importAudit(packagePath(path, args.mode), args.mode, ["grep", "-i", "-n", "-e", "pattern"], workdir)
+    print("%-28s %-10s %10s %10s %12s" % ("module", "from", "bytes", "self us", "cumulative"))
+    for name, source, size, selftime, cumulative in rows:
+        print("%-28s %-10s %10d %10d %12d" % (name, source, size, selftime, cumulative))
+    print("%-28s %-10s %10d %10d" % ("%d modules" % (len(rows) - 1), "", sum(row[2] for row in rows),
+                                     sum(row[3] for row in rows)))
+
+# Run a generated parser's main(), reporting on stderr how long create_parser()
+# took and how many collections of each generation ran during it, the
+# collections by the end of the parse, and the time on the system-wide
+# monotonic clock just after parsing, from which the interpreter's shutdown
+# is timed by the process that waits for it
+gcScript = """
+import gc
+import sys
+import time
+import {module}
+
+def collections():
+    return [generation['collections'] for generation in gc.get_stats()]
+
+create = {module}.create_parser
+parse = {module}.parse_args
+
+def create_parser():
+    before = collections()
+    start = time.perf_counter()
+    parser = create()
+    seconds = time.perf_counter() - start
+    sys.stderr.write('build %r %s\\n' % (seconds, ' '.join(str(after - b) for after, b in zip(collections(), before))))
+    return parser
+
+def parse_args(*args):
+    result = parse(*args)
+    sys.stderr.write('parsed %r %s\\n' % (time.monotonic(), ' '.join(map(str, collections()))))
+    sys.stderr.flush()
+    return result
+
+{module}.create_parser = create_parser
+{module}.parse_args = parse_args
+{module}.main()
+"""
+
+# Build the parser with and without --gc-tune and --fast-exit, and start each
+# build as a process, in interleaved rounds. Reported per build: mean time in
+# create_parser() and the collections of generations 0, 1 and 2 it set off,
+# all collections by the end of the parse (imports included), the time from
+# the end of the parse to the process having exited, and the whole process.
+def benchGc(args, workdir):
+    builds = [("plain", ()), ("gc-tune", ("--gc-tune",)), ("fast-exit", ("--fast-exit",)),
+              ("both", ("--gc-tune", "--fast-exit"))]
+    argv = ["commit", "-a", "-m", "message"]
+    env = processEnv()
+    cmds = []
+    for name, options in builds:
+        output = "argparser_%s.py" % name.replace("-", "_")
+        generateParser(workdir, args.spec, output=output, options=options)
+        cmds.append([sys.executable, "-c", gcScript.format(module=output[:-3])] + argv)
+    runs = [[] for build in builds]
+    for i in range(args.runs + 1):
+        for cmd, times in zip(cmds, runs):
+            start = time.perf_counter()
+            result = subprocess.run(cmd, cwd=workdir, env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+            ended = time.monotonic()
+            wall = time.perf_counter() - start
+            lines = dict(line.split(" ", 1) for line in result.stderr.splitlines())
+            build = lines["build"].split()
+            parsed = lines["parsed"].split()
+            if i > 0:
+                times.append((float(build[0]), [int(n) for n in build[1:]], sum(int(n) for n in parsed[1:]),
+                              ended - float(parsed[0]), wall))
+
+    print("%-10s %10s %14s %12s %12s %10s" % ("build", "build", "gen 0/1/2", "collections", "shutdown", "process"))
+    for (name, options), times in zip(builds, runs):
+        print("%-10s %7.2f ms %14s %12.1f %9.2f ms %7.2f ms" % (
+            name, mean([t[0] for t in times]) * 1e3,
+            "/".join("%.1f" % mean([t[1][g] for t in times]) for g in range(3)),
+            mean([t[2] for t in times]), mean([t[3] for t in times]) * 1e3, mean([t[4] for t in times]) * 1e3))
+
+# Run a packaged parser's entry point the way its command line would, and
+# write every file its modules were loaded from to stderr on the way out
+loadedScript = """
+import sys
+del sys.argv[0]
+try:
+    import runpy
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+finally:
+    files = set()
+    for module in list(sys.modules.values()):
+        for name in ('__file__', '__cached__'):
+            path = getattr(module, name, None)
+            if isinstance(path, str):
+                files.add(path)
+    sys.stderr.write(''.join(path + '\\n' for path in sorted(files)))
+"""
+
+# The files a packaged parser reads as it starts: the artifact, and the source
+# and .pyc files of every module it loads from the file system, the standard
+# library's included. Modules in a zip are covered by the zip.
+def loadedFiles(artifact, mode, argv, workdir):
+    cmd = packageCommand(artifact, mode)
+    cmd = cmd[:-1] + ["-c", loadedScript, artifact] + argv
+    result = subprocess.run(cmd, cwd=workdir, env=processEnv(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    files = {artifact} | {path for path in result.stderr.splitlines() if os.path.isfile(path)}
+    return sorted(os.path.abspath(os.path.join(workdir, path)) for path in files)
+
+# Drop files from the page cache. Dirty pages aren't dropped, so each file is
+# written back first. No privileges are needed, but pages that a running
+# process has mapped (like the interpreter's own) stay.
+def evictFiles(paths):
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+# Start one process and wait for it with wait4, returning (wall seconds, bytes
+# read from storage), the latter from the blocks the kernel counts as input
+def timeStart(cmd, workdir, env):
+    start = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+    pid, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    if status != 0:
+        raise Exception("%s exited with status %d" % (" ".join(cmd), status))
+    return wall, usage.ru_inblock * 512
+
+# Start each backend's parser, packaged each way, with the files it reads
+# evicted from the page cache before every cold run (along with the spec it
+# was made from), and again right after each cold run, warm. Reported apart:
+# mean wall time and the bytes read from storage per start.
+def benchColdstart(args, workdir):
+    if not hasattr(os, "posix_fadvise"):
+        raise Exception("no posix_fadvise here, so the page cache can't be dropped")
+    argv = ["grep", "-i", "-n", "-e", "pattern"]
+    env = processEnv()
+    print("%-10s %-10s %6s %9s %11s %10s %11s %10s" % (
+        "backend", "mode", "files", "size", "cold", "cold read", "warm", "warm read"))
+    for name, generator, output in backendGenerators:
+        if args.backend and name not in args.backend:
+            continue
+        path = generatePackages(workdir, args.spec, name)
+        for mode in packageModes:
+            artifact = packagePath(path, mode)
+            cmd = packageCommand(artifact, mode) + argv
+            timeStart(cmd, workdir, env) # writes the .pyc files an imported parser uses
+            files = loadedFiles(artifact, mode, argv, workdir) + [os.path.abspath(args.spec)]
+            cold = []
+            warm = []
+            for i in range(args.runs):
+                evictFiles(files)
+                cold.append(timeStart(cmd, workdir, env))
+                warm.append(timeStart(cmd, workdir, env))
+            print("%-10s %-10s %6d %6.0f KB %8.2f ms %7.0f KB %8.2f ms %7.0f KB" % (
+                name, mode, len(files), sum(os.path.getsize(f) for f in files) / 1024.0,
+                mean([run[0] for run in cold]) * 1e3, mean([run[1] for run in cold]) / 1024.0,
+                mean([run[0] for run in warm]) * 1e3, mean([run[1] for run in warm]) / 1024.0))
+
+# -----------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+#! python3
+# coding=utf-8
+
+# cost-model.py
+# copyright 2019 Brian Fitzgerald
+
+# Predict what a generated parser will cost from the shape of its spec alone.
+# We generate synthetic specs over a sweep of command counts, options per
+# command, option types and help sizes, measure each generated parser in a
+# fresh process, and fit a linear model per backend: a fixed cost plus a cost
+# per command, per option of each type, and per KB of help text. The model is
+# then checked against a real spec, and the constructs that dominate its cost
+# are named.
+#
+#    $ cost-model.py
+#    $ cost-model.py --backend argparse --repeat 5 ../spec/git-command-specs.txt
+
+import argparse
+import itertools
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from benchmark import defaultspec, generateParser, processEnv
+from genlib import readspecs
+
+# Backend name -> (generator, generator options)
+backends = {
+    "argparse": ("gen-argparse.py", ()),
+    "argparse-shared": ("gen-argparse.py", ("--share-options",)),
+    "optparse": ("gen-optparse.py", ()),
+    "getopt": ("gen-getopt.py", ()),
+}
+
+# The constructs the model charges for, in the order of its coefficients
+constructs = ["base", "command", "bool option", "string option", "int option", "choice option", "help KB"]
+
+# The sweep: command counts, options per command, help bytes per option, and
+# type mixes as (bool, string, int, choice) weights
+sweepCommands = [8, 32, 96]
+sweepOptions = [4, 16, 48]
+sweepHelp = [8, 64]
+sweepMixes = [(1, 0, 0, 0), (1, 2, 0, 0), (1, 0, 2, 0), (1, 0, 0, 2), (1, 1, 1, 1)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit and check a startup and parse cost model per backend")
+    parser.add_argument("specfile", nargs="?", default=defaultspec, help="spec to predict and measure")
+    parser.add_argument("--backend", action="append", choices=sorted(backends),
+                        help="backend to model (repeatable, default all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, fastest is kept")
+    args = parser.parse_args()
+
+    specs = readspecs(args.specfile)
+    shape = specShape(specs)
+    # Parse the first command with its first bool option, as the sweep does
+    parseargv = [specs[0][0]] + ["--" + opt[3] for opt in specs[0][3]
+                                 if opt[0] == "option" and opt[8] == "bool" and opt[3]][:1]
+
+    for backend in args.backend or sorted(backends):
+        generator, options = backends[backend]
+        with tempfile.TemporaryDirectory() as workdir:
+            rows = []
+            for commands, perCommand, helpbytes, mix in itertools.product(sweepCommands, sweepOptions, sweepHelp, sweepMixes):
+                specfile = os.path.join(workdir, "synthetic.txt")
+                writeSpec(specfile, commands, perCommand, helpbytes, mix)
+                synthetic = specShape(readspecs(specfile))
+                cost = measure(workdir, specfile, generator, options, ["cmd0", "--opt-0"], args.repeat)
+                rows.append((synthetic, cost))
+                print("  %s: %d commands x %d options, %d help bytes, mix %s: startup %.1f ms" % (
+                    backend, commands, perCommand, helpbytes, mix, (cost[0] + cost[1]) * 1000.0), file=sys.stderr)
+
+            measured = measure(workdir, args.specfile, generator, options, parseargv, args.repeat)
+
+        # Startup is fitted on the whole spec shape; parsing mostly depends on
+        # how many options the chosen command has, so it gets its own model
+        importModel = fit([row[0]["features"] for row in rows], [row[1][0] for row in rows])
+        buildModel = fit([row[0]["features"] for row in rows], [row[1][1] for row in rows])
+        parseModel = fit([[1.0, row[0]["commands"], row[0]["first"]] for row in rows], [row[1][2] for row in rows])
+        report(backend, shape, importModel, buildModel, parseModel, measured)
+
+# -----------------------------------------------------------------------------------------------
+
+# Write a synthetic spec. Option 0 of every command is a bool, so that every
+# command can be parsed with "--opt-0"; the rest follow the type mix. Odd
+# options get help of their own per command, so that about half of the
+# definitions are shared across commands, as in a real spec.
+def writeSpec(specfile, commands, perCommand, helpbytes, mix):
+    kinds = [kind for kind, weight in zip(("bool", "string", "int", "choice"), mix) for _ in range(weight)]
+    helptext = ("lorem ipsum dolor sit amet " * (helpbytes // 27 + 1))[:helpbytes].strip()
+    with open(specfile, "wt", encoding='utf-8') as f:
+        for c in range(commands):
+            print("command cmd%d \"cmd%d\"" % (c, c), file=f)
+            print("    usage", file=f)
+            print("        \"usage: git cmd%d [<options>]\"" % c, file=f)
+            for o in range(perCommand):
+                kind = "bool" if o == 0 else kinds[o % len(kinds)]
+                print("    option opt%d" % o, file=f)
+                print("        longname: opt-%d" % o, file=f)
+                if kind == "string":
+                    print("        argument: <value>", file=f)
+                elif kind == "int":
+                    print("        argument: <n>", file=f)
+                elif kind == "choice":
+                    print("        argument: (alpha|beta|gamma)", file=f)
+                print("        type: %s" % ("bool" if kind == "bool" else "int" if kind == "int" else "string"), file=f)
+                text = helptext if o % 2 == 0 else ("cmd%d %s" % (c, helptext))[:max(helpbytes, 8)]
+                print("        help: \"%s\"" % text, file=f)
+
+# Count the constructs in a spec, in the order of the constructs list
+def specShape(specs):
+    counts = {"bool": 0, "string": 0, "int": 0, "choice": 0}
+    helpbytes = 0
+    for (cmdid, cmdname, usage, opts) in specs:
+        for opt in opts:
+            if opt[0] != "option":
+                continue
+            (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
+            if argtype == "string" and "(" in argument and "<" not in argument:
+                counts["choice"] += 1
+            elif argtype in counts:
+                counts[argtype] += 1
+            helpbytes += len(helptext)
+    first = sum(1 for opt in specs[0][3] if opt[0] == "option")
+    features = [1.0, len(specs), counts["bool"], counts["string"], counts["int"], counts["choice"], helpbytes / 1024.0]
+    return {"features": features, "commands": len(specs), "first": first}
+
+# -----------------------------------------------------------------------------------------------
+
+# Import the generated parser, build it, and parse argv a number of times, in
+# a fresh interpreter that already has the parser's .pyc
+measureScript = """
+import sys, time
+t0 = time.perf_counter()
+import parsermodule as m
+t1 = time.perf_counter()
+p = m.create_parser()
+t2 = time.perf_counter()
+for _ in range(200):
+    m.parse_args(sys.argv[1:], p)
+t3 = time.perf_counter()
+print(t1 - t0, t2 - t1, (t3 - t2) / 200)
+"""
+
+# Measure (import, build, parse) seconds for a spec, keeping the fastest run
+def measure(workdir, specfile, generator, options, argv, repeat):
+    generateParser(workdir, specfile, generator=generator, output="parsermodule.py", options=options)
+    shutil.rmtree(os.path.join(workdir, "__pycache__"), ignore_errors=True)
+    cmd = [sys.executable, "-c", measureScript] + argv
+    runs = []
+    for i in range(repeat + 1):
+        out = subprocess.run(cmd, cwd=workdir, env=processEnv(), check=True, stdout=subprocess.PIPE).stdout
+        if i > 0: # the first run writes the .pyc
+            runs.append([float(x) for x in out.split()])
+    return [min(run[i] for run in runs) for i in range(3)]
+
+# Least-squares fit of y = X b, by the normal equations with a little ridge
+# to keep them solvable when a construct doesn't vary in the sweep
+def fit(X, y):
+    n = len(X[0])
+    A = [[sum(row[i] * row[j] for row in X) + (1e-9 if i == j else 0.0) for j in range(n)] for i in range(n)]
+    b = [sum(row[i] * t for row, t in zip(X, y)) for i in range(n)]
+
+    # Gaussian elimination with partial pivoting
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(A[r][col]))
+        A[col], A[pivot] = A[pivot], A[col]
+        b[col], b[pivot] = b[pivot], b[col]
+        for r in range(col + 1, n):
+            factor = A[r][col] / A[col][col]
+            for c in range(col, n):
+                A[r][c] -= factor * A[col][c]
+            b[r] -= factor * b[col]
+    coef = [0.0] * n
+    for r in reversed(range(n)):
+        coef[r] = (b[r] - sum(A[r][c] * coef[c] for c in range(r + 1, n))) / A[r][r]
+    return coef
+
+def predict(coef, features):
+    return sum(c * x for c, x in zip(coef, features))
+
+def report(backend, shape, importModel, buildModel, parseModel, measured):
+    features = shape["features"]
+    print("%s" % backend)
+    print("  %-16s %12s %12s" % ("construct", "import us", "build us"))
+    for name, ci, cb in zip(constructs, importModel, buildModel):
+        print("  %-16s %12.2f %12.2f" % (name, ci * 1e6, cb * 1e6))
+    print("  parse: %.2f us + %.3f us/command + %.3f us/option of the command" % tuple(c * 1e6 for c in parseModel))
+
+    predicted = [predict(importModel, features), predict(buildModel, features),
+                 predict(parseModel, [1.0, shape["commands"], shape["first"]])]
+    print("  %-16s %12s %12s" % ("", "predicted", "measured"))
+    for name, p, m, scale, unit in zip(("import", "build", "parse"), predicted, measured,
+                                       (1e3, 1e3, 1e6), ("ms", "ms", "us")):
+        print("  %-16s %9.2f %s %9.2f %s (%+.0f%%)" % (name, p * scale, unit, m * scale, unit, 100.0 * (p - m) / m))
+
+    # What the startup of this spec is spent on, by construct
+    shares = [((ci + cb) * x, name) for name, ci, cb, x in zip(constructs, importModel, buildModel, features)]
+    total = sum(share for share, name in shares)
+    print("  startup by construct: " + ", ".join("%s %.0f%%" % (name, 100.0 * share / total)
+                                               for share, name in sorted(shares, reverse=True)))
+
+# -----------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()
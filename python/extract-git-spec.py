@@ -12,7 +12,9 @@
 # todo: the list of Git commands was put together by inspection; use git help --all to
 # check for new commands.
 
+import argparse
 import codecs
+import contextlib
 import os
 import re
 import subprocess
@@ -20,22 +22,67 @@ import sys
 if sys.version_info < (3,5):
     raise Exception("Requires Python 3.5 or greater")
 
-debuglogs = False # enable/disable extra debug logs
-writeraw = False # enable/disable rawhelp.txt log
-writeparse = False # enable/disable parsehelp.txt
-writetest = False # enable/disable testhelp.txt log (and testing)
-writespecs = True # write specs to git-command-specs.txt
-writemarkdown = False # write specs to git-command-specs.md
-writehtml = False # write specs to git-command-specs.html
+# Output sinks: sink name -> output file. Each enabled sink's file is opened
+# once, on its first write, and kept open for the rest of the run, so a sink
+# that nothing is written to leaves no file; a disabled sink isn't in sinks at
+# all, so nothing is formatted for it.
+sinkfiles = {
+    "raw": "rawhelp.txt",
+    "parse": "parsehelp.txt",
+    "usageonly": "usageonly.txt",
+    "usagenonblank": "usagenonblank.txt",
+    "test": "testhelp.txt",
+    "specs": "git-command-specs.txt",
+    "markdown": "git-command-specs.md",
+    "html": "git-command-specs.html",
+}
+sinks = {}
+
+# An output file that is only created when something is written to it
+class Sink:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, text):
+        if self.file is None:
+            self.file = open(self.path, "wt", encoding='utf-8', buffering=1 << 16)
+        return self.file.write(text)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
 
 def main():
-    for f in ("rawhelp.txt", "parsehelp.txt", "usageonly.txt", "usagenonblank.txt", "testhelp.txt",
-              "git-command-specs.txt", "git-command-specs.md", "git-command-specs.html"):
+    parser = argparse.ArgumentParser(description="Extract the Git command-line spec from git's own help")
+    parser.add_argument("--debug-logs", action="store_true", help="write usageonly.txt and usagenonblank.txt")
+    parser.add_argument("--raw", action="store_true", help="write the raw help to rawhelp.txt")
+    parser.add_argument("--parse", action="store_true", help="write the parsed help to parsehelp.txt")
+    parser.add_argument("--test", action="store_true", help="write the help comparison to testhelp.txt")
+    parser.add_argument("--no-specs", dest="specs", action="store_false", help="don't write git-command-specs.txt")
+    parser.add_argument("--markdown", action="store_true", help="write git-command-specs.md")
+    parser.add_argument("--html", action="store_true", help="write git-command-specs.html")
+    args = parser.parse_args()
+
+    enabled = {
+        "raw": args.raw, "parse": args.parse, "test": args.test,
+        "usageonly": args.debug_logs, "usagenonblank": args.debug_logs,
+        "specs": args.specs, "markdown": args.markdown, "html": args.html,
+    }
+
+    # Outputs of an earlier run would be misleading, so remove them all
+    for f in sinkfiles.values():
         if os.path.exists(f):
             os.remove(f)
 
-    # getRawUsageOnly()
-    getRawHelp()
+    with contextlib.ExitStack() as stack:
+        for name, path in sinkfiles.items():
+            if enabled[name]:
+                sinks[name] = Sink(path)
+                stack.callback(sinks[name].close)
+
+        # getRawUsageOnly()
+        getRawHelp()
 
 git_commands = [
     "add", "am", "annotate", "apply", "archimport", "archive", "bisect",
@@ -91,8 +138,8 @@ git_commands_adhoc_help = {
 git_commands_usage_only = []
 
 def getRawUsageOnly():
-    rawhelp = "rawhelp.txt" if writeraw else os.devnull
-    with open(rawhelp, "at", encoding='utf-8') as f:
+    f = sinks.get("raw")
+    if f is not None:
         print("================================================", file=f)
         print("Usage-only commands", file=f)
         print("================================================", file=f)
@@ -103,16 +150,16 @@ def getRawUsageOnly():
         print(rawUsage)
 
 def getRawHelp():
-    rawhelp = "rawhelp.txt" if writeraw else os.devnull
-    with open(rawhelp, "at", encoding='utf-8') as f:
+    f = sinks.get("raw")
+    if f is not None:
         print("", file=f)
         print("================================================", file=f)
         print("Commands with internal help", file=f)
         print("================================================", file=f)
         print("", file=f)
 
-    specfile = "git-command-specs.html" if writehtml else os.devnull
-    with open(specfile, "at", encoding='utf-8') as f:
+    f = sinks.get("html")
+    if f is not None:
         print("%s" % html_header, file=f, end='')
 
     for cmd in git_commands:
@@ -124,10 +171,12 @@ def getRawHelp():
         rawHelp, rawHelpAll = run_git_help(cmd)
         if cmd in git_commands_adhoc_help:
             continue # ignore for now
-        usage, opts = parseHelp(cmd, rawHelp, rawHelpAll)
-        testHelp(cmd, usage, opts, rawHelp, rawHelpAll)
+        command = parseHelp(cmd, rawHelp, rawHelpAll)
+        writeCommand(command)
+        testHelp(cmd, command["usage"], command["opts"], rawHelp, rawHelpAll)
 
-    with open(specfile, "at", encoding='utf-8') as f:
+    f = sinks.get("html")
+    if f is not None:
         print("%s" % html_footer, file=f, end='')
 
 def testHelp(cmd, usage, opts, rawHelp, rawHelpAll):
@@ -266,8 +315,35 @@ def testHelp(cmd, usage, opts, rawHelp, rawHelpAll):
         genHelp.append("")
         genHelpAll.append("")
 
-    testhelpf = "testhelp.txt" if writetest else os.devnull
-    with open(testhelpf, "at", encoding='utf-8') as f:
+    # Compare
+    errors = []
+    if len(genHelp) != len(rawHelp):
+        errors.append("Error: real -h has %d lines, gen -h has %d lines" % (len(rawHelp), len(genHelp)))
+    else:
+        diffline = ""
+        for a, b in zip(genHelp, rawHelp):
+            if a != b:
+                diffline = '"' + a + '" vs "' + b + '"'
+                break
+        if diffline != "":
+            errors.append("Error: real -h does not match gen -h")
+            errors.append("First error: %s" % diffline)
+
+    if hasRawHelpAll:
+        if len(genHelpAll) != len(rawHelpAll):
+            errors.append("Error: real --help-all has %d lines, gen --help-all has %d lines" % (len(rawHelp), len(genHelp)))
+        else:
+            diffline = ""
+            for a, b in zip(genHelpAll, rawHelpAll):
+                if a != b:
+                    diffline = '"' + a + '" vs "' + b + '"'
+                    break
+            if diffline != "":
+                errors.append("Error: real --help-all does not match gen --help-all")
+                errors.append("First error: %s" % diffline)
+
+    f = sinks.get("test")
+    if f is not None:
         print("===================", file=f)
         print(cmd, file=f)
         print("----------- old:", file=f)
@@ -283,44 +359,15 @@ def testHelp(cmd, usage, opts, rawHelp, rawHelpAll):
             print("----------- new:", file=f)
             for L in genHelpAll:
                 print(L, file=f)
-
-        # Compare
         print("-----------", file=f)
-        fatal = False
-        if len(genHelp) != len(rawHelp):
-            print("Error: real -h has %d lines, gen -h has %d lines" % (len(rawHelp), len(genHelp)), file=f)
-            fatal = True
-        else:
-            diffline = ""
-            for a, b in zip(genHelp, rawHelp):
-                if a != b:
-                    diffline = '"' + a + '" vs "' + b + '"'
-                    break
-            if diffline != "":
-                print("Error: real -h does not match gen -h", file=f)
-                print("First error: %s" % diffline, file=f)
-                fatal = True
-
-        if hasRawHelpAll:
-            if len(genHelpAll) != len(rawHelpAll):
-                print("Error: real --help-all has %d lines, gen --help-all has %d lines" % (len(rawHelp), len(genHelp)), file=f)
-                fatal = True
-            else:
-                diffline = ""
-                for a, b in zip(genHelpAll, rawHelpAll):
-                    if a != b:
-                        diffline = '"' + a + '" vs "' + b + '"'
-                        break
-                if diffline != "":
-                    print("Error: real --help-all does not match gen --help-all", file=f)
-                    print("First error: %s" % diffline, file=f)
-                    fatal = True
-
-        if fatal:
-            raise Exception("mismatch between original and generated")
-        else:
+        for L in errors:
+            print(L, file=f)
+        if not errors:
             print("Generated matches original", file=f)
 
+    if errors:
+        raise Exception("mismatch between original and generated")
+
 # Split a line containing an option into its pieces. Return None if
 # the line does not contain an option
 def parseOptionLine(line):
@@ -461,8 +508,8 @@ def parseHelp(cmd, rawHelp, rawHelpAll):
     # For commands that are just usage and no options, write them
     # to a separate file
     if len(options) == 0:
-        usageonlyf = "usageonly.txt" if debuglogs else os.devnull
-        with open(usageonlyf, "at", encoding='utf-8') as f:
+        f = sinks.get("usageonly")
+        if f is not None:
             print("--------------------", file=f)
             print(cmd, file=f)
             for L in usage:
@@ -471,8 +518,8 @@ def parseHelp(cmd, rawHelp, rawHelpAll):
     # For commands that have options, show all the ones that
     # don't end in a blank line
     if len(options) > 0 and len(usage[-1]) > 0:
-        usagenonblankf = "usagenonblank.txt" if debuglogs else os.devnull
-        with open(usagenonblankf, "at", encoding='utf-8') as f:
+        f = sinks.get("usagenonblank")
+        if f is not None:
             print("--------------------", file=f)
             print(cmd, file=f)
             for L in usage:
@@ -587,247 +634,229 @@ def parseHelp(cmd, rawHelp, rawHelpAll):
         raise Exception("not a valid id: %s" % cmdId)
     # print("turned %s into %s" % (cmd, cmdId))
 
-    # Output our parsed data
-    parsehelpf = "parsehelp.txt" if writeparse else os.devnull
-    with open(parsehelpf, "at", encoding='utf-8') as f:
-        print("===================", file=f)
-        print(cmd, file=f)
-        print("-----------", file=f)
-        for L in usage:
-            print(L, file=f)
-        print("-----------", file=f)
-        for L in optionsraw:
-            print(L, file=f)
-        print("-----------", file=f)
-        for L in options:
-            print(L, file=f)
-        print("-----------", file=f)
-        print("command %s" % cmdId, file=f)
-        for opt in opts:
-            optname = opt[0]
-            # print("    option", file=f)
-            print("    %s" % optname, file=f)
-            for o in opt[1:]:
-                print("        %s" % o, file=f)
-
-    specfile = "git-command-specs.txt" if writespecs else os.devnull
-    with open(specfile, "at", encoding='utf-8') as f:
-        print("command %s \"%s\"" % (cmdId, cmd), file=f)
-        print("    usage", file=f)
-        usagetrim = [x for x in usage]
-        while len(usagetrim) > 0 and len(usagetrim[-1]) == 0:
-            usagetrim = usagetrim[:-1]
-        for L in usagetrim:
-            print("        \"%s\"" % L, file=f)
-        for opt in opts:
-            optname = opt[0]
-            # print("    option", file=f)
-            print("    %s" % optname, file=f)
-            for o in opt[1:]:
-                print("        %s" % o, file=f)
-
+    usagetrim = [x for x in usage]
+    while len(usagetrim) > 0 and len(usagetrim[-1]) == 0:
+        usagetrim = usagetrim[:-1]
+
+    # Return the parsed command, which every output sink is fed from
+    return {
+        "cmd": cmd, "cmdId": cmdId, "usage": usage, "usagetrim": usagetrim, "opts": opts,
+        "optionsraw": optionsraw, "options": options,
+    }
+
+# Get the pieces of an option entry, using defaults for missing pieces. Returns None
+# for group lines and text lines.
+def optionFields(opt):
+    optnametag = opt[0]
+    if optnametag == "option":
+        if opt[1] == "groupline":
+            return None
+        elif opt[1].startswith("textline: "):
+            return None
+        raise Exception("what? %s" % opt)
+    shortname = ""
+    longname = ""
+    argument = ""
+    hidden = False
+    optional = False
+    helptext = ""
+    argtype = ""
+    for entry in opt[1:]:
+        if entry.startswith("shortname: "):
+            shortname = entry[11:]
+        elif entry.startswith("longname: "):
+            longname = entry[10:]
+        elif entry.startswith("argument: "):
+            argument = entry[10:]
+        elif entry == "hidden":
+            hidden = True
+        elif entry == "optional":
+            optional = True
+        elif entry.startswith("help: "):
+            helptext = entry[7:-1]
+        elif entry.startswith("type: "):
+            argtype = entry[6:]
+    match = re.match(r'option (.+)$', optnametag)
+    if not match:
+        raise Exception("I expected better: %s" % optnametag)
+    optname = match.group(1)
+    if shortname != "" and longname != "":
+        optpattern = "%s|%s" % (longname, shortname)
+    elif shortname == "":
+        optpattern = "%s" % longname
+    else:
+        optpattern = "%s" % shortname
+    return (optname, optpattern, argument, hidden, optional, helptext, argtype)
+
+# Feed a parsed command to every enabled sink. The option fields are only
+# worked out if a sink that needs them is enabled.
+def writeCommand(command):
+    if "markdown" in sinks or "html" in sinks:
+        command["fields"] = [optionFields(opt) for opt in command["opts"]]
+    for name, writer in commandWriters:
+        f = sinks.get(name)
+        if f is not None:
+            writer(f, command)
+
+def writeParsed(f, command):
+    print("===================", file=f)
+    print(command["cmd"], file=f)
+    print("-----------", file=f)
+    for L in command["usage"]:
+        print(L, file=f)
+    print("-----------", file=f)
+    for L in command["optionsraw"]:
+        print(L, file=f)
+    print("-----------", file=f)
+    for L in command["options"]:
+        print(L, file=f)
+    print("-----------", file=f)
+    print("command %s" % command["cmdId"], file=f)
+    for opt in command["opts"]:
+        print("    %s" % opt[0], file=f)
+        for o in opt[1:]:
+            print("        %s" % o, file=f)
+
+def writeSpecs(f, command):
+    print("command %s \"%s\"" % (command["cmdId"], command["cmd"]), file=f)
+    print("    usage", file=f)
+    for L in command["usagetrim"]:
+        print("        \"%s\"" % L, file=f)
+    for opt in command["opts"]:
+        print("    %s" % opt[0], file=f)
+        for o in opt[1:]:
+            print("        %s" % o, file=f)
+
+def writeMarkdown(f, command):
     def escape(S):
         S = S.replace('<', '\\<')
         S = S.replace('[', '\\[')
         return S
 
-    specfile = "git-command-specs.md" if writemarkdown else os.devnull
-    with open(specfile, "at", encoding='utf-8') as f:
-        print("_command_ **%s** `\"%s\"` {\\" % (cmdId, cmd), file=f)
+    print("_command_ **%s** `\"%s\"` {\\" % (command["cmdId"], command["cmd"]), file=f)
 
-        usagetrim = [x for x in usage]
-        while len(usagetrim) > 0 and len(usagetrim[-1]) == 0:
-            usagetrim = usagetrim[:-1]
-        print("&#160;&#160;&#160;&#160;_usage_ { ", file=f, end='')
-        if len(usagetrim) == 1:
-            print("\"%s\" }\\" % escape(usagetrim[0]), file=f)
-        else:
-            print("\\", file=f)
-            for L in usagetrim:
-                print("&#160;&#160;&#160;&#160;&#160;&#160;&#160;&#160;\"%s\",\\" % escape(L), file=f)
-            print("&#160;&#160;&#160;&#160;}\\", file=f)
-
-        for opt in opts:
-            optnametag = opt[0]
-            if optnametag == "option":
-                if opt[1] == "groupline":
-                    continue
-                elif opt[1].startswith("textline: "):
-                    continue
-                raise Exception("what? %s" % opt)
-            shortname = ""
-            longname = ""
-            argument = ""
-            hidden = False
-            optional = False
-            helptext = ""
-            argtype = ""
-            numopt = True
-            for entry in opt[1:]:
-                if entry.startswith("shortname: "):
-                    shortname = entry[11:]
-                elif entry.startswith("longname: "):
-                    longname = entry[10:]
-                elif entry.startswith("argument: "):
-                    argument = entry[10:]
-                elif entry == "hidden":
-                    hidden = True
-                elif entry == "optional":
-                    optional = True
-                elif entry.startswith("help: "):
-                    helptext = entry[7:-1]
-                elif entry.startswith("type: "):
-                    argtype = entry[6:]
-                elif entry == "numopt":
-                    numopt = True
-            match = re.match(r'option (.+)$', optnametag)
-            if not match:
-                raise Exception("I expected better: %s" % optnametag)
-            optname = match.group(1)
-            print("&#160;&#160;&#160;&#160;_option_ **%s** _%s_ {" % (optname, argtype), file=f, end='')
-            if shortname != "" and longname != "":
-                optpattern = "%s|%s" % (longname, shortname)
-            elif shortname == "":
-                optpattern = "%s" % longname
-            else:
-                optpattern = "%s" % shortname
-            print(" \"%s\"" % optpattern, file=f, end='')
-            if hidden:
-                print(", _hidden_", file=f, end='')
-            if argument != "":
-                print(", _arg_=\"%s\"" % escape(argument), file=f, end='')
-            if optional:
-                print(", _optional_", file=f, end='')
-            if helptext != "":
-                print(", _help_=\"%s\"" % helptext, file=f, end='')
-            print(" }\\", file=f)
+    usagetrim = command["usagetrim"]
+    print("&#160;&#160;&#160;&#160;_usage_ { ", file=f, end='')
+    if len(usagetrim) == 1:
+        print("\"%s\" }\\" % escape(usagetrim[0]), file=f)
+    else:
+        print("\\", file=f)
+        for L in usagetrim:
+            print("&#160;&#160;&#160;&#160;&#160;&#160;&#160;&#160;\"%s\",\\" % escape(L), file=f)
+        print("&#160;&#160;&#160;&#160;}\\", file=f)
 
-        print("}\n", file=f)
+    for fields in command["fields"]:
+        if fields is None:
+            continue
+        (optname, optpattern, argument, hidden, optional, helptext, argtype) = fields
+        print("&#160;&#160;&#160;&#160;_option_ **%s** _%s_ {" % (optname, argtype), file=f, end='')
+        print(" \"%s\"" % optpattern, file=f, end='')
+        if hidden:
+            print(", _hidden_", file=f, end='')
+        if argument != "":
+            print(", _arg_=\"%s\"" % escape(argument), file=f, end='')
+        if optional:
+            print(", _optional_", file=f, end='')
+        if helptext != "":
+            print(", _help_=\"%s\"" % helptext, file=f, end='')
+        print(" }\\", file=f)
 
+    print("}\n", file=f)
+
+def writeHtml(f, command):
     def escapehtml(S):
         S = S.replace('&', '&amp;')
         S = S.replace('<', '&lt;')
         return S
 
-    specfile = "git-command-specs.html" if writehtml else os.devnull
-    with open(specfile, "at", encoding='utf-8') as f:
-        print("<p><em>command</em> <strong>%s</strong> <code>\"%s\"</code> {<br>" % (cmdId, cmd), file=f)
+    print("<p><em>command</em> <strong>%s</strong> <code>\"%s\"</code> {<br>" % (command["cmdId"], command["cmd"]), file=f)
 
-        usagetrim = [x for x in usage]
-        while len(usagetrim) > 0 and len(usagetrim[-1]) == 0:
-            usagetrim = usagetrim[:-1]
-        print("<span class=\"tabstop\"><em>usage</em> { ", file=f, end='')
-        if len(usagetrim) == 1:
-            print("<code>\"%s\"</code> }<br>" % escapehtml(usagetrim[0]), file=f)
-        else:
-            print("<br>", file=f)
-            for L in usagetrim:
-                print("<span class=\"tabstop\"><span class=\"tabstop\"><code>\"%s\"</code>, <br>" % escapehtml(L), file=f)
-            print("<span class=\"tabstop\">}<br>", file=f)
-
-        for opt in opts:
-            optnametag = opt[0]
-            if optnametag == "option":
-                if opt[1] == "groupline":
-                    print("<span class=\"tabstop\"><em>groupline</em><br>", file=f)
-                    continue
-                elif opt[1].startswith("textline: "):
-                    print("<span class=\"tabstop\"><em>textline</em> { \"%s\" }<br>" % escapehtml(opt[1][10:]), file=f)
-                    continue
-                raise Exception("what? %s" % opt)
-            shortname = ""
-            longname = ""
-            argument = ""
-            hidden = False
-            optional = False
-            helptext = ""
-            argtype = ""
-            numopt = True
-            for entry in opt[1:]:
-                if entry.startswith("shortname: "):
-                    shortname = entry[11:]
-                elif entry.startswith("longname: "):
-                    longname = entry[10:]
-                elif entry.startswith("argument: "):
-                    argument = entry[10:]
-                elif entry == "hidden":
-                    hidden = True
-                elif entry == "optional":
-                    optional = True
-                elif entry.startswith("help: "):
-                    helptext = entry[7:-1]
-                elif entry.startswith("type: "):
-                    argtype = entry[6:]
-                elif entry == "numopt":
-                    numopt = True
-            match = re.match(r'option (.+)$', optnametag)
-            if not match:
-                raise Exception("I expected better: %s" % optnametag)
-            optname = match.group(1)
-            print("<span class=\"tabstop\"><em>option</em> <strong>%s</strong> <em>%s</em> { " % (optname, argtype), file=f, end='')
-            if shortname != "" and longname != "":
-                optpattern = "%s|%s" % (longname, shortname)
-            elif shortname == "":
-                optpattern = "%s" % longname
+    usagetrim = command["usagetrim"]
+    print("<span class=\"tabstop\"><em>usage</em> { ", file=f, end='')
+    if len(usagetrim) == 1:
+        print("<code>\"%s\"</code> }<br>" % escapehtml(usagetrim[0]), file=f)
+    else:
+        print("<br>", file=f)
+        for L in usagetrim:
+            print("<span class=\"tabstop\"><span class=\"tabstop\"><code>\"%s\"</code>, <br>" % escapehtml(L), file=f)
+        print("<span class=\"tabstop\">}<br>", file=f)
+
+    for opt, fields in zip(command["opts"], command["fields"]):
+        if fields is None:
+            if opt[1] == "groupline":
+                print("<span class=\"tabstop\"><em>groupline</em><br>", file=f)
             else:
-                optpattern = "%s" % shortname
-            print(" <code>\"%s\"</code>" % optpattern, file=f, end='')
-            if hidden:
-                print(", <em>hidden</em>", file=f, end='')
-            if argument != "":
-                print(", <em>arg</em>=\"%s\"" % escapehtml(argument), file=f, end='')
-            if optional:
-                print(", <em>hidden</em>", file=f, end='')
-            if helptext != "":
-                print(", <em>help</em>=\"%s\"" % escapehtml(helptext), file=f, end='')
-            print(" }<br>", file=f)
+                print("<span class=\"tabstop\"><em>textline</em> { \"%s\" }<br>" % escapehtml(opt[1][10:]), file=f)
+            continue
+        (optname, optpattern, argument, hidden, optional, helptext, argtype) = fields
+        print("<span class=\"tabstop\"><em>option</em> <strong>%s</strong> <em>%s</em> { " % (optname, argtype), file=f, end='')
+        print(" <code>\"%s\"</code>" % optpattern, file=f, end='')
+        if hidden:
+            print(", <em>hidden</em>", file=f, end='')
+        if argument != "":
+            print(", <em>arg</em>=\"%s\"" % escapehtml(argument), file=f, end='')
+        if optional:
+            print(", <em>hidden</em>", file=f, end='')
+        if helptext != "":
+            print(", <em>help</em>=\"%s\"" % escapehtml(helptext), file=f, end='')
+        print(" }<br>", file=f)
 
-        print("}<p>", file=f)
+    print("}<p>", file=f)
 
-    return usage, opts
+# Sink name -> writer for a parsed command, in the order they are fed
+commandWriters = [
+    ("parse", writeParsed),
+    ("specs", writeSpecs),
+    ("markdown", writeMarkdown),
+    ("html", writeHtml),
+]
 
 def run_git_usage(cmd):
     rawUsage = []
-    rawhelp = "rawhelp.txt" if writeraw else os.devnull
-    with open(rawhelp, "at", encoding='utf-8') as f:
-        print("-----------------------------------", file=f)
+    cmdline = "git %s -h" % cmd
+    for line in run_command(cmdline):
+        line = utf8_to_string(line).rstrip()
+        rawUsage.append(line)
 
-        cmdline = "git %s -h" % cmd
+    f = sinks.get("raw")
+    if f is not None:
+        print("-----------------------------------", file=f)
         print(cmdline, file=f)
         print("--------", file=f)
-        for line in run_command(cmdline):
-            line = utf8_to_string(line).rstrip()
+        for line in rawUsage:
             print(line, file=f)
-            rawUsage.append(line)
 
     return rawUsage
 
 def run_git_help(cmd):
     rawHelp = []
     rawHelpAll = []
-    rawhelp = "rawhelp.txt" if writeraw else os.devnull
-    with open(rawhelp, "at", encoding='utf-8') as f:
-        print("-----------------------------------", file=f)
+    cmdline = "git %s -h" % cmd
+    for line in run_command(cmdline):
+        line = utf8_to_string(line).rstrip()
+        rawHelp.append(line)
+
+    # Only call --help-all on commands that support it
+    cmdlineAll = "git %s --help-all" % cmd
+    if cmd not in git_commands_no_help_all:
+        for line in run_command(cmdlineAll):
+            line = utf8_to_string(line).rstrip()
+            line = line.rstrip()
+            rawHelpAll.append(line)
 
-        cmdline = "git %s -h" % cmd
+    f = sinks.get("raw")
+    if f is not None:
+        print("-----------------------------------", file=f)
         print(cmdline, file=f)
         print("--------", file=f)
-        for line in run_command(cmdline):
-            line = utf8_to_string(line).rstrip()
+        for line in rawHelp:
             print(line, file=f)
-            rawHelp.append(line)
-
-        # Only call --help-all on commands that support it
         if cmd not in git_commands_no_help_all:
             print("--------", file=f)
-            cmdline = "git %s --help-all" % cmd
-            print(cmdline, file=f)
+            print(cmdlineAll, file=f)
             print("--------", file=f)
-            for line in run_command(cmdline):
-                line = utf8_to_string(line).rstrip()
-                line = line.rstrip()
+            for line in rawHelpAll:
                 print(line, file=f)
-                rawHelpAll.append(line)
 
     return rawHelp, rawHelpAll
 
@@ -7,25 +7,117 @@
 # Read a command-line specification file and create an argparse parser for it
 # (https://docs.python.org/3/library/argparse.html)
 
+import argparse
+import io
 import os
 import sys
 if sys.version_info < (3,5):
     raise Exception("Requires Python 3.5 or greater")
 
+from genlib import compileArgument, hotCommands, packageModes, packageParser, readProfile, readspecs
+
 def main():
-    if len(sys.argv) < 2:
-        print("No specfile supplied\n")
-        return
-    specfile = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Generate an argparse parser from a command-line spec")
+    parser.add_argument("specfile", help="command-line spec to read")
+    parser.add_argument("-o", "--output", default="argparser.py", help="file to write the parser to")
+    parser.add_argument("--slots", action="store_true",
+                        help="return a __slots__ result object per command instead of a Namespace")
+    parser.add_argument("--no-validate", dest="validate", action="store_false",
+                        help="accept any value for options whose argument is a pattern")
+    parser.add_argument("--share-options", dest="share", action="store_true",
+                        help="build options that several commands define identically only once")
+    parser.add_argument("--daemon", action="store_true",
+                        help="add a --serve mode to the parser, and write a client for it")
+    parser.add_argument("--batch", action="store_true",
+                        help="add a --batch mode that parses many command lines in one process")
+    parser.add_argument("--lazy", action="store_true",
+                        help="build each command's subparser only when that command is parsed")
+    parser.add_argument("--sparse", action="store_true",
+                        help="like --lazy, and only add the options that argv mentions")
+    parser.add_argument("--fast-errors", dest="fasterrors", action="store_true",
+                        help="serve errors from prerendered usage, with suggestions for mistyped names")
+    parser.add_argument("--profile",
+                        help="usage profile (a counted log of command lines): build its hot commands eagerly, "
+                             "and move the rest to a module that is only imported to parse them")
+    parser.add_argument("--hot-share", dest="hotshare", type=float, default=0.95,
+                        help="share of the profile's invocations that the hot commands cover (default 0.95)")
+    parser.add_argument("--router", action="store_true",
+                        help="also write a small module that finds the command an argv names, for request routers")
+    parser.add_argument("--gc-tune", dest="gctune", action="store_true",
+                        help="pause garbage collection while the parser is built, then freeze the parser out of it")
+    parser.add_argument("--fast-exit", dest="fastexit", action="store_true",
+                        help="after a successful parse, flush output and exit without tearing down the interpreter")
+    parser.add_argument("--args-files", dest="argsfiles", action="store_true",
+                        help="read @file arguments from files, streaming the lines after their leading options")
+    parser.add_argument("--package", action="append", choices=packageModes, default=[],
+                        help="also package the parser for deployment this way (repeatable)")
+    args = parser.parse_args()
+    if args.sparse and args.share:
+        parser.error("--sparse keeps an option table per command, and can't be used with --share-options")
+    if args.profile and (args.slots or args.share or args.sparse):
+        parser.error("--profile can't be used with --slots, --share-options or --sparse")
+    if args.profile and set(args.package) & {"zipapp", "frozen"}:
+        parser.error("--profile writes a second module, which zipapp and frozen packages don't hold")
 
-    specs = readspecs(specfile)
+    specs = readspecs(args.specfile)
     print("We have %d commands" % len(specs))
-    with open("argparser.py", "wt", encoding='utf-8') as f:
-        genCommands(f, specs)
+    name = os.path.splitext(os.path.basename(args.output))[0]
+
+    # With a profile, the cold commands' subparsers go in a module of their own
+    hot = None
+    cold = io.StringIO()
+    if args.profile:
+        profile = readProfile(args.profile, specs)
+        hot = hotCommands(profile, args.hotshare)
+        total = sum(count for count, argv in profile)
+        covered = sum(count for count, argv in profile if argv[0] in hot)
+        print("Profile: %d invocations, %d hot commands cover %.1f%% (%s)" % (
+            total, len(hot), 100.0 * covered / total, ", ".join(hot)))
+    with open(args.output, "wt", encoding='utf-8') as f:
+        shared = genCommands(f, specs, slots=args.slots, validate=args.validate, share=args.share,
+                             daemon=name if args.daemon else None, batch=args.batch,
+                             lazy=args.lazy, sparse=args.sparse, fasterrors=args.fasterrors,
+                             hot=hot, cold=cold, coldname=name + "_cold", gctune=args.gctune,
+                             fastexit=args.fastexit, argsfiles=args.argsfiles)
+    if hot is not None:
+        coldfile = os.path.join(os.path.dirname(args.output), name + "_cold.py")
+        with open(coldfile, "wt", encoding='utf-8') as f:
+            f.write(cold.getvalue())
+        print("Cold commands: %s, %d bytes" % (coldfile, os.path.getsize(coldfile)))
+
+    # Package it, running it on the first command to find what it imports
+    for mode in args.package:
+        artifact = packageParser(args.output, mode, [specs[0][0]])
+        print("Packaged %s: %s, %d bytes" % (mode, artifact, os.path.getsize(artifact)))
+
+    # The daemon client is its own small file, so that it starts quickly
+    if args.daemon:
+        clientfile = os.path.join(os.path.dirname(args.output), name + "_client.py")
+        with open(clientfile, "wt", encoding='utf-8') as f:
+            print(clientTemplate.format(name=name, upper=name.upper()), file=f)
+
+    # The router is its own small file too, so that it imports nothing
+    if args.router:
+        routefile = os.path.join(os.path.dirname(args.output), name + "_route.py")
+        with open(routefile, "wt", encoding='utf-8') as f:
+            genRouter(f, specs, name, daemon=args.daemon, batch=args.batch)
+
+    # Say how much code sharing saved, by generating the unshared form again
+    if args.share:
+        unshared = io.StringIO()
+        genCommands(unshared, specs, slots=args.slots, validate=args.validate, lazy=args.lazy,
+                    fasterrors=args.fasterrors, argsfiles=args.argsfiles)
+        size = os.path.getsize(args.output)
+        unsharedsize = len(unshared.getvalue().encode('utf-8'))
+        print("Shared %d option definitions: %d bytes of code instead of %d (%.0f%% smaller)" % (
+            shared, size, unsharedsize, 100.0 * (unsharedsize - size) / unsharedsize))
 
 # -----------------------------------------------------------------------------------------------
 
-def genCommands(f, specs):
+def genCommands(f, specs, slots=False, validate=True, share=False, daemon=None, batch=False,
+                lazy=False, sparse=False, fasterrors=False, hot=None, cold=None, coldname=None,
+                gctune=False, fastexit=False, argsfiles=False):
+    lazy = lazy or sparse or hot is not None
 
     # translate table to fix up strings with quotes in them
     fixquot = str.maketrans({"'": r"\'"})
@@ -36,18 +128,40 @@ def genCommands(f, specs):
         (cmdid, cmdname, usage, opts) = spec
         # print("Generating code for %s" % cmdname)
 
-        subparser = "    subparser_%s(subparsers)\n" % cmdid
+        if hot is not None and cmdid in hot:
+            subparser = "    subparsers.add_lazy('%s', subparser_%s)\n" % (cmdid, cmdid)
+        elif hot is not None:
+            subparser = "    subparsers.add_lazy('%s', cold_subparser('%s'))\n" % (cmdid, cmdid)
+        elif sparse:
+            subparser = "    subparsers.add_lazy('%s', subparser_%s, options_%s)\n" % (cmdid, cmdid, cmdid)
+        elif lazy:
+            subparser = "    subparsers.add_lazy('%s', subparser_%s)\n" % (cmdid, cmdid)
+        else:
+            subparser = "    subparser_%s(subparsers)\n" % cmdid
         callsub += subparser
 
-    # Now generate the parsers themselves
-    subs = ""
+    # Now generate the parsers themselves, and with slots, a result class per
+    # command whose defaults live in the class rather than in every result.
+    # The subparser code is collected as pieces of text and (options, kwargs)
+    # add_argument calls, so that identical calls can be found and shared.
+    # Sparse subparsers add their options from a table instead, for which
+    # the same (options, kwargs) pieces become table entries.
+    subs = []
+    starts = []
+    results = ""
+    patterns = False
+    choices = False
     for spec in specs:
         (cmdid, cmdname, usage, opts) = spec
         # print("Generating code for %s" % cmdname)
 
-        subs += "\n# ---------------------------------\n\n"
-        subs += "def subparser_%s(subparsers):\n" % cmdid
-        # subs += "    pass\n"
+        starts.append(len(subs))
+        subs.append("\n# ---------------------------------\n\n")
+        if sparse:
+            subs.append("def subparser_%s(subparsers, wanted=None):\n" % cmdid)
+        else:
+            subs.append("def subparser_%s(subparsers):\n" % cmdid)
+        # subs.append("    pass\n")
 
         # Build usage string
         usagetext = ""
@@ -61,26 +175,37 @@ def genCommands(f, specs):
             # Escape quotes in help text
             usagetext = usagetext.translate(fixquot)
 
-        subs += "    subparser = subparsers.add_parser('{cmdid}', usage='{usage}')\n".format(cmdid=cmdid, usage=usagetext)
+        if slots:
+            resultclass = cmdid[0].upper() + cmdid[1:] + "Result"
+            subs.append("    subparser = subparsers.add_parser('{cmdid}', usage='{usage}', argument_default=argparse.SUPPRESS)\n".format(
+                cmdid=cmdid, usage=usagetext))
+            subs.append("    subparser.set_defaults(_result=%s)\n" % resultclass)
+        else:
+            subs.append("    subparser = subparsers.add_parser('{cmdid}', usage='{usage}')\n".format(cmdid=cmdid, usage=usagetext))
+        if sparse:
+            subs.append("    add_options(subparser, options_%s, wanted)\n" % cmdid)
+            subs.append("    return subparser\n\n")
+            subs.append("options_%s = [\n" % cmdid)
+        defaults = {}
 
         # Build options
         for opt in opts:
             if opt[0] == "groupline":
-                subs += "    # groupline functionality needs a custom formatter_class\n"
+                subs.append("    # groupline functionality needs a custom formatter_class\n")
             elif opt[0] == "textline":
-                subs += "    # textline functionality needs a custom formatter_class\n"
+                subs.append("    # textline functionality needs a custom formatter_class\n")
                 pass
             else:
                 (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
 
                 # We can't handle numopt yet
                 if numopt:
-                    subs += "    # %s can't handle numopt yet\n" % optname
+                    subs.append("    # %s can't handle numopt yet\n" % optname)
                     continue
 
                 # An option with just a shortname of -h can't be parsed at the moment
                 if shortname == "h" and len(longname) == 0:
-                    subs += "    # %s tried to define -h which conflicts with help\n" % cmdname
+                    subs.append("    # %s tried to define -h which conflicts with help\n" % cmdname)
                     continue
 
                 optlist = ""
@@ -88,7 +213,7 @@ def genCommands(f, specs):
                     optlist = "'--" + longname + "'"
                 if len(shortname) > 0:
                     if shortname == "h":
-                        subs += "    # %s tried to add -h which conflicts with help\n" % longname
+                        subs.append("    # %s tried to add -h which conflicts with help\n" % longname)
                     else:
                         if len(optlist) > 0:
                             optlist += ", "
@@ -99,181 +224,1202 @@ def genCommands(f, specs):
                     actiontext = ", action='store_true'"
                 elif argtype == "string":
                     actiontext = ""
+                    check = compileArgument(argument) if validate else None
+                    if check is not None and check[0] == "choices":
+                        actiontext = ", choices=Choices((%s)), metavar=%r" % (
+                            "".join("%r, " % value for value in check[1]), argument)
+                        choices = True
+                    elif check is not None:
+                        actiontext = ", type=Pattern(%r, %r)" % (check[1], argument)
+                        patterns = True
                 elif argtype == "int":
                     actiontext = ", type=int"
 
                 # add warning if hidden
                 if hidden:
-                    subs += "    # %s should be marked hidden, but that needs a custom formatter_class\n" % longname
+                    subs.append("    # %s should be marked hidden, but that needs a custom formatter_class\n" % longname)
 
                 # Escape quotes in help text
                 helptext = helptext.translate(fixquot)
 
-                subs += "    subparser.add_argument({options}, dest='{dest}'{action}, help='{help}')\n".format(
-                    options=optlist, dest=optname, action=actiontext, help=helptext)
+                # Slots have to be identifiers, so dests like 3way become _3way
+                if slots and not optname.isidentifier():
+                    optname = "_" + optname
+
+                subs.append((optlist, "dest='{dest}'{action}, help='{help}'".format(
+                    dest=optname, action=actiontext, help=helptext)))
+                defaults.setdefault(optname, False if argtype == "bool" else None)
+
+        if sparse:
+            subs.append("]\n")
+        elif lazy:
+            subs.append("    return subparser\n")
+
+        if slots:
+            results += "\nclass %s(Result):\n" % resultclass
+            results += "    __slots__ = (%s)\n" % "".join("'%s', " % dest for dest in defaults)
+            results += "    _defaults = {%s}\n" % ", ".join("'%s': %r" % (dest, defaults[dest]) for dest in defaults)
+
+    # With sharing, an add_argument call made by more than one command goes
+    # into a table, in order of first use, and each command refers to it by index
+    sharedindex = {}
+    if share:
+        counts = {}
+        for item in subs:
+            if isinstance(item, tuple):
+                counts[item] = counts.get(item, 0) + 1
+        for call, count in counts.items():
+            if count > 1:
+                sharedindex[call] = len(sharedindex)
+
+    # With a profile, the code of the cold commands goes to their own module
+    text = ""
+    coldtext = ""
+    starts.append(len(subs))
+    for n, spec in enumerate(specs):
+        piece = ""
+        for item in subs[starts[n]:starts[n + 1]]:
+            if not isinstance(item, tuple):
+                piece += item
+            elif sparse:
+                piece += "    (({options},), dict({kwargs})),\n".format(options=item[0], kwargs=item[1])
+            elif item in sharedindex:
+                piece += "    add_shared(subparser, %d)\n" % sharedindex[item]
+            else:
+                piece += "    subparser.add_argument(%s, %s)\n" % item
+        if hot is None or spec[0] in hot:
+            text += piece
+        else:
+            coldtext += piece
+    if hot is not None:
+        patterns = "type=Pattern(" in text
+        choices = "choices=Choices(" in text
+        coldvalidators = choicesTemplate if "choices=Choices(" in coldtext else ""
+        if "type=Pattern(" in coldtext:
+            coldvalidators += patternTemplate
+        print(coldTemplate.format(validators=coldvalidators, subparsers=coldtext.rstrip()), file=cold)
+
+    shared = ""
+    if sharedindex:
+        table = "".join("    (({options},), dict({kwargs})),\n".format(options=options, kwargs=kwargs)
+                        for (options, kwargs) in sharedindex)
+        shared = sharedTemplate.format(table=table.rstrip())
 
     # Output everything
     callsub = callsub.rstrip()
-    subs = subs.rstrip()
-    print(parserTemplate.format(insertsubparsers=callsub, subparsers=subs), file=f)
+    subs = text.rstrip()
+    parsecall = "parser.parse_args(expanded)"
+    if slots:
+        results = resultTemplate + results
+    validators = choicesTemplate if choices else ""
+    if patterns:
+        validators += patternTemplate
+    addsubparsers = ""
+    if lazy:
+        addsubparsers = "action=SparseSubParsersAction" if sparse else "action=LazySubParsersAction"
+        validators += lazyTemplate
+    if sparse:
+        validators += sparseTemplate
+    prebuild = ""
+    if lazy:
+        prebuild = "        build_all(self._parser)\n"
+    if hot is not None:
+        validators += hybridTemplate.format(coldname=coldname)
+    parserclass = "Parser"
+    if fasterrors:
+        parserclass = "ErrorParser"
+        grams = {}
+        for spec in specs:
+            for gram in sorted(nameGrams(spec[0])):
+                grams.setdefault(gram, []).append(spec[0])
+        table = "".join("        %r: (%s),\n" % (gram, "".join("%r, " % name for name in grams[gram]))
+                        for gram in sorted(grams))
+        validators += errorTemplate + commandIndexTemplate.format(table=table.rstrip())
+        prebuild += "        build_indexes(self._parser)\n"
+    topclass = parserclass
+    if slots:
+        topclass = "ResultParser"
+        validators += resultParserTemplate.format(parserclass=parserclass)
+        if addsubparsers:
+            addsubparsers += ", "
+        addsubparsers += "parser_class=%s" % parserclass
+    serveopt = ""
+    if daemon is not None:
+        serveopt += serveOptTemplate
+        shared += daemonTemplate.format(name=daemon, upper=daemon.upper())
+    if batch:
+        serveopt += batchOptTemplate
+        shared += batchTemplate
+    if daemon is not None or batch:
+        shared += captureTemplate
+    gcpause = gcresume = ""
+    if gctune:
+        gcpause = "    collecting = pause_gc()\n"
+        gcresume = "    resume_gc(collecting)\n"
+        shared += gcTemplate
+    exitcall = ""
+    if fastexit:
+        exitcall = "    fast_exit(0)\n"
+        shared += fastExitTemplate
+    imports = ""
+    parseargs = parseArgsTemplate.format(parsecall=parsecall)
+    if argsfiles:
+        imports = "import itertools\n"
+        parseargs = argsFileTemplate.format(parsecall=parsecall)
+    print(parserTemplate.format(insertsubparsers=callsub, subparsers=subs, results=results,
+                                validators=validators, shared=shared, parsecall=parsecall,
+                                imports=imports, parseargs=parseargs,
+                                serveopt=serveopt, addsubparsers=addsubparsers, parserclass=topclass,
+                                prebuild=prebuild, gcpause=gcpause, gcresume=gcresume, exitcall=exitcall), file=f)
+    return len(sharedindex)
+
+# Write the command table of the router: each command's id and git name lead
+# to its id, and the first word of a two-word name to the second words
+def genRouter(f, specs, name, daemon=False, batch=False):
+    words = {}
+    for (cmdid, cmdname, usage, opts) in specs:
+        words.setdefault(cmdid, [None, {}])[0] = cmdid
+        path = cmdname.split()
+        if len(path) == 1:
+            words.setdefault(path[0], [None, {}])[0] = cmdid
+        else:
+            words.setdefault(path[0], [None, {}])[1][path[1]] = cmdid
+    table = "".join("    %r: (%r, %s),\n" % (word, command, ("{%s}" % ", ".join(
+        "%r: %r" % item for item in sorted(second.items()))) if second else None)
+        for word, (command, second) in sorted(words.items()))
+
+    # The parser's own options that can come before the command: --help as
+    # argparse abbreviates it, and the modes main() checks for
+    options = {"-h": "help"}
+    options.update(("--help"[:n], "help") for n in range(3, 7))
+    if daemon:
+        options["--serve"] = "serve"
+    if batch:
+        options["--batch"] = "batch"
+    print(routeTemplate.format(name=name, table=table.rstrip(), options="".join(
+        "    %r: %r,\n" % item for item in sorted(options.items())).rstrip()), file=f)
+
+# The bigrams of a name, as name_grams in the generated parser makes them
+def nameGrams(name):
+    name = '^' + name + '$'
+    return {name[i:i + 2] for i in range(len(name) - 1)}
 
 parserTemplate = """# parser
 
+import _thread
 import argparse
+{imports}import sys
 
 def main():
-    parser = create_parser()
-    args = parser.parse_args()
+{serveopt}    args = parse_args()
     # print(args)
+{exitcall}
+{parseargs}
+# ---------------------------------
+
+# A built parser that can be shared between threads. It only offers parse(),
+# and every parse keeps its state to itself. Parsing fills in some of the
+# parser as it goes (lazily built subparsers, the sparse option tables, the
+# indexes of suggestions for bad input), so all of that is made here, after
+# which parsing only reads the parser: the caches still written to, of usage
+# text and suggestions, are single dict stores of what every thread would
+# compute alike. Whatever a parse would print, or the exit it would make, is
+# collected per thread and raised as ParseExit instead of touching the process.
+class CompiledParser:
+    __slots__ = ('_parser',)
+
+    def __init__(self):
+        object.__setattr__(self, '_parser', create_parser())
+{prebuild}
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledParser is immutable')
+
+    # Parse argv as given (no @file expansion)
+    def parse(self, argv):
+        parser = self._parser
+        expanded = list(argv)
+        calls.output = ([], [])
+        try:
+            return {parsecall}
+        finally:
+            calls.output = None
+
+class ParseExit(Exception):
+    def __init__(self, status, stdout, stderr):
+        Exception.__init__(self, status, stdout, stderr)
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+
+# Per-thread output of CompiledParser.parse calls. _thread._local is
+# threading.local, without importing threading on every start.
+calls = _thread._local()
+
+# ArgumentParser that hands its output and exit to the CompiledParser.parse
+# call running on this thread, if any, and otherwise behaves as usual
+class Parser(argparse.ArgumentParser):
+    def _print_message(self, message, file=None):
+        output = getattr(calls, 'output', None)
+        if output is None:
+            return argparse.ArgumentParser._print_message(self, message, file)
+        if message:
+            output[file is sys.stderr].append(message)
+
+    def exit(self, status=0, message=None):
+        output = getattr(calls, 'output', None)
+        if output is None:
+            return argparse.ArgumentParser.exit(self, status, message)
+        if message:
+            output[1].append(message)
+        raise ParseExit(status, ''.join(output[0]), ''.join(output[1]))
 
 def create_parser():
-    parser = argparse.ArgumentParser()
-    subparsers = parser.add_subparsers()
+{gcpause}    parser = {parserclass}()
+    subparsers = parser.add_subparsers({addsubparsers})
 
 {insertsubparsers}
 
-    return parser
+{gcresume}    return parser
+{results}{validators}{shared}
 {subparsers}
 
 if __name__ == '__main__':
     main()
 """
 
-# -----------------------------------------------------------------------------------------------
+choicesTemplate = """
+# ---------------------------------
+
+# The values an option allows, for its choices: a frozenset, so checking one
+# is a hash lookup, that iterates in the order the spec gives them, so the
+# 'choose from' list of an invalid choice error is always the same.
+class Choices(frozenset):
+    __slots__ = ('order',)
+
+    def __new__(cls, values):
+        self = frozenset.__new__(cls, values)
+        self.order = values
+        return self
+
+    def __iter__(self):
+        return iter(self.order)
+"""
+
+patternTemplate = """
+# ---------------------------------
+
+# Type function for options whose argument pattern has fixed structure around
+# open placeholders. The regex is compiled once, on first use.
+class Pattern:
+    def __init__(self, regex, metavar):
+        self.regex = regex
+        self.compiled = None
+        self.__name__ = metavar
+
+    def __call__(self, value):
+        if self.compiled is None:
+            import re
+            self.compiled = re.compile(self.regex, re.DOTALL)
+        if self.compiled.fullmatch(value) is None:
+            raise argparse.ArgumentTypeError("'%s' does not match %s" % (value, self.__name__))
+        return value
+"""
+
+coldTemplate = """# parser, cold commands
 
-# Read the command-spec file into a data structure
-# A file looks like this:
-#    command add
-#        usage
-#            "usage: git add [<options>] [--] <pathspec>..."
-#        option dryRun
-#            shortname: n
-def readspecs(specfile):
-    cmds = []
-    with open(specfile, "rt", encoding='utf-8') as f:
-        n = 1
-        line = f.readline().rstrip()
-        # print("%d: %s" % (n, line))
-        while line:
-
-            # We must be at a "command xxx" line. Parse the command name, and strip
-            # a trailing " cmd" text annotation to just get the text of the command,
-            # since that's what argparse is going to want
-            if not line.startswith("command "):
-                raise Exception("expected 'command' in line %d: got '%s'" % (n, line))
-            cmdid = line[8:]
-            cmdname = cmdid
-            textoffset = cmdid.find(" \"")
-            if textoffset != -1:
-                cmdname = cmdid[textoffset+2:-1]
-                cmdid = cmdid[:textoffset]
-
-            # Parse usage and options
-            usage, line, n = readcmdusage(f, n)
-            opts, line, n = readcmdoptions(f, line, n)
-
-            # Put into a data structure
-            cmd = [cmdid, cmdname, usage, opts]
-            cmds.append(cmd)
-
-    return cmds
-
-# Read the usage section
-def readcmdusage(f, n):
-    # We expect a usage header
-    line = f.readline().rstrip()
-    if line.lstrip() != "usage":
-        raise Exception("expected 'usage' in line %d: got '%s'" % (n, line))
-
-    # Read usage until we see the first option, or the next command
-    # (if there are no options)
-    usage = []
-    while line:
-        n = n + 1
-        # print("%d: %s" % (n, line))
-        line = line.lstrip()
-
-        if line.startswith("option") or line.startswith("command "):
+# The subparsers of the commands that the usage profile found cold. The parser
+# imports this module the first time one of them is parsed.
+
+import argparse
+{validators}
+{subparsers}
+"""
+
+sharedTemplate = """
+# ---------------------------------
+
+# Options defined identically by more than one command. Each becomes an Action
+# once, in the first subparser that uses it, and that same Action is added to
+# every later subparser, the way argparse shares the actions of parents.
+shared_options = [
+{table}
+]
+shared_actions = [None] * len(shared_options)
+
+def add_shared(subparser, index):
+    action = shared_actions[index]
+    if action is None:
+        options, kwargs = shared_options[index]
+        shared_actions[index] = subparser.add_argument(*options, **kwargs)
+    else:
+        subparser._add_action(action)
+"""
+
+lazyTemplate = """
+# ---------------------------------
+
+# Lazily built subparsers. Every command name is registered up front, so usage,
+# help and invalid-choice errors are unchanged, but a command's subparser is
+# only built the first time that command is parsed.
+class LazyCommands(dict):
+    def __init__(self, action):
+        dict.__init__(self)
+        self.action = action
+
+    def __getitem__(self, name):
+        parser = dict.__getitem__(self, name)
+        if not isinstance(parser, argparse.ArgumentParser):
+            parser = parser(self.action)
+            self[name] = parser
+        return parser
+
+class LazySubParsersAction(argparse._SubParsersAction):
+    def __init__(self, *args, **kwargs):
+        argparse._SubParsersAction.__init__(self, *args, **kwargs)
+        self._name_parser_map = self.choices = LazyCommands(self)
+
+    # Register a command with the function that builds its subparser
+    def add_lazy(self, name, build):
+        self._name_parser_map[name] = build
+
+    # Make a subparser; LazyCommands keeps it
+    def add_parser(self, name, **kwargs):
+        kwargs.setdefault('prog', '%s %s' % (self._prog_prefix, name))
+        return self._parser_class(**kwargs)
+
+# Build the subparser of every command, as a CompiledParser, which lives to
+# parse many command lines and may be shared between threads, wants
+def build_all(parser):
+    choices = parser._subparsers._group_actions[0].choices
+    for name in list(choices):
+        choices[name]
+"""
+
+hybridTemplate = """
+# ---------------------------------
+
+# Profile-guided build. Every command is registered lazily, but only the code
+# of the hot commands is in this module: the cold ones are registered with a
+# builder that imports {coldname}, where their code is, the first time one of
+# them is parsed. A CompiledParser builds them all up front, with build_all.
+def cold_subparser(name):
+    def build(subparsers):
+        import {coldname}
+        return getattr({coldname}, 'subparser_' + name)(subparsers)
+    return build
+"""
+
+sparseTemplate = """
+# ---------------------------------
+
+# Sparse subparsers. Each command's options are kept in a table, and when argv
+# names a command whose subparser hasn't been built, a subparser is made for
+# just that argv: the options its arguments mention (exactly, or by an
+# unambiguous prefix), and any that look like negative numbers, since those
+# change how argparse reads '-1'. The rest only contribute their defaults.
+# Whatever the scan can't settle (-h, an ambiguous prefix, an unknown option)
+# is parsed with the full subparser, so results and errors are the same as
+# with full construction.
+class SparseSubParsersAction(LazySubParsersAction):
+    def __init__(self, *args, **kwargs):
+        LazySubParsersAction.__init__(self, *args, **kwargs)
+        self.tables = {}
+
+    def add_lazy(self, name, build, table):
+        self._name_parser_map[name] = build
+        self.tables[name] = table
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        name = values[0]
+        build = dict.get(self._name_parser_map, name)
+        wanted = None
+        if build is not None and not isinstance(build, argparse.ArgumentParser):
+            wanted = sparse_wanted(name, self.tables[name], values[1:])
+        if wanted is None:
+            return LazySubParsersAction.__call__(self, parser, namespace, values, option_string)
+
+        # As _SubParsersAction.__call__, with the subparser made for this argv
+        if self.dest is not argparse.SUPPRESS:
+            setattr(namespace, self.dest, name)
+        subnamespace, arg_strings = build(self, wanted).parse_known_args(values[1:], None)
+        for key, value in vars(subnamespace).items():
+            setattr(namespace, key, value)
+        if arg_strings:
+            vars(namespace).setdefault(argparse._UNRECOGNIZED_ARGS_ATTR, [])
+            getattr(namespace, argparse._UNRECOGNIZED_ARGS_ATTR).extend(arg_strings)
+
+# Add the options of a table to a subparser; with wanted, only the entries
+# with those indexes, and the defaults of the others
+def add_options(subparser, table, wanted=None):
+    if wanted is None:
+        for options, kwargs in table:
+            subparser.add_argument(*options, **kwargs)
+        return
+    defaults = {}
+    for index, (options, kwargs) in enumerate(table):
+        if index in wanted:
+            subparser.add_argument(*options, **kwargs)
+        defaults.setdefault(kwargs['dest'], False if kwargs.get('action') == 'store_true' else None)
+    if subparser.argument_default is not argparse.SUPPRESS:
+        subparser.set_defaults(**defaults)
+
+# Per command: long option name -> index, short option letter -> (index,
+# takes a value), and the indexes of options that look like negative numbers
+sparse_indexes = {}
+
+def sparse_index(name, table):
+    index = sparse_indexes.get(name)
+    if index is None:
+        longs = {}
+        shorts = {}
+        numbers = set()
+        for i, (options, kwargs) in enumerate(table):
+            for option in options:
+                if option.startswith('--'):
+                    longs[option[2:]] = i
+                else:
+                    shorts[option[1:]] = (i, kwargs.get('action') != 'store_true')
+                    if option[1:].isdigit():
+                        numbers.add(i)
+        index = sparse_indexes[name] = (longs, shorts, numbers)
+    return index
+
+# The indexes of the options that args need, or None if the full subparser is
+# needed. Short options can be clustered (-nv), and the first one that takes a
+# value ends the cluster (-mmessage).
+def sparse_wanted(name, table, args):
+    longs, shorts, numbers = sparse_index(name, table)
+    wanted = set(numbers)
+    for arg in args:
+        if arg == '--':
             break
-        usage.append(line[1:-1])
+        if arg[:1] != '-' or arg == '-':
+            continue
+        if arg.startswith('--'):
+            option = arg[2:].split('=', 1)[0]
+            i = longs.get(option)
+            if i is None:
+                if 'help'.startswith(option):
+                    return None
+                matches = [long for long in longs if long.startswith(option)]
+                if len(matches) != 1:
+                    return None
+                i = longs[matches[0]]
+            wanted.add(i)
+        else:
+            for c in arg[1:]:
+                short = shorts.get(c)
+                if short is None:
+                    return None
+                wanted.add(short[0])
+                if short[1]:
+                    break
+    return wanted
+"""
+
+errorTemplate = """
+# ---------------------------------
+
+# Parser with a fast error path. Every subparser has an explicit usage, which
+# is printed as it is instead of through a HelpFormatter, and the top-level
+# usage is formatted once per program name and width. An unknown option is
+# reported by the subparser of its command, with its usage, rather than by the
+# top-level parser with the usage of every command. Mistyped long options and
+# command names get a suggestion from an index of their names: the index of a
+# command's options is made the first time it's needed, and the index of the
+# command names is made when the parser is generated.
+class ErrorParser(Parser):
+    def format_usage(self):
+        if self.usage is not None and '%' not in self.usage:
+            return 'usage: %s\\n' % self.usage
+        import shutil
+        key = (self.prog, shutil.get_terminal_size().columns)
+        usage = usage_cache.get(key)
+        if usage is None:
+            usage = usage_cache[key] = Parser.format_usage(self)
+        return usage
+
+    def error(self, message):
+        self._print_message(self.format_usage(), sys.stderr)
+        self.exit(2, '%s: error: %s\\n' % (self.prog, message))
+
+    # Unrecognized arguments are reported by the subparser of the command argv
+    # names, with its usage, and a mistyped long option gets a suggestion.
+    # parse_known_args() is left as it is, so that a caller passing unknown
+    # arguments through still gets them back.
+    def parse_args(self, args=None, namespace=None):
+        if args is None:
+            args = sys.argv[1:]
+        namespace, extras = self.parse_known_args(args, namespace)
+        if extras:
+            parser = self._command_parser(args)
+            parser.error(parser._unrecognized(extras))
+        return namespace
+
+    # The subparser of the command argv names, or this parser if it names none.
+    # The top-level parser has no option that takes a value, so the command
+    # is the first argument that isn't an option.
+    def _command_parser(self, args):
+        if self._subparsers is None:
+            return self
+        choices = self._subparsers._group_actions[0].choices
+        for arg in args:
+            if not arg.startswith('-'):
+                return choices[arg] if arg in choices else self
+        return self
+
+    def _unrecognized(self, extras):
+        message = 'unrecognized arguments: %s' % ' '.join(extras)
+        for extra in extras:
+            if extra.startswith('--'):
+                match = option_index(self).suggest(extra[2:].split('=', 1)[0])
+                if match is not None:
+                    message += ' (did you mean --%s?)' % match
+                    break
+        return message
+
+    def _check_value(self, action, value):
+        try:
+            Parser._check_value(self, action, value)
+        except argparse.ArgumentError as err:
+            if isinstance(action, argparse._SubParsersAction) and isinstance(value, str):
+                match = choice_index(action).suggest(value)
+                if match is not None:
+                    err.message += ', maybe you meant %r?' % match
+            raise
+
+# The index of a parser's long options, made the first time it's wanted
+def option_index(parser):
+    index = getattr(parser, '_suggest_index', None)
+    if index is None:
+        index = parser._suggest_index = NameIndex(s[2:] for s in parser._option_string_actions if s.startswith('--'))
+    return index
+
+# The index of the command names, made the first time it's wanted
+def choice_index(action):
+    index = getattr(action, '_suggest_index', None)
+    if index is None:
+        index = action._suggest_index = command_index()
+    return index
+
+# Make every index of suggestions, for a CompiledParser. Its commands are
+# already built.
+def build_indexes(parser):
+    option_index(parser)
+    if parser._subparsers is not None:
+        action = parser._subparsers._group_actions[0]
+        choice_index(action)
+        for subparser in action.choices.values():
+            option_index(subparser)
+
+# Rendered top-level usage, by (program name, terminal width)
+usage_cache = {}
 
-        line = f.readline().rstrip()
+# Bigram index over a set of names, for suggesting the name nearest to a
+# mistyped one. The names sharing the most bigrams with the word are checked
+# by edit distance (with transpositions), and the nearest within a third of
+# the word's length is suggested. Suggestions are remembered, since the same
+# bad input tends to come again.
+class NameIndex:
+    def __init__(self, names=(), grams=None):
+        if grams is None:
+            grams = {}
+            for name in names:
+                for gram in name_grams(name):
+                    grams.setdefault(gram, []).append(name)
+        self.grams = grams
+        self.suggested = {}
 
-    return usage, line, n
+    def suggest(self, word, candidates=3):
+        if word in self.suggested:
+            return self.suggested[word]
+        shared = {}
+        for gram in name_grams(word):
+            for name in self.grams.get(gram, ()):
+                shared[name] = shared.get(name, 0) + 1
+        limit = max(1, len(word) // 3)
+        best = None
+        for name in sorted(shared, key=lambda name: (-shared[name], abs(len(name) - len(word))))[:candidates]:
+            if abs(len(name) - len(word)) <= limit:
+                distance = edit_distance(word, name, limit)
+                if distance <= limit:
+                    best, limit = name, distance - 1
+        if len(self.suggested) < 1024:
+            self.suggested[word] = best
+        return best
 
-# Read the option sections
-def readcmdoptions(f, line, n):
-    opts = []
+def name_grams(name):
+    name = '^' + name + '$'
+    return {name[i:i + 2] for i in range(len(name) - 1)}
 
-    # Keep reading until we see command or end of file
-    while line:
-        if line.startswith("command "):
+# Levenshtein distance, counting a swap of adjacent characters as one edit.
+# Past limit, the exact distance doesn't matter and limit + 1 is returned.
+def edit_distance(a, b, limit):
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+    return row[-1]
+"""
+
+commandIndexTemplate = """
+# Bigram index of the command names
+def command_index():
+    return NameIndex(grams={{
+{table}
+    }})
+"""
+
+gcTemplate = """
+# ---------------------------------
+
+# Building the parser makes thousands of objects and no garbage, so the cyclic
+# collections it sets off only walk the parser again and again. Collection is
+# paused while it is built, and the finished parser is frozen (from Python 3.7)
+# into the permanent generation, which later collections don't look at. With
+# lazy subparsers, a subparser built on first use isn't covered.
+def pause_gc():
+    import gc
+    collecting = gc.isenabled()
+    gc.disable()
+    return collecting
+
+def resume_gc(collecting):
+    import gc
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+    if collecting:
+        gc.enable()
+"""
+
+fastExitTemplate = """
+# ---------------------------------
+
+# Leave once main() is done, without tearing down the interpreter, which would
+# free the parser and every module object by object. Buffered output is
+# flushed first, but atexit handlers don't run. Errors and --help still exit
+# the usual way, through SystemExit.
+def fast_exit(status):
+    import os
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except (OSError, ValueError):
+        status = status or 120
+    os._exit(status)
+"""
+
+serveOptTemplate = """    if sys.argv[1:2] == ['--serve']:
+        return serve(*sys.argv[2:4])
+"""
+
+daemonTemplate = """
+# ---------------------------------
+
+# Parse daemon. "argparser.py --serve [SOCKET [IDLE_SECONDS]]" builds the parser
+# once and answers {name}_client.py over a Unix domain socket until it has been
+# idle for IDLE_SECONDS (600 by default). Each request is a JSON line holding
+# argv; each reply is a JSON line with the parsed options, the help or error
+# text argparse wrote, and the exit code. A request that isn't a JSON object
+# with an argv list of strings gets a usage error reply, with exit code 2.
+# argv is parsed as given, so @file arguments are not expanded.
+def default_socket():
+    import os
+    return os.environ.get('{upper}_SOCKET') or os.path.join(os.environ.get('TMPDIR', '/tmp'), '{name}-%d.sock' % os.getuid())
+
+def serve(path=None, idle=600):
+    import json
+    import os
+    import signal
+    import socket
+    import socketserver
+    import threading
+    import time
+
+    path = path or default_socket()
+    idle = float(idle)
+    parser = CompiledParser()
+    lock = threading.Lock()
+    state = {{'active': 0, 'last': time.monotonic()}}
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                with lock:
+                    state['active'] += 1
+                try:
+                    reply = capture_parse(parser, request_argv(line))
+                except (ValueError, KeyError, TypeError) as err:
+                    reply = {{'args': None, 'stdout': '', 'stderr': 'error: bad request: %s\\n' % err, 'exit': 2}}
+                finally:
+                    with lock:
+                        state['active'] -= 1
+                        state['last'] = time.monotonic()
+                self.wfile.write(json.dumps(reply).encode('utf-8') + b'\\n')
+                self.wfile.flush()
+
+    # The argv of a request line, which has to be a JSON object whose argv is
+    # a list of strings
+    def request_argv(line):
+        argv = json.loads(line)['argv']
+        if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+            raise TypeError('argv is not a list of strings')
+        return argv
+
+    # A socket file nobody answers on is left over from a daemon that died
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            raise Exception('a parse daemon is already serving %s' % path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+        finally:
+            probe.close()
+
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+
+    def watchdog():
+        while True:
+            time.sleep(min(idle, 1.0))
+            with lock:
+                if state['active'] == 0 and time.monotonic() - state['last'] > idle:
+                    break
+        server.shutdown()
+    threading.Thread(target=watchdog, daemon=True).start()
+
+    # Clean up the socket file when asked to stop as well
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.unlink(path)
+"""
+
+captureTemplate = """
+# ---------------------------------
+
+# Parse argv as given (no @file expansion) with a CompiledParser, turning what
+# argparse would have printed and its exit status into a reply dict.
+def capture_parse(compiled, argv):
+    try:
+        values = result_values(compiled.parse(argv))
+    except ParseExit as e:
+        return {'args': None, 'stdout': e.stdout, 'stderr': e.stderr, 'exit': e.status}
+    return {'args': values, 'stdout': '', 'stderr': '', 'exit': 0}
+
+# The parsed options of a Namespace or a slotted result, as a dict
+def result_values(args):
+    if isinstance(args, argparse.Namespace):
+        return vars(args)
+    return {name: getattr(args, name) for name in args._defaults}
+"""
+
+batchOptTemplate = """    if sys.argv[1:2] == ['--batch']:
+        return batch_main(sys.argv[2:])
+"""
+
+batchTemplate = """
+# ---------------------------------
+
+# Batch parsing. "argparser.py --batch [FILE]" reads one command line per line
+# of FILE (stdin by default), either as shell words or as a JSON list, and
+# writes one JSON line per input line with the parsed options, the error text
+# and the exit status. A leading word naming the program (git) is dropped.
+# Results are memoized per argv in a bounded LRU, and with --jobs the misses
+# are parsed by a process pool. Throughput and the cache hit rate go to stderr.
+def batch_main(argv):
+    import json
+    import time
+
+    options = argparse.ArgumentParser(prog='argparser.py --batch', description='Parse many command lines')
+    options.add_argument('input', nargs='?', default='-', help='file of command lines, - for stdin')
+    options.add_argument('--jobs', type=int, default=1, help='worker processes to parse with')
+    options.add_argument('--cache', type=int, default=65536, help='number of distinct results to remember')
+    options.add_argument('--program', default='git', help='leading word to drop from each line')
+    options = options.parse_args(argv)
+
+    source = sys.stdin if options.input == '-' else open(options.input, 'rt', encoding='utf-8')
+    start = time.perf_counter()
+    stats = {}
+    argvs = (split_command_line(line, options.program) for line in source)
+    write = sys.stdout.write
+    for argv, reply in parse_batch(argvs, jobs=options.jobs, cachesize=options.cache, stats=stats):
+        write(reply)
+        write('\\n')
+    seconds = time.perf_counter() - start
+
+    lines = stats['hits'] + stats['misses']
+    print('%d command lines in %.2f s (%.0f lines/s), %d cache hits (%.1f%%)' % (
+        lines, seconds, lines / seconds if seconds else 0.0, stats['hits'],
+        100.0 * stats['hits'] / lines if lines else 0.0), file=sys.stderr)
+
+# One line of shell history or a log into argv. Splitting on whitespace is
+# enough for most lines, and much faster than shlex.
+def split_command_line(line, program=None):
+    line = line.strip()
+    if line.startswith('['):
+        import json
+        argv = json.loads(line)
+    elif '"' in line or "'" in line or '\\\\' in line:
+        import shlex
+        argv = shlex.split(line)
+    else:
+        argv = line.split()
+    if argv and argv[0] == program:
+        argv = argv[1:]
+    return argv
+
+# Parse argv vectors, yielding (argv, reply) in order, where reply is the JSON
+# text of the result. Input is taken a block at a time: repeats are answered
+# from the LRU cache, and the distinct misses of a block are parsed together,
+# in this process or spread over a pool of jobs processes. stats, if given,
+# gets the hit and miss counts.
+def parse_batch(argvs, jobs=1, cachesize=65536, blocksize=4096, stats=None):
+    import collections
+    import itertools
+
+    cache = collections.OrderedDict()
+    hits = misses = 0
+    pool = None
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs, initializer=batch_init)
+        parse = lambda block: pool.map(batch_parse, block, chunksize=max(1, len(block) // (jobs * 4)))
+    else:
+        batch_init()
+        parse = lambda block: [batch_parse(argv) for argv in block]
+
+    try:
+        argvs = iter(argvs)
+        while True:
+            block = [tuple(argv) for argv in itertools.islice(argvs, blocksize)]
+            if not block:
+                break
+            known = {}
+            todo = []
+            for key in dict.fromkeys(block):
+                reply = cache.get(key)
+                if reply is None:
+                    todo.append(key)
+                else:
+                    known[key] = reply
+                    cache.move_to_end(key)
+            for key, reply in zip(todo, parse(todo)):
+                known[key] = reply
+                cache[key] = reply
+                if len(cache) > cachesize:
+                    cache.popitem(last=False)
+            hits += len(block) - len(todo)
+            misses += len(todo)
+            for key in block:
+                yield key, known[key]
+    finally:
+        if pool is not None:
+            pool.close()
+        if stats is not None:
+            stats['hits'] = hits
+            stats['misses'] = misses
+
+# Each batch process builds its own parser once
+batch_parser = None
+
+def batch_init():
+    global batch_parser
+    if batch_parser is None:
+        batch_parser = CompiledParser()
+
+def batch_parse(argv):
+    import json
+    return json.dumps(capture_parse(batch_parser, argv))
+"""
+
+routeTemplate = """# parser router
+
+import sys
+
+# Print where "{name}.py <argv>" would go, as a JSON line, without parsing it
+def main():
+    import json
+    command, path, rest, options = route(sys.argv[1:])
+    print(json.dumps({{'command': command, 'path': path, 'argv': rest, 'options': options}}))
+    if command is None and not options:
+        sys.exit(2)
+
+# Find the command that argv names, from the table below, without building or
+# importing a parser. A command is named by its id (remoteSetUrl) or its git
+# name, of one or two words (cat-file, remote set-url); the longest name wins.
+# Returns (command id, the words that named it, the rest of argv, the parser's
+# own options before the command), command id being None if argv names no
+# command. The command's options are left for the parser: "{name}.py" parses
+# [command id] + the rest of argv as it would have parsed argv. With --serve
+# or --batch, what follows belongs to that mode, and no command is looked for.
+def route(argv):
+    options = []
+    i = 0
+    while i < len(argv) and argv[i] in top_options:
+        options.append(top_options[argv[i]])
+        i += 1
+        if options[-1] in ('serve', 'batch'):
+            return (None, [], argv[i:], options)
+    entry = commands.get(argv[i]) if i < len(argv) else None
+    if entry is None:
+        return (None, [], argv[i:], options)
+    command, second = entry
+    if second is not None and i + 1 < len(argv) and argv[i + 1] in second:
+        return (second[argv[i + 1]], argv[i:i + 2], argv[i + 2:], options)
+    if command is None:
+        return (None, [], argv[i:], options)
+    return (command, argv[i:i + 1], argv[i + 1:], options)
+
+# Option before the command -> its name
+top_options = {{
+{options}
+}}
+
+# Command id or first word of a git name -> (command id or None, second word
+# -> command id, or None)
+commands = {{
+{table}
+}}
+
+if __name__ == '__main__':
+    main()
+"""
+
+clientTemplate = """# parser client
+
+import json
+import os
+import socket
+import sys
+
+# Send argv to "{name}.py --serve", and relay the reply: the parsed options as
+# a JSON line on stdout, any help or error text, and the exit code. With no
+# daemon listening, run {name}.py in this process's place instead.
+def main():
+    path = os.environ.get('{upper}_SOCKET') or os.path.join(os.environ.get('TMPDIR', '/tmp'), '{name}-%d.sock' % os.getuid())
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        parser = os.path.join(os.path.dirname(os.path.abspath(__file__)), '{name}.py')
+        os.execv(sys.executable, [sys.executable, parser] + sys.argv[1:])
+
+    sock.sendall(json.dumps({{'argv': sys.argv[1:]}}).encode('utf-8') + b'\\n')
+    reply = b''
+    while not reply.endswith(b'\\n'):
+        chunk = sock.recv(65536)
+        if not chunk:
             break
-        if not line.startswith("option"):
-            raise Exception("expected 'option' in line %d: got '%s'" % (n, line))
-
-        # Read an option until we see the next option or command
-        optname = ""
-        if len(line) > 7:
-            optname = line[7:]
-        shortname = ""
-        longname = ""
-        argument = ""
-        hidden = False
-        optional = False
-        helptext = ""
-        argtype = ""
-        numopt = False
-        textline = ""
-        groupline = False
-
-        # Read the next line to prime the pump.
-        line = f.readline().rstrip()
-
-        while line:
-            n = n + 1
-            # print("%d: %s" % (n, line))
-            line = line.lstrip()
-
-            if line.startswith("shortname: "):
-                shortname = line[11:]
-            elif line.startswith("longname: "):
-                longname = line[10:]
-            elif line.startswith("argument: "):
-                argument = line[10:]
-            elif line == "hidden":
-                hidden = True
-            elif line == "optional":
-                optional = True
-            elif line.startswith("help: "):
-                helptext = line[7:-1]
-            elif line.startswith("type: "):
-                argtype = line[6:]
-            elif line == "numopt":
-                numopt = True
-            elif line == "groupline":
-                groupline = True
-            elif line.startswith("textline: "):
-                textline = line[10:]
-            elif line.startswith("option") or line.startswith("command "):
+        reply += chunk
+    sock.close()
+
+    # A daemon that went away while parsing sends nothing back
+    if not reply:
+        sys.stderr.write('error: no reply from the parse daemon at %s\\n' % path)
+        return 2
+    reply = json.loads(reply)
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    if reply['args'] is not None:
+        print(json.dumps(reply['args']))
+    return reply['exit']
+
+if __name__ == '__main__':
+    sys.exit(main())
+"""
+
+parseArgsTemplate = """# Parse argv (sys.argv[1:] by default) as given, with a new parser unless one
+# is passed in
+def parse_args(argv=None, parser=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    expanded = list(argv)
+    if parser is None:
+        parser = create_parser()
+    return {parsecall}
+"""
+
+argsFileTemplate = """# Parse argv (sys.argv[1:] by default). An @file argument reads more arguments
+# from that file, one per line, and @- reads them from stdin. Leading lines that
+# look like options are parsed with the rest of argv; from the first other line
+# (or a '--' line) on, the source is not read here but handed back as an
+# iterator in args.streamed, so a path list of any size is consumed one line at
+# a time instead of being loaded into memory. An option that takes a value can
+# have it on the next line, which is kept with the options whatever it looks
+# like. Unlike fromfile_prefix_chars, an @ inside a file is not expanded again,
+# but as with it, a file that can't be read is a usage error.
+def parse_args(argv=None, parser=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if parser is None:
+        parser = create_parser()
+    expanded = []
+    streams = []
+    sources = []
+    try:
+        for i, arg in enumerate(argv):
+            if arg == '--':
+                expanded.extend(argv[i:])
                 break
+            if len(arg) < 2 or arg[0] != '@':
+                expanded.append(arg)
+                continue
+            if arg == '@-':
+                source = sys.stdin
             else:
-                raise Exception("unknown", line, opt)
+                source = open(arg[1:], 'rt', encoding=sys.getfilesystemencoding(), errors='surrogateescape')
+                sources.append(source)
+            streams.append(read_argsfile(source, expanded, parser))
+    except OSError as err:
+        close_sources(sources)
+        parser.error(str(err))
+    try:
+        args = {parsecall}
+    except BaseException:
+        close_sources(sources)
+        raise
+    args.streamed = itertools.chain.from_iterable(streams)
+    return args
 
-            line = f.readline().rstrip()
+# Move the leading option lines of an argument source into expanded, and return
+# an iterator over the rest of the source. Blank lines are skipped. Whether an
+# option is followed by a value is looked up in the options of the command
+# argv names before the source.
+def read_argsfile(source, expanded, parser):
+    options = None
+    value = False
+    for line in source:
+        arg = line.rstrip('\\r\\n')
+        if not arg:
+            continue
+        if value:
+            expanded.append(arg)
+            value = False
+            continue
+        if arg == '--':
+            return stream_argsfile(source, None)
+        if arg[0] != '-' or arg == '-':
+            return stream_argsfile(source, arg)
+        expanded.append(arg)
+        if options is None:
+            options = command_options(parser, expanded)
+        value = takes_value(options, arg)
+    return stream_argsfile(source, None)
 
-        # Now that we have the pieces from an option, put it together
-        opt = []
-        if groupline:
-            opt = [ "groupline" ]
-        elif textline != "":
-            opt = [ "textline", textline ]
-        else:
-            opt = [ "option", optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt ]
+# The option string -> action table of the command named in args, or of the
+# top-level parser if none is. The top-level parser has no option that takes
+# a value, so the command is the first argument that isn't an option.
+def command_options(parser, args):
+    for arg in args:
+        if not arg.startswith('-'):
+            choices = parser._subparsers._group_actions[0].choices
+            if arg in choices:
+                return choices[arg]._option_string_actions
+            break
+    return parser._option_string_actions
+
+# Whether an option argument leaves its value to the next argument, as argparse
+# reads it: a long option (or the unique one it abbreviates) without '=value',
+# or a short option, or a bundle of them, ending in one that takes a value
+def takes_value(options, arg):
+    if arg.startswith('--'):
+        if '=' in arg:
+            return False
+        action = options.get(arg)
+        if action is None:
+            matches = [option for option in options if option.startswith(arg)]
+            if len(matches) != 1:
+                return False
+            action = options[matches[0]]
+        return action.nargs is None
+    for i in range(1, len(arg)):
+        action = options.get('-' + arg[i])
+        if action is None:
+            return False
+        if action.nargs != 0:
+            return i == len(arg) - 1
+    return False
+
+def stream_argsfile(source, first):
+    try:
+        if first is not None:
+            yield first
+        for line in source:
+            arg = line.rstrip('\\r\\n')
+            if arg:
+                yield arg
+    finally:
+        if source is not sys.stdin:
+            source.close()
 
-        opts.append(opt)
+# Close the files opened for a parse_args call that failed. The streams over
+# them may not have started, and a generator that hasn't started doesn't run
+# its finally clause when it's closed.
+def close_sources(sources):
+    for source in sources:
+        source.close()
+"""
+
+resultParserTemplate = """
+# ---------------------------------
+
+# The top-level parser of a --slots build. Its parse_known_args, and so its
+# parse_args, hand back the chosen command's result object instead of the
+# Namespace. The subparsers stay {parserclass}, since _SubParsersAction copies
+# the Namespace a subparser returns into the top-level one.
+class ResultParser({parserclass}):
+    def parse_known_args(self, args=None, namespace=None):
+        namespace, extras = {parserclass}.parse_known_args(self, args, namespace)
+        return make_result(namespace), extras
+"""
+
+resultTemplate = """
+# ---------------------------------
 
-    return opts, line, n
+# Base for the per-command result classes. Subparsers are built with
+# argument_default=SUPPRESS, so only the options actually given are stored,
+# one slot each; any other option reads its default from the class-level
+# _defaults table.
+class Result:
+    __slots__ = ('streamed',)
+    _defaults = {}
+
+    def __getattr__(self, name):
+        try:
+            return self._defaults[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    # Only the options that were given, not the defaults
+    def __repr__(self):
+        fields = []
+        for name in type(self).__slots__:
+            try:
+                fields.append('%s=%r' % (name, object.__getattribute__(self, name)))
+            except AttributeError:
+                pass
+        return '%s(%s)' % (type(self).__name__, ', '.join(fields))
+
+# Move the parsed values out of the Namespace into the result class that the
+# chosen subparser set as its _result default.
+def make_result(namespace):
+    values = vars(namespace)
+    result = values.pop('_result', Result)()
+    for name, value in values.items():
+        setattr(result, name, value)
+    return result
+"""
 
 # -----------------------------------------------------------------------------------------------
 
@@ -0,0 +1,224 @@
+#! python3
+# coding=utf-8
+
+# gen-getopt.py
+# copyright 2019 Brian Fitzgerald
+
+# Read a command-line specification file and create a getopt parser for it
+# (https://docs.python.org/3/library/getopt.html). Each command's options are
+# written out as a table of constants; create_parser() turns the tables into
+# getopt's option strings and a lookup from option to dest, and the generated
+# parse_args() picks a table by the first argument and converts and checks the
+# values itself.
+
+import argparse
+import os
+import sys
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from genlib import compileArgument, packageModes, packageParser, readspecs
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a getopt parser from a command-line spec")
+    parser.add_argument("specfile", help="command-line spec to read")
+    parser.add_argument("-o", "--output", default="getoptparser.py", help="file to write the parser to")
+    parser.add_argument("--no-validate", dest="validate", action="store_false",
+                        help="accept any value for options whose argument is a pattern")
+    parser.add_argument("--package", action="append", choices=packageModes, default=[],
+                        help="also package the parser for deployment this way (repeatable)")
+    args = parser.parse_args()
+
+    specs = readspecs(args.specfile)
+    print("We have %d commands" % len(specs))
+    with open(args.output, "wt", encoding='utf-8') as f:
+        genCommands(f, specs, validate=args.validate)
+
+    # Package it, running it on the first command to find what it imports
+    for mode in args.package:
+        artifact = packageParser(args.output, mode, [specs[0][0]])
+        print("Packaged %s: %s, %d bytes" % (mode, artifact, os.path.getsize(artifact)))
+
+# -----------------------------------------------------------------------------------------------
+
+def genCommands(f, specs, validate=True):
+    table = ""
+    subs = ""
+    for spec in specs:
+        (cmdid, cmdname, usage, opts) = spec
+        table += "        '%s': compile_options('%s', %r, options_%s),\n" % (cmdid, cmdid, "\n".join(usage[1:]), cmdid)
+
+        # One (short, long, dest, kind, check, metavar, help) entry per option
+        subs += "\n# ---------------------------------\n\n"
+        subs += "options_%s = (\n" % cmdid
+        for opt in opts:
+            if opt[0] == "groupline":
+                subs += "    # groupline functionality needs a custom help formatter\n"
+            elif opt[0] == "textline":
+                subs += "    # textline functionality needs a custom help formatter\n"
+            else:
+                (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
+
+                # Same limits as gen-argparse.py
+                if numopt:
+                    subs += "    # %s can't handle numopt yet\n" % optname
+                    continue
+                if shortname == "h" and len(longname) == 0:
+                    subs += "    # %s tried to define -h which conflicts with help\n" % cmdname
+                    continue
+                if shortname == "h":
+                    subs += "    # %s tried to add -h which conflicts with help\n" % longname
+                    shortname = ""
+
+                kind = argtype
+                check = None
+                if argtype == "string":
+                    compiled = compileArgument(argument) if validate else None
+                    if compiled is not None and compiled[0] == "choices":
+                        kind, check = "choices", tuple(compiled[1])
+                    elif compiled is not None:
+                        kind, check = "pattern", compiled[1]
+                subs += "    (%r, %r, %r, %r, %r, %r, %r),\n" % (
+                    shortname, longname, optname, kind, check, argument or None, None if hidden else helptext)
+        subs += ")\n"
+
+    print(parserTemplate.format(table=table.rstrip(), commands=", ".join(spec[0] for spec in specs),
+                                subparsers=subs.rstrip()), file=f)
+
+parserTemplate = """# parser
+
+import getopt
+import os
+import sys
+
+def main():
+    args = parse_args()
+    # print(args)
+
+# Parse argv (sys.argv[1:] by default). The first argument names the command,
+# and the rest is handed to getopt.gnu_getopt with that command's option
+# strings. Values are converted and checked here, and anything getopt leaves
+# over is an error, as the spec has no positional arguments.
+def parse_args(argv=None, parser=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if parser is None:
+        parser = create_parser()
+    if not argv:
+        return Result()
+    command = argv[0]
+    if command in ('-h', '--help'):
+        print(usage())
+        print('commands: {commands}')
+        sys.exit(0)
+    table = parser.get(command)
+    if table is None:
+        error(usage(), os.path.basename(sys.argv[0]), 'invalid choice: %r' % command)
+    (name, usagetext, shortopts, longopts, lookup, defaults, options) = table
+    try:
+        pairs, rest = getopt.gnu_getopt(argv[1:], shortopts, longopts)
+    except getopt.GetoptError as e:
+        error(usagetext, prog(name), e.msg)
+
+    values = dict(defaults)
+    for opt, value in pairs:
+        if opt in ('-h', '--help'):
+            print_help(table)
+            sys.exit(0)
+        dest, kind, check, metavar = lookup[opt]
+        if kind == 'bool':
+            value = True
+        elif kind == 'int':
+            try:
+                value = int(value)
+            except ValueError:
+                error(usagetext, prog(name), 'argument %s: invalid int value: %r' % (opt, value))
+        elif kind == 'choices':
+            if value not in check:
+                error(usagetext, prog(name), 'argument %s: invalid choice: %r (choose from %s)' % (
+                    opt, value, ', '.join(map(repr, check))))
+        elif kind == 'pattern':
+            if pattern(check).fullmatch(value) is None:
+                error(usagetext, prog(name), "argument %s: '%s' does not match %s" % (opt, value, metavar))
+        values[dest] = value
+    if rest:
+        error(usagetext, prog(name), 'unrecognized arguments: %s' % ' '.join(rest))
+    return Result(values)
+
+# The parse result: one attribute per dest of the command
+class Result:
+    def __init__(self, values=()):
+        self.__dict__.update(values)
+
+    def __repr__(self):
+        return 'Result(%s)' % ', '.join('%s=%r' % item for item in self.__dict__.items())
+
+    def __eq__(self, other):
+        return isinstance(other, Result) and vars(self) == vars(other)
+
+def usage():
+    return 'usage: %s <command> [<options>]' % os.path.basename(sys.argv[0])
+
+def prog(name):
+    return '%s %s' % (os.path.basename(sys.argv[0]), name)
+
+def error(usagetext, prog, message):
+    sys.stderr.write('%s\\n%s: error: %s\\n' % (usagetext, prog, message))
+    sys.exit(2)
+
+def print_help(table):
+    (name, usagetext, shortopts, longopts, lookup, defaults, options) = table
+    lines = [usagetext, '', 'options:', '  -h, --help            show this help message and exit']
+    for short, long, dest, kind, check, metavar, helptext in options:
+        if helptext is None:
+            continue
+        suffix = '' if kind == 'bool' else ' ' + (metavar or dest.upper())
+        names = ', '.join(opt for opt in ('-' + short if short else '', '--' + long if long else '') if opt) + suffix
+        if len(names) < 22:
+            lines.append('  %-22s%s' % (names, helptext))
+        else:
+            lines.append('  %s\\n%24s%s' % (names, '', helptext))
+    print('\\n'.join(lines))
+
+# Regexes of pattern options, compiled on first use
+patterns = {{}}
+
+def pattern(regex):
+    compiled = patterns.get(regex)
+    if compiled is None:
+        import re
+        compiled = patterns[regex] = re.compile(regex, re.DOTALL)
+    return compiled
+
+# Turn a command's option table into what parse_args needs: getopt's short
+# option string and long option list, option -> (dest, kind, check, metavar),
+# and the defaults. As with argparse, the first option of a dest sets its default.
+def compile_options(name, usagetext, options):
+    shortopts = 'h'
+    longopts = ['help']
+    lookup = {{}}
+    defaults = {{}}
+    for short, long, dest, kind, check, metavar, helptext in options:
+        value = '' if kind == 'bool' else '='
+        if short:
+            shortopts += short + (':' if value else '')
+            lookup['-' + short] = (dest, kind, check, metavar)
+        if long:
+            longopts.append(long + value)
+            lookup['--' + long] = (dest, kind, check, metavar)
+        defaults.setdefault(dest, False if kind == 'bool' else None)
+    return (name, usagetext, shortopts, longopts, lookup, defaults, options)
+
+# Command name -> compiled option table, all made up front like the argparse subparsers
+def create_parser():
+    return {{
+{table}
+    }}
+{subparsers}
+
+if __name__ == '__main__':
+    main()
+"""
+
+if __name__ == '__main__':
+    main()
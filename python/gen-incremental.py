@@ -0,0 +1,367 @@
+#! python3
+# coding=utf-8
+
+# gen-incremental.py
+# copyright 2019 Brian Fitzgerald
+
+# Read a command-line specification file and create an incremental parser for
+# it: a module for checking a command line as it is typed, on every keystroke.
+# An Editor holds the words of the last text it was given, the parse state
+# before each word, and what each word did (the values it set, the errors it
+# caused). Given the text after an edit, it keeps the words that end before
+# the first changed character, goes back to the state after the last of them,
+# and splits and parses only the rest of the text. Options are resolved the way
+# argparse resolves them, and values are converted and checked like the
+# argparse parser's, but an error doesn't stop the parse: each one becomes a
+# diagnostic on the words it is about, and parsing goes on with the next word.
+
+import argparse
+import os
+import sys
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from genlib import compileArgument, packageModes, packageParser, readspecs, resolveTemplate
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an incremental parser from a command-line spec")
+    parser.add_argument("specfile", help="command-line spec to read")
+    parser.add_argument("-o", "--output", default="argincremental.py", help="file to write the parser to")
+    parser.add_argument("--no-validate", dest="validate", action="store_false",
+                        help="accept any value for options whose argument is a pattern")
+    parser.add_argument("--package", action="append", choices=packageModes, default=[],
+                        help="also package the parser for deployment this way (repeatable)")
+    args = parser.parse_args()
+
+    specs = readspecs(args.specfile)
+    print("We have %d commands" % len(specs))
+    with open(args.output, "wt", encoding='utf-8') as f:
+        genCommands(f, specs, validate=args.validate)
+
+    # Package it, running it on the first command to find what it imports
+    for mode in args.package:
+        artifact = packageParser(args.output, mode, [specs[0][0]])
+        print("Packaged %s: %s, %d bytes" % (mode, artifact, os.path.getsize(artifact)))
+
+# -----------------------------------------------------------------------------------------------
+
+def genCommands(f, specs, validate=True):
+    table = ""
+    subs = ""
+    for spec in specs:
+        (cmdid, cmdname, usage, opts) = spec
+        table += "    '%s': options_%s,\n" % (cmdid, cmdid)
+
+        # One (short, long, dest, kind, check, metavar) entry per option,
+        # leaving out the same options as the other generators do
+        subs += "\n# ---------------------------------\n\n"
+        subs += "options_%s = (\n" % cmdid
+        for opt in opts:
+            if opt[0] != "option":
+                continue
+            (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
+            if numopt:
+                subs += "    # %s can't handle numopt yet\n" % optname
+                continue
+            if shortname == "h" and len(longname) == 0:
+                subs += "    # %s tried to define -h which conflicts with help\n" % cmdname
+                continue
+            if shortname == "h":
+                shortname = ""
+
+            kind = argtype
+            check = None
+            if argtype == "string":
+                compiled = compileArgument(argument) if validate else None
+                if compiled is not None and compiled[0] == "choices":
+                    kind, check = "choices", tuple(compiled[1])
+                elif compiled is not None:
+                    kind, check = "pattern", compiled[1]
+            subs += "    (%r, %r, %r, %r, %r, %r),\n" % (shortname, longname, optname, kind, check, argument or None)
+        subs += ")\n"
+
+    print(parserTemplate.format(table=table.rstrip(), subparsers=subs.rstrip(), resolve=resolveTemplate), file=f)
+
+parserTemplate = """# incremental parser
+
+import bisect
+import json
+import sys
+
+# argincremental.py [<command line>]
+# Writes what it parsed of the command line as a line of JSON. Without one, it
+# reads the command line from stdin after each edit, one per line, and writes
+# a line for each.
+def main():
+    editor = Editor()
+    lines = [' '.join(sys.argv[1:])] if len(sys.argv) > 1 else sys.stdin
+    for line in lines:
+        result = editor.update(line.rstrip('\\n'))
+        print(json.dumps({{
+            'command': result.command,
+            'given': {{dest: result.values[dest] for dest in result.given}},
+            'pending': result.pending,
+            'diagnostics': result.diagnostics,
+            'reused': editor.reused,
+        }}))
+        sys.stdout.flush()
+
+# Parse a whole command line from scratch
+def parse(text):
+    return Editor().update(text)
+
+# The parse of a command line so far. values has every dest of the command,
+# with its default if no word set it, and given the dests that words set, in
+# order. pending is the option still waiting for its value at the end of the
+# text, or None. diagnostics are (start, end, message), start and end being
+# offsets in the text of the words an error is about.
+class Result:
+    def __init__(self, command, values, given, pending, diagnostics):
+        self.command = command
+        self.values = values
+        self.given = given
+        self.pending = pending
+        self.diagnostics = diagnostics
+
+    # Whether the command line would parse as it stands
+    @property
+    def complete(self):
+        return bool(self.command) and self.pending is None and not self.diagnostics
+
+    def __repr__(self):
+        return 'Result(%r, given=%r, pending=%r, diagnostics=%r)' % (
+            self.command, {{dest: self.values[dest] for dest in self.given}}, self.pending, self.diagnostics)
+
+# The state before the first word: (command, its index, pending option as
+# (option string, entry, word number) or None, whether '--' was seen)
+initial = ('', None, None, False)
+
+class Editor:
+    def __init__(self):
+        self.text = ''
+        self.words = []           # (word, start, end) per word of text
+        self.states = [initial]   # the state before each word, and after the last
+        self.undo = []            # per word, (dest, had a value, value before, newly given) per value it set
+        self.counts = []          # per word, how many diagnostics it added
+        self.values = {{}}
+        self.given = []
+        self.diagnostics = []
+        self.reused = 0           # words kept from the last text by the last update
+
+    # Parse the text after an edit, reusing the words before the first change
+    def update(self, text):
+        old = self.text
+        same = min(len(old), len(text))
+        if old[:same] != text[:same]:
+            lo, hi = 0, same
+            while lo < hi:
+                mid = (lo + hi + 1) // 2
+                if old[:mid] == text[:mid]:
+                    lo = mid
+                else:
+                    hi = mid - 1
+            same = lo
+
+        # A word is unchanged if the space after it is. The values and
+        # diagnostics of the words after it are taken back, last word first.
+        kept = len(self.words)
+        while kept and self.words[kept - 1][2] >= same:
+            kept -= 1
+            for dest, had, value, new in reversed(self.undo.pop()):
+                if had:
+                    self.values[dest] = value
+                else:
+                    del self.values[dest]
+                if new:
+                    self.given.pop()
+            count = self.counts.pop()
+            if count:
+                del self.diagnostics[-count:]
+        del self.words[kept:]
+        del self.states[kept + 1:]
+        if not kept:
+            self.values = {{}}
+            self.given = []
+            self.diagnostics = []
+
+        state = self.states[kept]
+        for word in split(text, self.words[-1][2] if kept else 0):
+            state, events, messages = scan_word(state, word[0], len(self.words))
+            self.words.append(word)
+            self.states.append(state)
+            if len(self.words) == 1 and state[1] is not None:
+                self.values.update(state[1][4])
+            undo = []
+            for dest, value in events:
+                new = dest not in self.given
+                undo.append((dest, dest in self.values, self.values.get(dest), new))
+                self.values[dest] = value
+                if new:
+                    self.given.append(dest)
+            self.undo.append(undo)
+            for at, message in messages:
+                self.diagnostics.append((self.words[at][1], self.words[at][2], message))
+            self.counts.append(len(messages))
+        self.text = text
+        self.reused = kept
+        return self.result()
+
+    # The partial result of the text parsed last
+    def result(self):
+        command, index, pending, dashes = self.states[-1]
+        return Result(command, dict(self.values), list(self.given), pending and pending[0], list(self.diagnostics))
+
+# Split text from pos into shell words, as (word, start, end). Spaces separate
+# words, and quotes and backslashes work as in a POSIX shell; a quote that
+# isn't closed runs to the end of the text.
+def split(text, pos=0):
+    words = []
+    length = len(text)
+    while True:
+        while pos < length and text[pos] == ' ':
+            pos += 1
+        if pos == length:
+            return words
+        end = text.find(' ', pos)
+        if end < 0:
+            end = length
+        word = text[pos:end]
+        if "'" not in word and '"' not in word and '\\\\' not in word:
+            words.append((word, pos, end))
+            pos = end
+            continue
+        start = pos
+        chars = []
+        while pos < length and text[pos] != ' ':
+            c = text[pos]
+            if c == "'":
+                end = text.find("'", pos + 1)
+                if end < 0:
+                    end = length
+                chars.append(text[pos + 1:end])
+                pos = end + 1
+            elif c == '"':
+                pos += 1
+                while pos < length and text[pos] != '"':
+                    if text[pos] == '\\\\' and text[pos + 1:pos + 2] in ('"', '\\\\', '$', '`'):
+                        pos += 1
+                    chars.append(text[pos])
+                    pos += 1
+                pos += 1
+            elif c == '\\\\':
+                chars.append(text[pos + 1:pos + 2])
+                pos += 2
+            else:
+                chars.append(c)
+                pos += 1
+        pos = min(pos, length)
+        words.append((''.join(chars), start, pos))
+
+# Parse one word, numbered i, in state. Returns the state after it, the
+# (dest, value) pairs it set and the (word number, message) errors it caused.
+def scan_word(state, word, i):
+    command, index, pending, dashes = state
+    if i == 0:
+        if word in ('-h', '--help') or (len(word) > 2 and '--help'.startswith(word)):
+            return (initial, [('help', True)], [])
+        if word[:1] == '-':
+            return (initial, [], [(0, 'unrecognized arguments: %s' % word)])
+        index = command_index(word)
+        if index is None:
+            return ((word, None, None, False), [], [(0, 'invalid choice: %r' % word)])
+        return ((word, index, None, False), [], [])
+    if index is None:
+        return (state, [], [])
+    events = []
+    messages = []
+
+    # The value of the option before, unless this is an option or '--'
+    if pending is not None:
+        option, entry, at = pending
+        if word == '--' or lookup(index, word) is not None:
+            messages.append((at, 'argument %s: expected one argument' % option))
+        else:
+            convert(option, entry, word, i, events, messages)
+            return ((command, index, None, dashes), events, messages)
+
+    if dashes:
+        messages.append((i, 'unrecognized arguments: %s' % word))
+        return ((command, index, None, dashes), events, messages)
+    if word == '--':
+        return ((command, index, None, True), events, messages)
+    found = lookup(index, word)
+    if found is None:
+        messages.append((i, 'unrecognized arguments: %s' % word))
+        return ((command, index, None, dashes), events, messages)
+    if isinstance(found, str):
+        messages.append((i, found))
+        return ((command, index, None, dashes), events, messages)
+    option, entry, explicit, flags, error = resolve_bundle(index, *found)
+    events.extend((flag[0], True) for flag in flags)
+    if error is not None:
+        messages.append((i, error))
+        return ((command, index, None, dashes), events, messages)
+    if entry is None:
+        messages.append((i, 'unrecognized arguments: %s' % word))
+    elif entry[1] in ('bool', 'help'):
+        events.append((entry[0], True))
+    elif explicit is not None:
+        convert(option, entry, explicit, i, events, messages)
+    else:
+        return ((command, index, (option, entry, i), dashes), events, messages)
+    return ((command, index, None, dashes), events, messages)
+
+# Convert and check an option's value, as the argparse parser does
+def convert(option, entry, value, i, events, messages):
+    dest, kind, check, metavar = entry
+    if kind == 'int':
+        try:
+            value = int(value)
+        except ValueError:
+            messages.append((i, 'argument %s: invalid int value: %r' % (option, value)))
+            return
+    elif kind == 'choices':
+        if value not in check:
+            messages.append((i, 'argument %s: invalid choice: %r (choose from %s)' % (
+                option, value, ', '.join(map(repr, check)))))
+            return
+    elif kind == 'pattern':
+        if pattern(check).fullmatch(value) is None:
+            messages.append((i, "argument %s: '%s' does not match %s" % (option, value, metavar)))
+            return
+    events.append((dest, value))
+
+# Regexes of pattern options, compiled on first use
+patterns = {{}}
+
+def pattern(regex):
+    compiled = patterns.get(regex)
+    if compiled is None:
+        import re
+        compiled = patterns[regex] = re.compile(regex, re.DOTALL)
+    return compiled
+
+# What an entry of an option table means, for the option resolution below: an
+# entry is (dest, kind, check, metavar)
+help_entry = ('help', 'help', None, None)
+
+def takes_value(entry):
+    return entry[1] not in ('bool', 'help')
+
+def default_value(entry):
+    return False if entry[1] == 'bool' else None
+{resolve}{subparsers}
+
+# ---------------------------------
+
+# Command name -> option table
+commands = {{
+{table}
+}}
+
+if __name__ == '__main__':
+    main()
+"""
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+#! python3
+# coding=utf-8
+
+# gen-optparse.py
+# copyright 2019 Brian Fitzgerald
+
+# Read a command-line specification file and create an optparse parser for it
+# (https://docs.python.org/3/library/optparse.html). optparse has no
+# subcommands, so each command gets an OptionParser of its own, and the
+# generated parse_args() picks one by the first argument.
+
+import argparse
+import os
+import sys
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from genlib import compileArgument, packageModes, packageParser, readspecs
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an optparse parser from a command-line spec")
+    parser.add_argument("specfile", help="command-line spec to read")
+    parser.add_argument("-o", "--output", default="optparser.py", help="file to write the parser to")
+    parser.add_argument("--no-validate", dest="validate", action="store_false",
+                        help="accept any value for options whose argument is a pattern")
+    parser.add_argument("--package", action="append", choices=packageModes, default=[],
+                        help="also package the parser for deployment this way (repeatable)")
+    args = parser.parse_args()
+
+    specs = readspecs(args.specfile)
+    print("We have %d commands" % len(specs))
+    with open(args.output, "wt", encoding='utf-8') as f:
+        genCommands(f, specs, validate=args.validate)
+
+    # Package it, running it on the first command to find what it imports
+    for mode in args.package:
+        artifact = packageParser(args.output, mode, [specs[0][0]])
+        print("Packaged %s: %s, %d bytes" % (mode, artifact, os.path.getsize(artifact)))
+
+# -----------------------------------------------------------------------------------------------
+
+def genCommands(f, specs, validate=True):
+    # translate table to fix up strings with quotes in them
+    fixquot = str.maketrans({"'": r"\'"})
+
+    table = ""
+    subs = ""
+    patterns = False
+    for spec in specs:
+        (cmdid, cmdname, usage, opts) = spec
+        table += "        '%s': parser_%s(prog),\n" % (cmdid, cmdid)
+
+        # Build options first, since the parser needs SpecOption if any of
+        # them is checked against a pattern
+        options = ""
+        optionclass = ""
+        dests = set()
+        for opt in opts:
+            if opt[0] == "groupline":
+                options += "    # groupline functionality needs an OptionGroup\n"
+            elif opt[0] == "textline":
+                options += "    # textline functionality needs a custom formatter\n"
+            else:
+                (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
+
+                # Same limits as gen-argparse.py
+                if numopt:
+                    options += "    # %s can't handle numopt yet\n" % optname
+                    continue
+                if shortname == "h" and len(longname) == 0:
+                    options += "    # %s tried to define -h which conflicts with help\n" % cmdname
+                    continue
+
+                optlist = []
+                if len(longname) > 0:
+                    optlist.append("'--" + longname + "'")
+                if len(shortname) > 0:
+                    if shortname == "h":
+                        options += "    # %s tried to add -h which conflicts with help\n" % longname
+                    else:
+                        optlist.append("'-" + shortname + "'")
+
+                # optparse keeps the last default given for a dest, argparse
+                # the first, so only the first option of a dest gives one
+                actiontext = ""
+                if argtype == "bool":
+                    actiontext = ", action='store_true'"
+                    if optname not in dests:
+                        actiontext += ", default=False"
+                elif argtype == "string":
+                    check = compileArgument(argument) if validate else None
+                    if check is not None and check[0] == "choices":
+                        actiontext = ", type='choice', choices=(%s), metavar=%r" % (
+                            "".join("%r, " % value for value in check[1]), argument)
+                    elif check is not None:
+                        actiontext = ", type='pattern', pattern=%r, metavar=%r" % (check[1], argument)
+                        optionclass = ", option_class=SpecOption"
+                        patterns = True
+                elif argtype == "int":
+                    actiontext = ", type='int'"
+                dests.add(optname)
+
+                if hidden:
+                    helptext = "SUPPRESS_HELP"
+                else:
+                    helptext = "'%s'" % helptext.translate(fixquot)
+                options += "    parser.add_option({options}, dest='{dest}'{action}, help={help})\n".format(
+                    options=", ".join(optlist), dest=optname, action=actiontext, help=helptext)
+
+        usagetext = "\\n".join(usage[1:]).translate(fixquot)
+        subs += "\n# ---------------------------------\n\n"
+        subs += "def parser_%s(prog):\n" % cmdid
+        subs += "    parser = optparse.OptionParser(prog=prog + ' %s', usage='%s'%s)\n" % (cmdid, usagetext, optionclass)
+        subs += options
+        subs += "    return parser\n"
+
+    validators = patternTemplate if patterns else ""
+    print(parserTemplate.format(table=table.rstrip(), commands=", ".join(spec[0] for spec in specs),
+                                validators=validators, subparsers=subs.rstrip()), file=f)
+
+parserTemplate = """# parser
+
+import optparse
+import os
+import sys
+from optparse import SUPPRESS_HELP
+
+def main():
+    args = parse_args()
+    # print(args)
+
+# Parse argv (sys.argv[1:] by default). The first argument names the command,
+# whose OptionParser parses the rest; anything left over is an error, as the
+# spec has no positional arguments.
+def parse_args(argv=None, parser=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if parser is None:
+        parser = create_parser()
+    if not argv:
+        return optparse.Values()
+    command = argv[0]
+    if command in ('-h', '--help'):
+        print(usage())
+        print('commands: {commands}')
+        sys.exit(0)
+    subparser = parser.get(command)
+    if subparser is None:
+        error('invalid choice: %r' % command)
+    args, rest = subparser.parse_args(argv[1:])
+    if rest:
+        subparser.error('unrecognized arguments: %s' % ' '.join(rest))
+    return args
+
+def usage():
+    return 'usage: %s <command> [<options>]' % os.path.basename(sys.argv[0])
+
+def error(message):
+    sys.stderr.write('%s\\n%s: error: %s\\n' % (usage(), os.path.basename(sys.argv[0]), message))
+    sys.exit(2)
+
+# Command name -> OptionParser, all built up front like the argparse subparsers
+def create_parser():
+    prog = os.path.basename(sys.argv[0])
+    return {{
+{table}
+    }}
+{validators}
+{subparsers}
+
+if __name__ == '__main__':
+    main()
+"""
+
+patternTemplate = """
+# ---------------------------------
+
+# Option class with a 'pattern' type, for options whose argument pattern has
+# fixed structure around open placeholders. The regex is compiled on first use.
+def check_pattern(option, opt, value):
+    if option.compiled is None:
+        import re
+        option.compiled = re.compile(option.pattern, re.DOTALL)
+    if option.compiled.fullmatch(value) is None:
+        raise optparse.OptionValueError("option %s: '%s' does not match %s" % (opt, value, option.metavar))
+    return value
+
+class SpecOption(optparse.Option):
+    TYPES = optparse.Option.TYPES + ('pattern',)
+    ATTRS = optparse.Option.ATTRS + ['pattern']
+    TYPE_CHECKER = dict(optparse.Option.TYPE_CHECKER, pattern=check_pattern)
+    compiled = None
+"""
+
+if __name__ == '__main__':
+    main()
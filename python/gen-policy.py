@@ -0,0 +1,203 @@
+#! python3
+# coding=utf-8
+
+# gen-policy.py
+# copyright 2019 Brian Fitzgerald
+
+# Read a command-line specification file and create an option policy filter
+# for it: a module that finds which options a command line uses, without
+# building a parser, and checks them against deny and allow lists. Each
+# command's options are written out as a table of constants. The first time a
+# command is scanned, its table becomes lookups of long names, short letters
+# and a sorted name list for prefixes, and argv is resolved against them in one
+# pass, the way argparse would resolve it (abbreviations, --name=value, bundled
+# short options, values glued to a short option, '--').
+
+import argparse
+import os
+import sys
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from genlib import packageModes, packageParser, readspecs, resolveTemplate
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an option policy filter from a command-line spec")
+    parser.add_argument("specfile", help="command-line spec to read")
+    parser.add_argument("-o", "--output", default="argpolicy.py", help="file to write the filter to")
+    parser.add_argument("--package", action="append", choices=packageModes, default=[],
+                        help="also package the filter for deployment this way (repeatable)")
+    args = parser.parse_args()
+
+    specs = readspecs(args.specfile)
+    print("We have %d commands" % len(specs))
+    with open(args.output, "wt", encoding='utf-8') as f:
+        genCommands(f, specs)
+
+    # Package it, running it on the first command to find what it imports
+    for mode in args.package:
+        artifact = packageParser(args.output, mode, [specs[0][0]])
+        print("Packaged %s: %s, %d bytes" % (mode, artifact, os.path.getsize(artifact)))
+
+# -----------------------------------------------------------------------------------------------
+
+def genCommands(f, specs):
+    table = ""
+    subs = ""
+    for spec in specs:
+        (cmdid, cmdname, usage, opts) = spec
+        table += "    '%s': options_%s,\n" % (cmdid, cmdid)
+
+        # One (short, long, id, takes a value) entry per option, leaving out
+        # the same options as the parser generators do
+        subs += "\n# ---------------------------------\n\n"
+        subs += "options_%s = (\n" % cmdid
+        for opt in opts:
+            if opt[0] != "option":
+                continue
+            (optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt) = opt[1:]
+            if numopt:
+                subs += "    # %s can't handle numopt yet\n" % optname
+                continue
+            if shortname == "h" and len(longname) == 0:
+                subs += "    # %s tried to define -h which conflicts with help\n" % cmdname
+                continue
+            if shortname == "h":
+                shortname = ""
+            subs += "    (%r, %r, %r, %r),\n" % (shortname, longname, optname, argtype != "bool")
+        subs += ")\n"
+
+    print(parserTemplate.format(table=table.rstrip(), subparsers=subs.rstrip(), resolve=resolveTemplate), file=f)
+
+parserTemplate = """# option policy filter
+
+import bisect
+import sys
+
+# argpolicy.py --policy FILE <command> [<options>]
+# Exits 0 if the policy allows the command line, 1 if it doesn't, and 2 if
+# it can't be parsed.
+def main():
+    argv = sys.argv[1:]
+    deny, allow = set(), None
+    if argv[:1] == ['--policy'] and len(argv) > 1:
+        deny, allow = read_policy(argv[1])
+        argv = argv[2:]
+    command, ids, error = scan(argv)
+    if error is not None:
+        sys.stderr.write('error: %s\\n' % error)
+        sys.exit(2)
+    reason = check_ids(ids, deny, allow)
+    if reason is not None:
+        sys.stderr.write('%s\\n' % reason)
+        sys.exit(1)
+    print(' '.join(ids))
+
+# Read a policy file: lines of 'deny <id>' or 'allow <id>', # for comments.
+# Returns (deny, allow), allow being None when the file allows nothing
+# explicitly, which means everything not denied is allowed.
+def read_policy(path):
+    deny, allow = set(), None
+    with open(path, 'rt') as f:
+        for line in f:
+            words = line.split('#')[0].split()
+            if len(words) == 2 and words[0] == 'deny':
+                deny.add(words[1])
+            elif len(words) == 2 and words[0] == 'allow':
+                allow = (allow or set()) | {{words[1]}}
+            elif words:
+                raise ValueError('%s: bad policy line: %s' % (path, line.strip()))
+    return deny, allow
+
+# Check a command line against a policy. The ids of a command line are the
+# command's name and then 'command.option' for each option it uses, option
+# being the option's name in the spec, whichever of its spellings was given.
+# A deny entry matches an id exactly, or as '*.option' for that option in any
+# command; with an allow set, every id must match an entry exactly, as
+# '*.option', or as 'command.*'. Returns the reason a command line is refused,
+# or None if it's allowed; a command line that can't be parsed is refused.
+def check(argv, deny=(), allow=None):
+    command, ids, error = scan(argv)
+    if error is not None:
+        return error
+    return check_ids(ids, deny, allow)
+
+def check_ids(ids, deny, allow):
+    for id in ids:
+        command, dot, option = id.partition('.')
+        wildcard = '*.' + option if dot else None
+        if id in deny or wildcard in deny:
+            return 'denied: %s' % id
+        if allow is not None and id not in allow and wildcard not in allow and command + '.*' not in allow:
+            return 'not allowed: %s' % id
+    return None
+
+# Find the command and options a command line uses, as (command, ids, error):
+# error is None, or what argparse would reject the command line for. Values
+# aren't converted or checked, and positional arguments are passed over.
+def scan(argv):
+    if not argv:
+        return ('', [], None)
+    command = argv[0]
+    if command in ('-h', '--help') or (len(command) > 2 and '--help'.startswith(command)):
+        return ('', ['help'], None)
+    if command[:1] == '-':
+        return ('', [], 'unrecognized arguments: %s' % command)
+    index = command_index(command)
+    if index is None:
+        return (command, [], 'invalid choice: %r' % command)
+    ids = [command]
+    dashes = False
+    i = 1
+    while i < len(argv):
+        arg = argv[i]
+        i += 1
+        if dashes:
+            continue
+        if arg == '--':
+            dashes = True
+            continue
+        found = lookup(index, arg)
+        if found is None:
+            continue
+        if isinstance(found, str):
+            return (command, ids, found)
+        option, entry, explicit, flags, error = resolve_bundle(index, *found)
+        ids.extend(command + '.' + flag[0] for flag in flags)
+        if error is not None:
+            return (command, ids, error)
+        if entry is None:
+            return (command, ids, 'unrecognized arguments: %s' % arg)
+        ids.append(command + '.' + entry[0])
+
+        # A separate value is the next argument, if it isn't an option or '--'
+        if entry[1] and explicit is None:
+            if i >= len(argv) or argv[i] == '--' or lookup(index, argv[i]) is not None:
+                return (command, ids, 'argument %s: expected one argument' % option)
+            i += 1
+    return (command, ids, None)
+
+# What an entry of an option table means, for the option resolution below: an
+# entry is (id, takes a value), and the filter doesn't need defaults
+help_entry = ('help', False)
+
+def takes_value(entry):
+    return entry[1]
+
+def default_value(entry):
+    return None
+{resolve}{subparsers}
+
+# ---------------------------------
+
+# Command name -> option table
+commands = {{
+{table}
+}}
+
+if __name__ == '__main__':
+    main()
+"""
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,504 @@
+# genlib.py
+# copyright 2019 Brian Fitzgerald
+# shared code for command-line generation with Python code
+
+import os
+import py_compile
+import re
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+# Read the command-spec file into a data structure
+# A file looks like this:
+#    command add
+#        usage
+#            "usage: git add [<options>] [--] <pathspec>..."
+#        option dryRun
+#            shortname: n
+def readspecs(specfile):
+    cmds = []
+    with open(specfile, "rt", encoding='utf-8') as f:
+        n = 1
+        line = f.readline().rstrip()
+        # print("%d: %s" % (n, line))
+        while line:
+
+            # We must be at a "command xxx" line. Parse the command name, and strip
+            # a trailing " cmd" text annotation to just get the text of the command,
+            # since that's what argparse is going to want
+            if not line.startswith("command "):
+                raise Exception("expected 'command' in line %d: got '%s'" % (n, line))
+            cmdid = line[8:]
+            cmdname = cmdid
+            textoffset = cmdid.find(" \"")
+            if textoffset != -1:
+                cmdname = cmdid[textoffset+2:-1]
+                cmdid = cmdid[:textoffset]
+
+            # Parse usage and options
+            usage, line, n = readcmdusage(f, n)
+            opts, line, n = readcmdoptions(f, line, n)
+
+            # Put into a data structure
+            cmd = [cmdid, cmdname, usage, opts]
+            cmds.append(cmd)
+
+    return cmds
+
+# Read the usage section
+def readcmdusage(f, n):
+    # We expect a usage header
+    line = f.readline().rstrip()
+    if line.lstrip() != "usage":
+        raise Exception("expected 'usage' in line %d: got '%s'" % (n, line))
+
+    # Read usage until we see the first option, or the next command
+    # (if there are no options)
+    usage = []
+    while line:
+        n = n + 1
+        # print("%d: %s" % (n, line))
+        line = line.lstrip()
+
+        if line.startswith("option") or line.startswith("command "):
+            break
+        usage.append(line[1:-1])
+
+        line = f.readline().rstrip()
+
+    return usage, line, n
+
+# Read the option sections
+def readcmdoptions(f, line, n):
+    opts = []
+
+    # Keep reading until we see command or end of file
+    while line:
+        if line.startswith("command "):
+            break
+        if not line.startswith("option"):
+            raise Exception("expected 'option' in line %d: got '%s'" % (n, line))
+
+        # Read an option until we see the next option or command
+        optname = ""
+        if len(line) > 7:
+            optname = line[7:]
+        shortname = ""
+        longname = ""
+        argument = ""
+        hidden = False
+        optional = False
+        helptext = ""
+        argtype = ""
+        numopt = False
+        textline = ""
+        groupline = False
+
+        # Read the next line to prime the pump.
+        line = f.readline().rstrip()
+
+        while line:
+            n = n + 1
+            # print("%d: %s" % (n, line))
+            line = line.lstrip()
+
+            if line.startswith("shortname: "):
+                shortname = line[11:]
+            elif line.startswith("longname: "):
+                longname = line[10:]
+            elif line.startswith("argument: "):
+                argument = line[10:]
+            elif line == "hidden":
+                hidden = True
+            elif line == "optional":
+                optional = True
+            elif line.startswith("help: "):
+                helptext = line[7:-1]
+            elif line.startswith("type: "):
+                argtype = line[6:]
+            elif line == "numopt":
+                numopt = True
+            elif line == "groupline":
+                groupline = True
+            elif line.startswith("textline: "):
+                textline = line[10:]
+            elif line.startswith("option") or line.startswith("command "):
+                break
+            else:
+                raise Exception("unknown", line, opt)
+
+            line = f.readline().rstrip()
+
+        # Now that we have the pieces from an option, put it together
+        opt = []
+        if groupline:
+            opt = [ "groupline" ]
+        elif textline != "":
+            opt = [ "textline", textline ]
+        else:
+            opt = [ "option", optname, shortname, longname, argument, hidden, optional, helptext, argtype, numopt ]
+
+        opts.append(opt)
+
+    return opts, line, n
+
+# Argument patterns are compiled at generation time, not in the generated parser.
+# A pattern is a sequence of literal characters, <placeholder>s, ... (also open),
+# (a|b) alternations and [optional] parts. A pattern with no open parts only
+# allows a finite set of values, which become choices in the order the pattern
+# gives them; one with literal structure around open parts becomes a regex; a
+# lone placeholder like <file> says nothing about the value, and is left
+# unchecked.
+def compileArgument(argument):
+    # "[=<x>]" and "=<x>" describe how the value is attached, not the value
+    text = argument
+    if text.startswith("[=") and text.endswith("]"):
+        text = text[2:-1]
+    elif text.startswith("="):
+        text = text[1:]
+    elif text.startswith("[") and text.endswith("]"):
+        text = text[1:-1]
+
+    seq, pos = parsePattern(text, 0)
+    if pos != len(text):
+        raise Exception("bad argument pattern '%s'" % argument)
+
+    values = expandPattern(seq)
+    if values is not None:
+        return ("choices", list(dict.fromkeys(values)))
+    if not any(item[0] != "open" for item in seq):
+        return None
+    return ("regex", patternRegex(seq))
+
+# Parse pattern text from pos up to an unmatched '|', ')' or ']', returning
+# the list of items and the position where parsing stopped.
+def parsePattern(text, pos):
+    seq = []
+    while pos < len(text) and text[pos] not in "|)]":
+        c = text[pos]
+        if c == "<":
+            end = text.find(">", pos)
+            if end == -1:
+                raise Exception("unterminated placeholder in '%s'" % text)
+            seq.append(("open",))
+            pos = end + 1
+        elif text.startswith("...", pos):
+            seq.append(("open",))
+            pos += 3
+        elif c == "(":
+            alts = []
+            while text[pos:pos+1] in ("(", "|"):
+                alt, pos = parsePattern(text, pos + 1)
+                alts.append(alt)
+            if text[pos:pos+1] != ")":
+                raise Exception("unterminated group in '%s'" % text)
+            seq.append(("alt", alts))
+            pos += 1
+        elif c == "[":
+            part, pos = parsePattern(text, pos + 1)
+            if text[pos:pos+1] != "]":
+                raise Exception("unterminated optional part in '%s'" % text)
+            seq.append(("alt", [part, []]))
+            pos += 1
+        else:
+            seq.append(("lit", c))
+            pos += 1
+    return seq, pos
+
+# The strings a pattern matches, in the order the pattern gives them, or None
+# if it has an open part
+def expandPattern(seq):
+    values = [""]
+    for item in seq:
+        if item[0] == "open":
+            return None
+        elif item[0] == "lit":
+            values = [v + item[1] for v in values]
+        else:
+            alts = []
+            for alt in item[1]:
+                expanded = expandPattern(alt)
+                if expanded is None:
+                    return None
+                alts += expanded
+            values = [v + a for v in values for a in alts]
+    return values
+
+# A regex (for fullmatch) matching what a pattern matches
+def patternRegex(seq):
+    regex = ""
+    for item in seq:
+        if item[0] == "open":
+            regex += ".+?"
+        elif item[0] == "lit":
+            regex += re.escape(item[1])
+        else:
+            regex += "(?:%s)" % "|".join(patternRegex(alt) for alt in item[1])
+    return regex
+
+# -----------------------------------------------------------------------------------------------
+
+# Read a usage profile: a counted log of command lines, one per line, as
+#    5120 status
+#    1800 diff --cached
+#    git commit -a -m message
+# The count is optional (1), a leading "git" is dropped, and # starts a
+# comment. The command may be given by its cmdid or its name, including
+# two-word names like "remote add". Returns [(count, argv)] with argv[0] the
+# cmdid; lines whose command isn't in the spec are an error.
+def readProfile(path, specs):
+    names = {}
+    for (cmdid, cmdname, usage, opts) in specs:
+        names[cmdid] = cmdid
+        names[cmdname] = cmdid
+    profile = []
+    with open(path, "rt", encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            words = line.split("#")[0].split()
+            count = 1
+            if words and words[0].isdigit():
+                count = int(words.pop(0))
+            if words and words[0] == "git":
+                words.pop(0)
+            if not words:
+                continue
+            if len(words) > 1 and " ".join(words[:2]) in names:
+                argv = [names[" ".join(words[:2])]] + words[2:]
+            elif words[0] in names:
+                argv = [names[words[0]]] + words[1:]
+            else:
+                raise Exception("%s line %d: unknown command %s" % (path, n, words[0]))
+            profile.append((count, argv))
+    return profile
+
+# The commands that a profile finds hot: the most used ones, in order of use,
+# that together make up the given share of its invocations
+def hotCommands(profile, share):
+    counts = {}
+    for count, argv in profile:
+        counts[argv[0]] = counts.get(argv[0], 0) + count
+    total = sum(counts.values())
+    hot = []
+    covered = 0
+    for cmdid in sorted(counts, key=lambda cmdid: -counts[cmdid]):
+        if covered >= share * total:
+            break
+        hot.append(cmdid)
+        covered += counts[cmdid]
+    return hot
+
+# -----------------------------------------------------------------------------------------------
+
+# Option resolution for the generated modules that read a command line without
+# argparse (the policy filter and the incremental parser), as argparse reads
+# it. It is pasted in as it is, so that an argparse compatibility fix is made
+# here once. The module defines the option tables, as commands (command name
+# -> rows of (short letter, long name, entry fields...)), and what its entries
+# mean: help_entry, the entry of -h and --help, takes_value(entry), whether an
+# option takes a value, and default_value(entry), the value of an option that
+# isn't given. The module imports bisect and sys.
+resolveTemplate = """
+# Resolve one argument against a command's index, as argparse classifies it:
+# None for a positional argument, an error message, or (option string, entry
+# or None if unknown, explicit value or None, whether the value followed an '=')
+def lookup(index, arg):
+    if len(arg) < 2 or arg[0] != '-':
+        return None
+    longs, shorts, names, numbers, defaults = index
+    if arg[1] == '-':
+        name, equals, value = arg[2:].partition('=')
+        entry = longs.get(name)
+        if entry is not None:
+            return (arg if not equals else '--' + name, entry, value if equals else None, bool(equals))
+        lo = bisect.bisect_left(names, name)
+        hi = lo
+        while hi < len(names) and names[hi].startswith(name):
+            hi += 1
+        if hi - lo > 1:
+            return 'ambiguous option: --%s could match %s' % (name, ', '.join('--' + n for n in names[lo:hi]))
+        if hi - lo == 1:
+            return ('--' + names[lo], longs[names[lo]], value if equals else None, bool(equals))
+    else:
+        entry = shorts.get(arg[1])
+        if entry is not None:
+            if len(arg) == 2:
+                return (arg, entry, None, False)
+            if arg[2] == '=':
+                return (arg[:2], entry, arg[3:], True)
+            return (arg[:2], entry, arg[2:], False)
+        if not numbers and is_number(arg):
+            return None
+    if ' ' in arg:
+        return None
+    return (arg, None, None, False)
+
+# Follow a bundle of short options from what lookup() found, as argparse reads
+# it: a flag given a value is followed by the option named by the value's first
+# letter. Returns (option string, entry, explicit value, flags, error): the last
+# option of the bundle with its value, the entries of the flags before it, and
+# an error message or None. The value left is explicit[at:], walked by index
+# rather than sliced for each letter, which would make a long bundle quadratic.
+def resolve_bundle(index, option, entry, explicit, equals):
+    flags = []
+    at = 0
+    while entry is not None and explicit is not None and not takes_value(entry):
+        flags.append(entry)
+        if option[1] == '-' or at == len(explicit) or (strict_bundles and equals):
+            return (option, None, None, flags, 'argument %s: ignored explicit argument %r' % (option, explicit[at:]))
+        option = '-' + explicit[at]
+        entry = index[1].get(explicit[at])
+        at += 1
+        if entry is None:
+            return (option, None, None, flags, 'argument %s: ignored explicit argument %r' % (option, option[1:]))
+        if at == len(explicit):
+            explicit = None
+        elif strict_bundles and explicit[at] == '=':
+            equals = True
+            at += 1
+    if explicit is not None:
+        explicit = explicit[at:]
+    return (option, entry, explicit, flags, None)
+
+# From Python 3.13, argparse doesn't read a flag's '=' value as more short
+# options, and an '=' after a bundled option starts its value
+strict_bundles = sys.version_info >= (3, 13)
+
+def is_number(arg):
+    digits = arg[1:].replace('.', '', 1)
+    return digits.isdecimal() and not arg.endswith('.')
+
+# Command name -> (long name -> entry, short letter -> entry, sorted long
+# names, whether an option looks like a negative number, dest -> default),
+# made on first use, an entry being the fields of a row after the names. As
+# with argparse, the first option of a dest sets its default.
+indexes = {}
+
+def command_index(command):
+    index = indexes.get(command)
+    if index is None:
+        options = commands.get(command)
+        if options is None:
+            return None
+        longs = {'help': help_entry}
+        shorts = {'h': help_entry}
+        defaults = {}
+        for row in options:
+            entry = row[2:]
+            if row[1]:
+                longs[row[1]] = entry
+            if row[0]:
+                shorts[row[0]] = entry
+            defaults.setdefault(entry[0], default_value(entry))
+        index = indexes[command] = (longs, shorts, sorted(longs), any(s.isdigit() for s in shorts), defaults)
+    return index
+"""
+
+# -----------------------------------------------------------------------------------------------
+
+# Ways to deploy a generated parser. Each mode's artifact is written next to
+# the parser, and packageCommand says how to start it:
+#    py        the parser itself, run as a script (compiled on every start)
+#    pyc       argparser.pyc, the compiled parser alone, run directly
+#    zipapp    argparser.pyz, the compiled parser and a __main__ in a zip
+#    isolated  argparser_isolated.py, a launcher run with python -S -I that
+#              imports the parser from its __pycache__
+#    frozen    argparser_frozen.pyz, run with python -S -I: a zipapp that also
+#              holds every library module the parser imports from source
+# Compiled files are made by and for the interpreter running the generator.
+packageModes = ("py", "pyc", "zipapp", "isolated", "frozen")
+
+def packageParser(path, mode, argv):
+    artifact = packagePath(path, mode)
+    name = os.path.splitext(os.path.basename(path))[0]
+    main = "import %s\n%s.main()\n" % (name, name)
+    if mode == "py":
+        return path
+    if mode == "pyc":
+        return py_compile.compile(path, cfile=artifact, dfile=os.path.basename(path), doraise=True)
+    if mode == "isolated":
+        py_compile.compile(path, doraise=True)
+        with open(artifact, "wt", encoding='utf-8') as f:
+            f.write("#! %s -S -I\n" % sys.executable)
+            f.write("import os, sys\n")
+            f.write("sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))\n")
+            f.write(main)
+        return artifact
+
+    # The zip is stored rather than deflated, so that zipimport needs no zlib
+    members = [("__main__.pyc", compileSource(main, "__main__.py")),
+               (name + ".pyc", compileFile(path, os.path.basename(path)))]
+    if mode == "frozen":
+        for module, origin, package in importedModules(path, argv):
+            arcname = module.replace(".", "/") + ("/__init__.pyc" if package else ".pyc")
+            members.append((arcname, compileFile(origin, arcname[:-1])))
+    with zipfile.ZipFile(artifact, "w", zipfile.ZIP_STORED) as z:
+        for arcname, data in members:
+            z.writestr(arcname, data)
+    return artifact
+
+# Where a mode puts its artifact
+def packagePath(path, mode):
+    base = os.path.splitext(path)[0]
+    suffixes = {"py": ".py", "pyc": ".pyc", "zipapp": ".pyz", "isolated": "_isolated.py", "frozen": "_frozen.pyz"}
+    if mode not in suffixes:
+        raise Exception("unknown packaging mode '%s'" % mode)
+    return base + suffixes[mode]
+
+# The command line that starts a packaged parser
+def packageCommand(artifact, mode, python=sys.executable):
+    if mode in ("isolated", "frozen"):
+        return [python, "-S", "-I", artifact]
+    return [python, artifact]
+
+# The bytes of a .pyc made from a file or from source text
+def compileFile(source, dfile):
+    with tempfile.TemporaryDirectory() as tmp:
+        cfile = py_compile.compile(source, cfile=os.path.join(tmp, "module.pyc"), dfile=dfile, doraise=True)
+        with open(cfile, "rb") as f:
+            return f.read()
+
+def compileSource(text, dfile):
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "module.py")
+        with open(source, "wt", encoding='utf-8') as f:
+            f.write(text)
+        return compileFile(source, dfile)
+
+# Run the parser on argv in an isolated interpreter, and list the modules it
+# imports from source files, as (name, source, is package), along with those
+# that runpy imports to start a zipapp. Built-in, frozen and extension modules
+# stay where they are. A parser built with --fast-exit leaves through os._exit,
+# which is made to raise SystemExit here, so that the list is still written.
+probeScript = """
+import sys
+sys.path.insert(0, {directory!r})
+before = set(sys.modules)
+import os, runpy, importlib.util
+def _exit(status):
+    raise SystemExit(status)
+os._exit = _exit
+sys.argv = [{module!r}] + {argv!r}
+import {module}
+try:
+    {module}.main()
+except SystemExit:
+    pass
+for name, module in sorted(sys.modules.items()):
+    spec = getattr(module, '__spec__', None)
+    if name not in before and name != {module!r} and spec is not None and type(spec.loader).__name__ == 'SourceFileLoader':
+        print('module', name, spec.submodule_search_locations is not None, spec.origin)
+"""
+
+def importedModules(path, argv):
+    module = os.path.splitext(os.path.basename(path))[0]
+    script = probeScript.format(directory=os.path.dirname(os.path.abspath(path)), module=module, argv=list(argv))
+    out = subprocess.run([sys.executable, "-S", "-I", "-c", script], check=True, stdout=subprocess.PIPE,
+                         universal_newlines=True).stdout
+    modules = []
+    for line in out.splitlines():
+        if line.startswith("module "):
+            tag, name, package, origin = line.split(" ", 3)
+            modules.append((name, origin, package == "True"))
+    return modules
@@ -0,0 +1,276 @@
+#! python3
+# coding=utf-8
+
+# mem-report.py
+# copyright 2019 Brian Fitzgerald
+
+# Account for the memory of a built parser, command by command. Each backend's
+# parser is generated and built once to warm up, and then, from a fresh import
+# of it so that its caches (like the Actions of shared options) start empty,
+# every command's part of it (subparser_* for argparse, parser_* for optparse,
+# the compiled option table for getopt) is built again under tracemalloc, with
+# the traces cleared before each command, so that what is still allocated
+# afterwards is what that command keeps. Every allocation is put in a category
+# by the functions on its traceback, innermost first: actions (Action or
+# Option objects and the keyword dicts they are made from), option dicts (the
+# option string lookups and action lists of a parser), formatter state, the
+# rest of the parser (registries, groups, defaults), and the arguments the
+# generated code builds for its calls (choices, type objects). Help strings
+# are constants of the generated module, loaded with it rather than allocated
+# when a command is built, so they are counted apart, by size, from the
+# constants of each command's code and of the shared options it creates, each
+# string once, for the first command that holds it. The report ranks the
+# backends and generation modes, and then the commands of the first of them.
+#
+#    $ mem-report.py
+#    $ mem-report.py --backend argparse --backend argparse-shared --top 20
+
+import argparse
+import dis
+import gc
+import getopt
+import optparse
+import os
+import sys
+import tempfile
+import tracemalloc
+if sys.version_info < (3,5):
+    raise Exception("Requires Python 3.5 or greater")
+
+from benchmark import defaultspec, generateParser, loadModule
+from genlib import readspecs
+
+# Backend name -> (generator, generator options)
+backends = {
+    "argparse": ("gen-argparse.py", ()),
+    "argparse-shared": ("gen-argparse.py", ("--share-options",)),
+    "argparse-novalidate": ("gen-argparse.py", ("--no-validate",)),
+    "argparse-slots": ("gen-argparse.py", ("--slots",)),
+    "optparse": ("gen-optparse.py", ()),
+    "getopt": ("gen-getopt.py", ()),
+}
+
+# The categories, in report order; help is counted from code constants
+categories = ["actions", "option dicts", "formatter", "parser", "arguments", "other", "help"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Attribute the memory of built parsers to commands and categories")
+    parser.add_argument("specfile", nargs="?", default=defaultspec, help="spec to generate parsers from")
+    parser.add_argument("--backend", action="append", choices=sorted(backends),
+                        help="backend or generation mode to account for (repeatable, default all); "
+                             "the commands of the first are ranked")
+    parser.add_argument("--top", type=int, default=10, help="number of commands to rank")
+    parser.add_argument("--frames", type=int, default=20, help="traceback frames kept per allocation")
+    args = parser.parse_args()
+
+    specs = readspecs(args.specfile)
+    names = args.backend or list(backends)
+    reports = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            generator, options = backends[name]
+            path = generateParser(workdir, args.specfile, generator=generator,
+                                  output="mem_%s.py" % name.replace("-", "_"), options=options)
+            reports.append(account(path, name, specs, args.frames))
+
+    printBackends(reports)
+    print()
+    printCommands(reports, args.top)
+
+# -----------------------------------------------------------------------------------------------
+
+# The builders of a generated parser's commands, as (cmdid, prepare, build,
+# what its definition is kept in). build is called with what prepare returns,
+# which is what create_parser() would give it: for argparse, a subparsers
+# action of a new top-level parser, as a command can only be added once. The
+# parser class is looked up rather than taken from a built parser, as building
+# one would fill the module's caches.
+def commandBuilders(module, name, specs):
+    builders = []
+    if name.startswith("argparse"):
+        parserclass = getattr(module, "ErrorParser", module.Parser)
+        prepare = lambda: parserclass().add_subparsers()
+        for (cmdid, cmdname, usage, opts) in specs:
+            build = getattr(module, "subparser_" + cmdid)
+            builders.append((cmdid, prepare, build, build))
+    elif name == "optparse":
+        for (cmdid, cmdname, usage, opts) in specs:
+            build = getattr(module, "parser_" + cmdid)
+            builders.append((cmdid, lambda: "git", build, build))
+    else:
+        for (cmdid, cmdname, usage, opts) in specs:
+            table = getattr(module, "options_" + cmdid)
+            usagetext = "\n".join(usage[1:])
+            build = lambda table, cmdid=cmdid, usagetext=usagetext: module.compile_options(cmdid, usagetext, table)
+            builders.append((cmdid, lambda table=table: table, build, table))
+    return builders
+
+# Build each command of a generated parser under tracemalloc. Returns
+# {"name", "commands": [(cmdid, options, {category: [bytes, blocks]})]},
+# along with "garbage": the bytes the build left in reference cycles that
+# only the collector frees, which are collected before the traces are read.
+# The warm-up builds use an import of their own, and the module is imported
+# again for the traced builds, so that the first command to use a shared
+# option pays for its Action.
+def account(path, name, specs, frames):
+    for cmdid, prepare, build, definition in commandBuilders(loadModule(path), name, specs):
+        build(prepare())
+    module = loadModule(path)
+    builders = commandBuilders(module, name, specs)
+    shared = getattr(module, "shared_options", [])
+    created = getattr(module, "shared_actions", [])
+    counted = set()
+
+    classify = Classifier(module)
+    ignore = tracemalloc.Filter(False, tracemalloc.__file__)
+    commands = []
+    kept = []
+    tracemalloc.start(frames)
+    try:
+        for (cmdid, prepare, build, definition), spec in zip(builders, specs):
+            context = prepare()
+            before = [action is None for action in created]
+            tracemalloc.clear_traces()
+            kept.append(build(context))
+            built = tracemalloc.get_traced_memory()[0]
+            gc.collect()
+            garbage = built - tracemalloc.get_traced_memory()[0]
+            snapshot = tracemalloc.take_snapshot().filter_traces([ignore])
+            totals = dict((category, [0, 0]) for category in categories)
+            totals["garbage"] = garbage
+            for stat in snapshot.statistics("traceback"):
+                total = totals[classify(stat.traceback)]
+                total[0] += stat.size
+                total[1] += stat.count
+            definitions = [definition] + [shared[index] for index, unbuilt in enumerate(before)
+                                          if unbuilt and created[index] is not None]
+            totals["help"] = helpStrings(definitions, spec, counted)
+            commands.append((cmdid, sum(1 for opt in spec[3] if opt[0] == "option"), totals))
+            del context
+    finally:
+        tracemalloc.stop()
+    return {"name": name, "commands": commands}
+
+# Bytes and count of the help strings among the constants a command's
+# definitions hold: its function's code (and the code nested in it), or its
+# option table, and the entries of the shared options it built. Identical
+# constants are one object for the whole module, so a string already in
+# counted (the ids of those counted for earlier commands) isn't counted again.
+def helpStrings(definitions, spec, counted):
+    helps = set(opt[7] for opt in spec[3] if opt[0] == "option" and opt[7])
+    found = {}
+    pending = [getattr(definition, "__code__", definition) for definition in definitions]
+    while pending:
+        item = pending.pop()
+        if isinstance(item, str):
+            if item in helps and id(item) not in counted:
+                found[id(item)] = sys.getsizeof(item)
+        elif isinstance(item, (tuple, list, frozenset)):
+            pending.extend(item)
+        elif isinstance(item, dict):
+            pending.extend(item.values())
+        elif hasattr(item, "co_consts"):
+            pending.extend(item.co_consts)
+    counted.update(found)
+    return [sum(found.values()), len(found)]
+
+# -----------------------------------------------------------------------------------------------
+
+# Put an allocation in a category by the functions on its traceback, innermost
+# first: the first function a rule names decides, and failing that, the
+# innermost frame in a standard parser module or in the generated module.
+class Classifier:
+    def __init__(self, module):
+        self.generated = module.__file__
+        self.library = set(os.path.abspath(m.__file__) for m in (argparse, optparse, getopt))
+        self.functions = {}
+
+    def __call__(self, traceback):
+        for frame in reversed(traceback):
+            qualname = self.function(frame.filename, frame.lineno)
+            last = qualname.rsplit(".", 1)[-1]
+            if "Formatter" in qualname or last == "_get_formatter":
+                return "formatter"
+            if (qualname.endswith("Action.__init__") or qualname.startswith("Option.") or
+                    last in ("add_argument", "_get_optional_kwargs", "_get_positional_kwargs", "_pop_action_class")):
+                return "actions"
+            if last in ("_add_action", "_check_conflict", "add_option", "_create_option_mappings", "compile_options"):
+                return "option dicts"
+            if os.path.abspath(frame.filename) in self.library:
+                return "parser"
+            if frame.filename == self.generated:
+                return "arguments"
+        return "other"
+
+    # The qualified name of the function a line of a file is in, from the line
+    # tables of the file's code objects, compiled once per file. A line in the
+    # tables of nested code objects (like a def line) goes to the innermost.
+    def function(self, filename, lineno):
+        lines = self.functions.get(filename)
+        if lines is None:
+            lines = self.functions[filename] = {}
+            try:
+                with open(filename, "rt", encoding="utf-8") as f:
+                    code = compile(f.read(), filename, "exec")
+            except (OSError, SyntaxError, ValueError):
+                code = None
+            pending = [(code, "<module>", 0)] if code is not None else []
+            while pending:
+                code, qualname, depth = pending.pop()
+                for offset, line in dis.findlinestarts(code):
+                    if line is not None and lines.get(line, (-1,))[0] < depth:
+                        lines[line] = (depth, qualname)
+                for const in code.co_consts:
+                    if hasattr(const, "co_code"):
+                        name = const.co_name if depth == 0 else qualname + "." + const.co_name
+                        pending.append((const, name, depth + 1))
+        return lines.get(lineno, (0, ""))[1]
+
+# -----------------------------------------------------------------------------------------------
+
+def commandBytes(totals):
+    return sum(totals[category][0] for category in categories)
+
+# Backends and modes, smallest first, with their totals by category
+def printBackends(reports):
+    print("%-20s %9s %9s %9s" % ("backend", "KB", "blocks", "B/option") +
+          "".join(" %12s" % category for category in categories) + " %12s" % "garbage")
+    rows = []
+    for report in reports:
+        totals = dict((category, [0, 0]) for category in categories)
+        totals["garbage"] = 0
+        options = 0
+        for cmdid, count, command in report["commands"]:
+            options += count
+            totals["garbage"] += command["garbage"]
+            for category in categories:
+                totals[category][0] += command[category][0]
+                totals[category][1] += command[category][1]
+        rows.append((commandBytes(totals), report["name"], totals, options))
+    for size, name, totals, options in sorted(rows, key=lambda row: row[0]):
+        print("%-20s %9.1f %9d %9.0f" % (name, size / 1024.0, sum(totals[c][1] for c in categories), size / max(options, 1)) +
+              "".join(" %9.1f KB" % (totals[category][0] / 1024.0) for category in categories) +
+              " %9.1f KB" % (totals["garbage"] / 1024.0))
+
+# The largest commands of the first report, by category, with what the same
+# command takes in the other reports
+def printCommands(reports, top):
+    first = reports[0]
+    others = reports[1:]
+    print("largest commands, %s" % first["name"])
+    print("%-4s %-20s %7s %9s %8s" % ("", "command", "options", "KB", "blocks") +
+          "".join(" %12s" % category for category in categories) + " %12s" % "garbage" +
+          "".join(" %20s" % report["name"] for report in others))
+    sizes = [dict((cmdid, commandBytes(totals)) for cmdid, count, totals in report["commands"]) for report in others]
+    ranked = sorted(first["commands"], key=lambda command: -commandBytes(command[2]))
+    for rank, (cmdid, count, totals) in enumerate(ranked[:top]):
+        print("%-4d %-20s %7d %9.1f %8d" % (rank + 1, cmdid, count, commandBytes(totals) / 1024.0,
+                                           sum(totals[c][1] for c in categories)) +
+              "".join(" %9.1f KB" % (totals[category][0] / 1024.0) for category in categories) +
+              " %9.1f KB" % (totals["garbage"] / 1024.0) +
+              "".join(" %17.1f KB" % (size.get(cmdid, 0) / 1024.0) for size in sizes))
+
+# -----------------------------------------------------------------------------------------------
+
+if __name__ == '__main__':
+    main()